@@ -1,6 +1,7 @@
 from flask import Flask
 from config.settings import Config
-from app.routes import auth, admin, dashboard
+from app.routes import auth, admin, dashboard, api
+from app.cli import register_commands
 from dotenv import load_dotenv
 import os
 
@@ -21,6 +22,10 @@ def create_app():
     app.register_blueprint(auth.bp)
     app.register_blueprint(admin.bp)
     app.register_blueprint(dashboard.bp)
+    app.register_blueprint(api.bp)
+
+    # Register CLI commands
+    register_commands(app)
 
     return app
 
@@ -0,0 +1,84 @@
+import click
+import csv
+import os
+from flask.cli import AppGroup
+from app.models.timesheet import Timesheet
+from app.services.upload_queue import photo_upload_queue
+from app.services.user_import import UserImporter, REJECT_FIELDS
+
+timesheets_cli = AppGroup('timesheets', help='Timesheet maintenance commands.')
+photos_cli = AppGroup('photos', help='Profile photo maintenance commands.')
+users_cli = AppGroup('users', help='User account commands.')
+
+@timesheets_cli.command('rekey')
+@click.option('--dry-run', is_flag=True, help='Report what would change without writing.')
+def rekey_timesheets(dry_run):
+    """Re-key existing timesheets to deterministic (user_id, date) document IDs"""
+    stats = Timesheet.rekey_legacy_documents(dry_run=dry_run)
+
+    prefix = '[dry-run] ' if dry_run else ''
+    click.echo(f"{prefix}Scanned: {stats['scanned']}")
+    click.echo(f"{prefix}Moved: {stats['moved']}")
+    click.echo(f"{prefix}Already keyed: {stats['already_keyed']}")
+    click.echo(f"{prefix}Invalid documents: {stats['errors']}")
+    click.echo(f"{prefix}Conflicts: {len(stats['conflicts'])}")
+    for old_id, new_id in stats['conflicts']:
+        click.echo(f"  {old_id} -> {new_id} (target already exists)")
+
+@timesheets_cli.command('backfill-day-keys')
+@click.option('--dry-run', is_flag=True, help='Report what would change without writing.')
+def backfill_day_keys(dry_run):
+    """Add the integer day_key to timesheets stored before it existed"""
+    stats = Timesheet.backfill_day_keys(dry_run=dry_run)
+
+    prefix = '[dry-run] ' if dry_run else ''
+    click.echo(f"{prefix}Scanned: {stats['scanned']}")
+    click.echo(f"{prefix}Updated: {stats['updated']}")
+    click.echo(f"{prefix}Invalid documents: {stats['invalid']}")
+    if stats['failed']:
+        click.echo(f"Failed writes: {stats['failed']}")
+
+@timesheets_cli.command('rebuild-rollups')
+def rebuild_rollups():
+    """Recompute weekly and monthly rollup documents from all timesheets"""
+    written = Timesheet.rebuild_rollups()
+    click.echo(f"Rollup documents written: {written}")
+
+@photos_cli.command('drain')
+def drain_photo_queue():
+    """Upload every profile photo still waiting in the background queue"""
+    processed = photo_upload_queue.drain()
+    click.echo(f"Jobs processed: {processed}")
+
+@users_cli.command('import')
+@click.argument('csv_file', type=click.Path(exists=True, dir_okay=False))
+@click.option('--rejects', 'rejects_path', type=click.Path(dir_okay=False),
+              help='Where to write the rows that were not imported (default: <file>.rejects.csv). '
+                   'Passwords are left out of this file; add them back before importing it again.')
+def import_users(csv_file, rejects_path):
+    """Create users from a CSV file with email, name, user_type and password columns"""
+    rejects_path = rejects_path or f"{os.path.splitext(csv_file)[0]}.rejects.csv"
+
+    def progress(stats):
+        click.echo(f"Read: {stats['read']}  Created: {stats['created']}  Rejected: {stats['rejected']}")
+
+    with open(csv_file, newline='', encoding='utf-8-sig') as source, \
+            open(rejects_path, 'w', newline='', encoding='utf-8') as rejects_file:
+        writer = csv.DictWriter(rejects_file, fieldnames=REJECT_FIELDS)
+        writer.writeheader()
+        try:
+            stats = UserImporter(rejects=writer.writerow, progress=progress).run(source)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+
+    click.echo(f"Users created: {stats['created']}")
+    if stats['rejected']:
+        click.echo(f"Rows rejected: {stats['rejected']} (see {rejects_path})")
+    else:
+        os.remove(rejects_path)
+
+def register_commands(app):
+    """Attach the maintenance command groups to the Flask CLI"""
+    app.cli.add_command(timesheets_cli)
+    app.cli.add_command(photos_cli)
+    app.cli.add_command(users_cli)
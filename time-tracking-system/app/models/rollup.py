@@ -0,0 +1,178 @@
+from datetime import datetime, date, timedelta
+from app.storage import get_db, get_deadline
+from app.services.database import firebase_service
+from app.utils.helpers import as_date, to_day_key
+
+COLLECTION = 'timesheet_rollups'
+
+def _next_month(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+class TimesheetRollup:
+    """Pre-aggregated worked time per user-week and per user-month.
+
+    Rollup documents are never rewritten from scratch on the hot path: each
+    timesheet write sends Increment() deltas for the periods it touches, in the
+    same batch as the timesheet itself.
+    """
+
+    def __init__(self, user_id=None, period_type=None, period=None, total_minutes=0,
+                 days_worked=0, rollup_id=None):
+        self.user_id = user_id
+        self.period_type = period_type  # WEEK, MONTH
+        self.period = period  # e.g. 2025-W27, 2025-07
+        self.total_minutes = total_minutes or 0
+        self.days_worked = days_worked or 0
+        self.rollup_id = rollup_id
+
+    @property
+    def total_hours(self):
+        return self.total_minutes / 60
+
+    @staticmethod
+    def week_period(day):
+        iso_year, iso_week, _ = as_date(day).isocalendar()
+        return f"{iso_year}-W{iso_week:02d}"
+
+    @staticmethod
+    def month_period(day):
+        return as_date(day).strftime('%Y-%m')
+
+    @staticmethod
+    def period_bounds(period_type, period):
+        """First and last day of a period as (start_day_key, end_day_key)"""
+        if period_type == 'WEEK':
+            year, week = period.split('-W')
+            start = date.fromisocalendar(int(year), int(week), 1)
+            end = start + timedelta(days=6)
+        else:
+            start = datetime.strptime(period, '%Y-%m').date()
+            end = _next_month(start) - timedelta(days=1)
+        return to_day_key(start), to_day_key(end)
+
+    def _document(self, total_minutes, days_worked):
+        start_day_key, end_day_key = self.period_bounds(self.period_type, self.period)
+        return {
+            'user_id': self.user_id,
+            'period_type': self.period_type,
+            'period': self.period,
+            'start_day_key': start_day_key,
+            'end_day_key': end_day_key,
+            'total_minutes': total_minutes,
+            'days_worked': days_worked,
+            'updated_at': datetime.utcnow()
+        }
+
+    @classmethod
+    def periods_for(cls, user_id, day):
+        """Return (rollup_id, period_type, period) for every rollup a day belongs to"""
+        week = cls.week_period(day)
+        month = cls.month_period(day)
+        return [
+            (f"{user_id}_W{week}", 'WEEK', week),
+            (f"{user_id}_M{month}", 'MONTH', month),
+        ]
+
+    @classmethod
+    def contribution_deltas(cls, user_id, old_day, old_minutes, new_day, new_minutes):
+        """Compute the per-rollup (minutes, days) deltas for a timesheet change.
+
+        ``old_*`` describe what is currently counted in the rollups (``old_day`` is
+        None for a timesheet that was never stored), ``new_*`` what should be.
+        """
+        deltas = {}
+
+        def add(day, minutes, sign):
+            if day is None or not minutes:
+                return
+            for rollup_id, period_type, period in cls.periods_for(user_id, day):
+                entry = deltas.setdefault(rollup_id, [period_type, period, 0, 0])
+                entry[2] += sign * minutes
+                entry[3] += sign
+
+        add(old_day, old_minutes, -1)
+        add(new_day, new_minutes, 1)
+
+        return {
+            rollup_id: (period_type, period, minutes, days)
+            for rollup_id, (period_type, period, minutes, days) in deltas.items()
+            if minutes or days
+        }
+
+    @classmethod
+    def increment_documents(cls, db, user_id, deltas):
+        """Yield (rollup_id, document) pairs that add the deltas when written with merge"""
+        for rollup_id, (period_type, period, minutes, days) in deltas.items():
+            rollup = cls(user_id=user_id, period_type=period_type, period=period)
+            yield rollup_id, rollup._document(db.increment(minutes), db.increment(days))
+
+    @classmethod
+    def apply_deltas(cls, db, batch, user_id, deltas):
+        """Add increment writes for the given deltas to a write batch"""
+        rollups_ref = db.collection(COLLECTION)
+        for rollup_id, document in cls.increment_documents(db, user_id, deltas):
+            batch.set(rollups_ref.document(rollup_id), document, merge=True)
+
+    @classmethod
+    def from_dict(cls, data, rollup_id=None):
+        """Create rollup object from Firestore document"""
+        return cls(
+            user_id=data.get('user_id'),
+            period_type=data.get('period_type'),
+            period=data.get('period'),
+            total_minutes=data.get('total_minutes', 0),
+            days_worked=data.get('days_worked', 0),
+            rollup_id=rollup_id
+        )
+
+    @classmethod
+    def _get(cls, user_id, day, period_type):
+        rollup_id, _, period = next(
+            entry for entry in cls.periods_for(user_id, day) if entry[1] == period_type
+        )
+        try:
+            db = get_db()
+            doc = db.collection(COLLECTION).document(rollup_id).get(timeout=get_deadline())
+            if doc.exists:
+                return cls.from_dict(doc.to_dict(), doc.id)
+        except Exception as e:
+            print(f"Error getting timesheet rollup: {e}")
+        return cls(user_id=user_id, period_type=period_type, period=period, rollup_id=rollup_id)
+
+    @classmethod
+    def get_week(cls, user_id, day):
+        """Get the rollup for the ISO week containing day (zeros if none yet)"""
+        return cls._get(user_id, day, 'WEEK')
+
+    @classmethod
+    def get_month(cls, user_id, day):
+        """Get the rollup for the calendar month containing day (zeros if none yet)"""
+        return cls._get(user_id, day, 'MONTH')
+
+    @classmethod
+    def rebuild_all(cls, timesheets):
+        """Recompute every rollup from scratch from an iterable of timesheets.
+
+        Used to backfill rollups for data written before they existed.
+        Returns the number of rollup documents written.
+        """
+        totals = {}
+        for timesheet in timesheets:
+            minutes = timesheet.total_minutes()
+            if not minutes or not timesheet.user_id:
+                continue
+            for rollup_id, period_type, period in cls.periods_for(timesheet.user_id, timesheet.date):
+                entry = totals.setdefault(rollup_id, [timesheet.user_id, period_type, period, 0, 0])
+                entry[3] += minutes
+                entry[4] += 1
+
+        def operations():
+            for rollup_id, (user_id, period_type, period, minutes, days) in totals.items():
+                rollup = cls(user_id=user_id, period_type=period_type, period=period)
+                yield 'set', COLLECTION, rollup_id, rollup._document(minutes, days)
+
+        results = firebase_service.bulk_write(operations())
+        return sum(1 for result in results if result['success'])
+
+    def __repr__(self):
+        return f'<TimesheetRollup {self.user_id} - {self.period}>'
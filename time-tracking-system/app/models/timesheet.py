@@ -1,14 +1,80 @@
-from firebase_admin import firestore
-from datetime import datetime, timedelta
-from app.models.user import initialize_firebase
+from google.api_core.exceptions import AlreadyExists
+from datetime import datetime, timedelta, date as date_type, time as time_type
+from app.storage import get_db, get_deadline, iter_query, IN_QUERY_LIMIT
+from app.models.rollup import TimesheetRollup, COLLECTION as ROLLUP_COLLECTION
+from app.services.database import firebase_service
+from app.services.metrics import metrics
+from app.utils.helpers import as_date, to_day_key, from_day_key, chunked
+from config.settings import Config
 from typing import Optional, List, Dict, Any
 
+# Times of day are held as integer minutes (0-1439). Every HH:MM string and
+# datetime.time value is precomputed once, so parsing and formatting a
+# timesheet is a dict/tuple lookup instead of strptime/strftime.
+HHMM = tuple(f'{minute // 60:02d}:{minute % 60:02d}' for minute in range(1440))
+TIMES = tuple(time_type(minute // 60, minute % 60) for minute in range(1440))
+_HHMM_TO_MINUTE = {text: minute for minute, text in enumerate(HHMM)}
+
+def to_minute(value):
+    """Minute of day for an 'HH:MM' string, a time/datetime or an int (None stays None)"""
+    minute = _HHMM_TO_MINUTE.get(value)
+    if minute is not None or value is None or value == '':
+        return minute
+    if isinstance(value, int):
+        if not 0 <= value < 1440:
+            raise ValueError(f"Minute of day out of range: {value}")
+        return value
+    if isinstance(value, str):
+        parsed = datetime.strptime(value, '%H:%M')  # e.g. '8:05'
+        return parsed.hour * 60 + parsed.minute
+    return value.hour * 60 + value.minute
+
+class _TimeOfDay:
+    """Exposes an integer minute-of-day slot as a datetime.time attribute"""
+
+    def __init__(self, slot):
+        self.slot = slot
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        minute = getattr(obj, self.slot)
+        return TIMES[minute] if minute is not None else None
+
+    def __set__(self, obj, value):
+        setattr(obj, self.slot, to_minute(value))
+
 class Timesheet:
+    __slots__ = ('user_id', 'date', 'entry_minute', 'lunch_start_minute', 'lunch_end_minute',
+                 'exit_minute', 'total_hours', 'status', 'created_at', 'updated_at',
+                 'timesheet_id', '_stored_date', '_stored_minutes', '_persisted')
+
+    # Persisted slots and the document fields each one is written to
+    FIELDS = (
+        ('user_id', ('user_id',)),
+        ('date', ('date', 'day_key')),
+        ('entry_minute', ('entry_time',)),
+        ('lunch_start_minute', ('lunch_start',)),
+        ('lunch_end_minute', ('lunch_end',)),
+        ('exit_minute', ('exit_time',)),
+        ('total_hours', ('total_hours',)),
+        ('status', ('status',)),
+        ('created_at', ('created_at',)),
+    )
+
+    # datetime.time views of the minute slots (assigning accepts time, 'HH:MM' or minutes)
+    entry_time = _TimeOfDay('entry_minute')
+    lunch_start = _TimeOfDay('lunch_start_minute')
+    lunch_end = _TimeOfDay('lunch_end_minute')
+    exit_time = _TimeOfDay('exit_minute')
+
+    PUNCH_ACTIONS = ('entry', 'lunch_start', 'lunch_end', 'exit')
+
     def __init__(self, user_id=None, date=None, entry_time=None, lunch_start=None, 
                  lunch_end=None, exit_time=None, total_hours=None, status='EM_ANDAMENTO',
                  created_at=None, timesheet_id=None):
         self.user_id = user_id
-        self.date = date or datetime.now().date()
+        self.date = as_date(date) or datetime.now().date()
         self.entry_time = entry_time
         self.lunch_start = lunch_start
         self.lunch_end = lunch_end
@@ -18,27 +84,37 @@ class Timesheet:
         self.created_at = created_at or datetime.utcnow()
         self.updated_at = datetime.utcnow()
         self.timesheet_id = timesheet_id
+        # What this timesheet currently contributes to the stored rollups
+        self._stored_date = None
+        self._stored_minutes = 0
+        # Slot values as last read from or written to storage (None: not stored yet)
+        self._persisted = None
 
-    def calculate_total_hours(self):
-        """Calculate total working hours excluding lunch break"""
-        if not self.entry_time or not self.exit_time:
-            return 0
-        
-        # Convert times to datetime for calculation
-        entry = datetime.combine(self.date, self.entry_time)
-        exit = datetime.combine(self.date, self.exit_time)
+    @property
+    def day_key(self):
+        """Integer YYYYMMDD key of the date, used for storage range queries"""
+        return to_day_key(self.date)
+
+    def worked_minutes(self):
+        """Minutes between entry and exit, excluding lunch (None until both are set)"""
+        if self.entry_minute is None or self.exit_minute is None:
+            return None
         
-        total_time = exit - entry
+        minutes = self.exit_minute - self.entry_minute
         
         # Subtract lunch break if both times are recorded
-        if self.lunch_start and self.lunch_end:
-            lunch_start = datetime.combine(self.date, self.lunch_start)
-            lunch_end = datetime.combine(self.date, self.lunch_end)
-            lunch_duration = lunch_end - lunch_start
-            total_time -= lunch_duration
+        if self.lunch_start_minute is not None and self.lunch_end_minute is not None:
+            minutes -= self.lunch_end_minute - self.lunch_start_minute
+        return minutes
+
+    def calculate_total_hours(self):
+        """Calculate total working hours excluding lunch break"""
+        minutes = self.worked_minutes()
+        if minutes is None:
+            return 0
         
         # Convert to hours (float)
-        self.total_hours = total_time.total_seconds() / 3600
+        self.total_hours = minutes / 60
         return self.total_hours
 
     def calculate_overtime(self, expected_hours=8):
@@ -50,19 +126,58 @@ class Timesheet:
             return self.total_hours - expected_hours
         return 0
 
+    def total_minutes(self):
+        """Worked time in whole minutes, as counted in the rollups"""
+        return int(round((self.total_hours or 0) * 60))
+
+    @staticmethod
+    def make_id(user_id, date):
+        """Build the deterministic document ID for a user's timesheet on a given day"""
+        if isinstance(date, datetime):
+            date = date.date()
+        return f"{user_id}_{date.isoformat()}"
+
+    @staticmethod
+    def keyed_ids_enabled():
+        """Whether timesheets are stored under deterministic (user_id, date) IDs"""
+        return Config.TIMESHEET_KEYED_IDS
+
     def is_complete(self):
         """Check if timesheet has all required entries"""
-        return all([self.entry_time, self.exit_time])
+        return self.entry_minute is not None and self.exit_minute is not None
+
+    def _snapshot(self):
+        return tuple(getattr(self, slot) for slot, _ in self.FIELDS)
+
+    def changed_fields(self):
+        """Document fields that differ from the stored document (all of them if not stored)"""
+        data = self.to_dict()
+        if self._persisted is None:
+            return data
+        
+        changed = {}
+        for (slot, keys), stored in zip(self.FIELDS, self._persisted):
+            if getattr(self, slot) != stored:
+                for key in keys:
+                    changed[key] = data[key]
+        return changed
+
+    def _mark_saved(self):
+        self._stored_date = self.date
+        self._stored_minutes = self.total_minutes()
+        self._persisted = self._snapshot()
 
     def to_dict(self):
         """Convert timesheet object to dictionary for Firestore"""
         return {
             'user_id': self.user_id,
-            'date': self.date,
-            'entry_time': self.entry_time.strftime('%H:%M') if self.entry_time else None,
-            'lunch_start': self.lunch_start.strftime('%H:%M') if self.lunch_start else None,
-            'lunch_end': self.lunch_end.strftime('%H:%M') if self.lunch_end else None,
-            'exit_time': self.exit_time.strftime('%H:%M') if self.exit_time else None,
+            # Firestore only stores full timestamps; day_key is what queries use
+            'date': datetime.combine(self.date, time_type.min),
+            'day_key': self.day_key,
+            'entry_time': HHMM[self.entry_minute] if self.entry_minute is not None else None,
+            'lunch_start': HHMM[self.lunch_start_minute] if self.lunch_start_minute is not None else None,
+            'lunch_end': HHMM[self.lunch_end_minute] if self.lunch_end_minute is not None else None,
+            'exit_time': HHMM[self.exit_minute] if self.exit_minute is not None else None,
             'total_hours': self.total_hours,
             'status': self.status,
             'created_at': self.created_at,
@@ -72,56 +187,177 @@ class Timesheet:
     @classmethod
     def from_dict(cls, data, timesheet_id=None):
         """Create timesheet object from Firestore document"""
-        def parse_time(time_str):
-            if time_str:
-                return datetime.strptime(time_str, '%H:%M').time()
-            return None
-        
-        return cls(
-            user_id=data.get('user_id'),
-            date=data.get('date'),
-            entry_time=parse_time(data.get('entry_time')),
-            lunch_start=parse_time(data.get('lunch_start')),
-            lunch_end=parse_time(data.get('lunch_end')),
-            exit_time=parse_time(data.get('exit_time')),
-            total_hours=data.get('total_hours'),
-            status=data.get('status', 'EM_ANDAMENTO'),
-            created_at=data.get('created_at'),
-            timesheet_id=timesheet_id
-        )
+        # Filled slot by slot: no __init__ defaults, no strptime
+        timesheet = cls.__new__(cls)
+        timesheet.user_id = data.get('user_id')
+        day_key = data.get('day_key')
+        timesheet.date = from_day_key(day_key) if day_key else as_date(data.get('date'))
+        timesheet.entry_minute = to_minute(data.get('entry_time'))
+        timesheet.lunch_start_minute = to_minute(data.get('lunch_start'))
+        timesheet.lunch_end_minute = to_minute(data.get('lunch_end'))
+        timesheet.exit_minute = to_minute(data.get('exit_time'))
+        timesheet.total_hours = data.get('total_hours')
+        timesheet.status = data.get('status', 'EM_ANDAMENTO')
+        timesheet.created_at = data.get('created_at') or datetime.utcnow()
+        timesheet.updated_at = data.get('updated_at') or timesheet.created_at
+        timesheet.timesheet_id = timesheet_id
+        timesheet._mark_saved()
+        return timesheet
 
     def save(self):
-        """Save timesheet to Firestore"""
+        """Save timesheet to Firestore, keeping the weekly/monthly rollups in step.
+
+        A stored timesheet only sends the fields that changed, with update().
+        """
         try:
-            initialize_firebase()
-            db = firestore.client()
+            db = get_db()
             timesheets_ref = db.collection('timesheets')
             
+            changes = self.changed_fields()
+            if not changes:
+                return True
+            
             self.updated_at = datetime.utcnow()
+            changes['updated_at'] = self.updated_at
             
-            if self.timesheet_id:
-                # Update existing timesheet
-                timesheets_ref.document(self.timesheet_id).set(self.to_dict())
-            else:
+            if not self.timesheet_id:
                 # Create new timesheet
-                doc_ref = timesheets_ref.add(self.to_dict())
-                self.timesheet_id = doc_ref[1].id
+                if self.keyed_ids_enabled():
+                    self.timesheet_id = self.make_id(self.user_id, self.date)
+                else:
+                    self.timesheet_id = timesheets_ref.document().id
+            
+            doc_ref = timesheets_ref.document(self.timesheet_id)
+            deltas = TimesheetRollup.contribution_deltas(
+                self.user_id, self._stored_date, self._stored_minutes, self.date, self.total_minutes()
+            )
+            
+            # Timesheet and rollup increments commit atomically
+            batch = db.batch()
+            if self._persisted is None:
+                batch.set(doc_ref, changes)
+            else:
+                batch.update(doc_ref, changes)
+            if deltas:
+                TimesheetRollup.apply_deltas(db, batch, self.user_id, deltas)
+            batch.commit(timeout=get_deadline())
             
+            self._mark_saved()
             return True
         except Exception as e:
             print(f"Error saving timesheet: {e}")
             return False
 
+    @classmethod
+    def save_many(cls, timesheets):
+        """Save many timesheets with bulk writes; returns one result per timesheet.
+
+        As in save(), stored timesheets only send their changed fields. The
+        rollup increments of the timesheets that were written follow in a
+        second pass, summed per rollup document. A failed increment is logged,
+        counted in the metrics and noted as 'rollup_error' on the results of
+        that user's timesheets; `flask timesheets rebuild-rollups` restores
+        the rollups.
+        """
+        timesheets = list(timesheets)
+        results = [None] * len(timesheets)
+        deltas = {}
+        written = []
+        try:
+            timesheets_ref = get_db().collection('timesheets')
+            now = datetime.utcnow()
+            operations = []
+            positions = []
+            for position, timesheet in enumerate(timesheets):
+                changes = timesheet.changed_fields()
+                if not changes:
+                    results[position] = {'id': timesheet.timesheet_id, 'success': True, 'error': None}
+                    continue
+                
+                if not timesheet.timesheet_id:
+                    if cls.keyed_ids_enabled():
+                        timesheet.timesheet_id = cls.make_id(timesheet.user_id, timesheet.date)
+                    else:
+                        timesheet.timesheet_id = timesheets_ref.document().id
+                changes['updated_at'] = now
+                kind = 'set' if timesheet._persisted is None else 'update'
+                operations.append((kind, 'timesheets', timesheet.timesheet_id, changes))
+                positions.append(position)
+            
+            for position, result in zip(positions, firebase_service.bulk_write(operations)):
+                results[position] = result
+                if not result['success']:
+                    continue
+                
+                timesheet = timesheets[position]
+                timesheet.updated_at = now
+                changed = TimesheetRollup.contribution_deltas(
+                    timesheet.user_id, timesheet._stored_date, timesheet._stored_minutes,
+                    timesheet.date, timesheet.total_minutes()
+                )
+                user_deltas = deltas.setdefault(timesheet.user_id, {})
+                for rollup_id, (period_type, period, minutes, days) in changed.items():
+                    _, _, total_minutes, total_days = user_deltas.get(rollup_id, (period_type, period, 0, 0))
+                    user_deltas[rollup_id] = (period_type, period, total_minutes + minutes, total_days + days)
+                timesheet._mark_saved()
+                written.append(position)
+        except Exception as e:
+            print(f"Error saving timesheets: {e}")
+        
+        # These timesheets are written, so a failed increment does not fail
+        # them (saving again would not resend it); the rollups of those users
+        # are stale until `flask timesheets rebuild-rollups` is run.
+        stale_users = set()
+        try:
+            db = get_db()
+            rollup_users = []
+            operations = []
+            for user_id, user_deltas in deltas.items():
+                for rollup_id, document in TimesheetRollup.increment_documents(db, user_id, user_deltas):
+                    rollup_users.append(user_id)
+                    operations.append(('merge', ROLLUP_COLLECTION, rollup_id, document))
+            outcomes = firebase_service.bulk_write(operations)
+            if len(outcomes) != len(operations):
+                stale_users.update(rollup_users)  # bulk_write failed as a whole
+            for user_id, outcome in zip(rollup_users, outcomes):
+                if not outcome['success']:
+                    stale_users.add(user_id)
+        except Exception as e:
+            print(f"Error updating timesheet rollups: {e}")
+            stale_users.update(deltas)
+        
+        if stale_users:
+            metrics.increment('timesheets.rollup_failures', len(stale_users))
+            print(f"Rollups not updated for {len(stale_users)} users, run `flask timesheets rebuild-rollups`: "
+                  f"{', '.join(sorted(str(user_id) for user_id in stale_users))}")
+            for position in written:
+                if timesheets[position].user_id in stale_users:
+                    results[position]['rollup_error'] = 'rollup not updated'
+        
+        return [
+            result or {'id': timesheet.timesheet_id, 'success': False, 'error': 'not written'}
+            for timesheet, result in zip(timesheets, results)
+        ]
+
     @classmethod
     def get_by_user_and_date(cls, user_id, date):
         """Get timesheet by user ID and date"""
         try:
-            initialize_firebase()
-            db = firestore.client()
+            db = get_db()
             timesheets_ref = db.collection('timesheets')
             
-            query = timesheets_ref.where('user_id', '==', user_id).where('date', '==', date).limit(1)
-            docs = query.stream()
+            if cls.keyed_ids_enabled():
+                # Point read on the deterministic document ID
+                doc = timesheets_ref.document(cls.make_id(user_id, date)).get(timeout=get_deadline())
+                if doc.exists:
+                    return cls.from_dict(doc.to_dict(), doc.id)
+                return None
+            
+            query = (timesheets_ref
+                    .where('user_id', '==', user_id)
+                    .where('day_key', '==', to_day_key(date))
+                    .limit(1))
+            docs = query.stream(timeout=get_deadline())
             
             for doc in docs:
                 return cls.from_dict(doc.to_dict(), doc.id)
@@ -135,18 +371,17 @@ class Timesheet:
     def get_by_user_date_range(cls, user_id, start_date, end_date):
         """Get timesheets by user ID within date range"""
         try:
-            initialize_firebase()
-            db = firestore.client()
+            db = get_db()
             timesheets_ref = db.collection('timesheets')
             
             query = (timesheets_ref
                     .where('user_id', '==', user_id)
-                    .where('date', '>=', start_date)
-                    .where('date', '<=', end_date)
-                    .order_by('date'))
+                    .where('day_key', '>=', to_day_key(start_date))
+                    .where('day_key', '<=', to_day_key(end_date))
+                    .order_by('day_key'))
             
             timesheets = []
-            docs = query.stream()
+            docs = query.stream(timeout=get_deadline())
             
             for doc in docs:
                 timesheets.append(cls.from_dict(doc.to_dict(), doc.id))
@@ -156,26 +391,29 @@ class Timesheet:
             print(f"Error getting timesheets by date range: {e}")
             return []
 
+    @classmethod
+    def iter_all_by_date_range(cls, start_date, end_date, page_size=None):
+        """Stream all timesheets within date range page by page (admin use).
+
+        Storage errors are raised, also after the first page: a stream that
+        ended early must not pass for a complete one.
+        """
+        db = get_db()
+        timesheets_ref = db.collection('timesheets')
+        
+        query = (timesheets_ref
+                .where('day_key', '>=', to_day_key(start_date))
+                .where('day_key', '<=', to_day_key(end_date))
+                .order_by('day_key'))
+        
+        for doc in iter_query(query, page_size):
+            yield cls.from_dict(doc.to_dict(), doc.id)
+
     @classmethod
     def get_all_by_date_range(cls, start_date, end_date):
         """Get all timesheets within date range (admin use)"""
         try:
-            initialize_firebase()
-            db = firestore.client()
-            timesheets_ref = db.collection('timesheets')
-            
-            query = (timesheets_ref
-                    .where('date', '>=', start_date)
-                    .where('date', '<=', end_date)
-                    .order_by('date'))
-            
-            timesheets = []
-            docs = query.stream()
-            
-            for doc in docs:
-                timesheets.append(cls.from_dict(doc.to_dict(), doc.id))
-            
-            return timesheets
+            return list(cls.iter_all_by_date_range(start_date, end_date))
         except Exception as e:
             print(f"Error getting all timesheets by date range: {e}")
             return []
@@ -184,10 +422,9 @@ class Timesheet:
     def get_by_id(cls, timesheet_id):
         """Get timesheet by ID"""
         try:
-            initialize_firebase()
-            db = firestore.client()
+            db = get_db()
             
-            doc = db.collection('timesheets').document(timesheet_id).get()
+            doc = db.collection('timesheets').document(timesheet_id).get(timeout=get_deadline())
             if doc.exists:
                 return cls.from_dict(doc.to_dict(), doc.id)
             
@@ -202,43 +439,292 @@ class Timesheet:
             if not self.timesheet_id:
                 return False
                 
-            initialize_firebase()
-            db = firestore.client()
-            db.collection('timesheets').document(self.timesheet_id).delete()
+            db = get_db()
+            doc_ref = db.collection('timesheets').document(self.timesheet_id)
+            deltas = TimesheetRollup.contribution_deltas(
+                self.user_id, self._stored_date, self._stored_minutes, None, 0
+            )
+            
+            if deltas:
+                batch = db.batch()
+                batch.delete(doc_ref)
+                TimesheetRollup.apply_deltas(db, batch, self.user_id, deltas)
+                batch.commit(timeout=get_deadline())
+            else:
+                doc_ref.delete(timeout=get_deadline())
+            
+            self._stored_date = None
+            self._stored_minutes = 0
+            self._persisted = None
             return True
         except Exception as e:
             print(f"Error deleting timesheet: {e}")
             return False
 
+    @classmethod
+    def rekey_legacy_documents(cls, dry_run=False):
+        """Move timesheets stored under auto-generated IDs to their (user_id, date) IDs.
+
+        Documents whose keyed ID is already taken are left in place and reported
+        as conflicts so they can be reconciled by hand.
+        """
+        stats = {'scanned': 0, 'moved': 0, 'already_keyed': 0, 'conflicts': [], 'errors': 0}
+        
+        db = get_db()
+        timesheets_ref = db.collection('timesheets')
+        
+        for doc in iter_query(timesheets_ref.order_by('__name__')):
+            stats['scanned'] += 1
+            data = doc.to_dict()
+            day = as_date(data.get('date'))
+            if not data.get('user_id') or not isinstance(day, date_type):
+                stats['errors'] += 1
+                continue
+            
+            new_id = cls.make_id(data['user_id'], day)
+            if doc.id == new_id:
+                stats['already_keyed'] += 1
+                continue
+            
+            target_ref = timesheets_ref.document(new_id)
+            if target_ref.get(timeout=get_deadline()).exists:
+                stats['conflicts'].append((doc.id, new_id))
+                continue
+            
+            if not dry_run:
+                # Copy and delete in one batch so a document is never lost or duplicated
+                batch = db.batch()
+                batch.set(target_ref, data)
+                batch.delete(doc.reference)
+                batch.commit(timeout=get_deadline())
+            stats['moved'] += 1
+        
+        return stats
+
+    @classmethod
+    def backfill_day_keys(cls, dry_run=False):
+        """Add day_key to timesheets written before it existed and store date as a timestamp"""
+        stats = {'scanned': 0, 'updated': 0, 'invalid': 0, 'failed': 0}
+        
+        def operations():
+            db = get_db()
+            for doc in iter_query(db.collection('timesheets').order_by('__name__')):
+                stats['scanned'] += 1
+                data = doc.to_dict()
+                day = as_date(data.get('date'))
+                if not isinstance(day, date_type):
+                    stats['invalid'] += 1
+                    continue
+                
+                changes = {}
+                if data.get('day_key') != to_day_key(day):
+                    changes['day_key'] = to_day_key(day)
+                if not isinstance(data.get('date'), datetime):
+                    changes['date'] = datetime.combine(day, time_type.min)
+                if changes:
+                    yield 'update', 'timesheets', doc.id, changes
+        
+        if dry_run:
+            stats['updated'] = sum(1 for _ in operations())
+            return stats
+        
+        for result in firebase_service.bulk_write(operations()):
+            stats['updated' if result['success'] else 'failed'] += 1
+        return stats
+
+    @classmethod
+    def rebuild_rollups(cls):
+        """Recompute all weekly/monthly rollups from the stored timesheets"""
+        db = get_db()
+        docs = iter_query(db.collection('timesheets').order_by('__name__'))
+        return TimesheetRollup.rebuild_all(cls.from_dict(doc.to_dict(), doc.id) for doc in docs)
+
+    def apply_punch(self, action, moment):
+        """Set the time for a clock action if it is still open; returns True if applied.
+
+        Repeating an action is a no-op, which makes punches idempotent.
+        """
+        if action == 'entry':
+            if self.entry_minute is not None:
+                return False
+            self.entry_time = moment
+        elif action == 'lunch_start':
+            if self.lunch_start_minute is not None:
+                return False
+            self.lunch_start = moment
+        elif action == 'lunch_end':
+            if self.lunch_end_minute is not None or self.lunch_start_minute is None:
+                return False
+            self.lunch_end = moment
+        elif action == 'exit':
+            if self.exit_minute is not None:
+                return False
+            self.exit_time = moment
+            self.calculate_total_hours()
+            if self.status != 'AJUSTE_PENDENTE':
+                self.status = 'FINALIZADO'
+        else:
+            raise ValueError(f"Invalid clock action: {action}")
+        return True
+
+    @classmethod
+    def punch(cls, user_id, date, action, moment=None, user_email=None, entry_id=None,
+              device_time=None, needs_review=False):
+        """Apply a clock action atomically; returns (timesheet, applied).
+
+        The read-modify-write of the day's timesheet, its rollup increments and
+        (when user_email is given) the TimeEntry log record commit together in
+        one transaction, so concurrent punches cannot overwrite each other.
+        With keyed IDs the first entry of the day is a single create() instead.
+        A given entry_id is created, never overwritten, so replaying a punch
+        with the same ID fails instead of counting twice.
+        device_time and needs_review go on the TimeEntry; with needs_review
+        the day is also set to AJUSTE_PENDENTE.
+        Returns (None, False) on error.
+        """
+        if action not in cls.PUNCH_ACTIONS:
+            raise ValueError(f"Invalid clock action: {action}")
+        moment = moment or datetime.now()
+        date = as_date(date)
+        try:
+            db = get_db()
+            timesheets_ref = db.collection('timesheets')
+            entries_ref = db.collection(TimeEntry.COLLECTION)
+            keyed = cls.keyed_ids_enabled()
+
+            def log_entry(writer):
+                if user_email:
+                    entry = TimeEntry(user_email=user_email, entry_type=action,
+                                      timestamp=datetime.combine(date, moment.time()), user_id=user_id,
+                                      device_time=device_time, needs_review=needs_review)
+                    writer.create(entries_ref.document(entry_id), entry.to_dict())
+
+            def apply_to(timesheet):
+                if not timesheet.apply_punch(action, moment):
+                    return False
+                if needs_review:
+                    timesheet.status = 'AJUSTE_PENDENTE'
+                return True
+
+            if keyed and action == 'entry':
+                # Surge path: nobody has punched today, so there is nothing to read
+                timesheet = cls(user_id=user_id, date=date, timesheet_id=cls.make_id(user_id, date))
+                apply_to(timesheet)
+                batch = db.batch()
+                batch.create(timesheets_ref.document(timesheet.timesheet_id), timesheet.to_dict())
+                log_entry(batch)
+                try:
+                    batch.commit(timeout=get_deadline())
+                    timesheet._mark_saved()
+                    return timesheet, True
+                except AlreadyExists:
+                    pass  # the day already exists; apply the punch to it below
+
+            def apply(transaction):
+                timesheet, doc_ref, exists = cls._read_day(db, transaction, user_id, date, keyed)
+                if not apply_to(timesheet):
+                    return timesheet, False
+
+                cls._write_day(db, transaction, timesheet, doc_ref, exists)
+                log_entry(transaction)
+                timesheet._mark_saved()
+                return timesheet, True
+
+            return db.run_transaction(apply)
+        except Exception as e:
+            print(f"Error registering punch: {e}")
+            return None, False
+
+    @classmethod
+    def _read_day(cls, db, transaction, user_id, date, keyed):
+        """Read a day's timesheet in a transaction; returns (timesheet, doc_ref, exists)"""
+        timesheets_ref = db.collection('timesheets')
+        if keyed:
+            doc_ref = timesheets_ref.document(cls.make_id(user_id, date))
+            snapshot = doc_ref.get(transaction=transaction)
+            docs = [snapshot] if snapshot.exists else []
+        else:
+            query = (timesheets_ref
+                    .where('user_id', '==', user_id)
+                    .where('day_key', '==', to_day_key(date))
+                    .limit(1))
+            docs = list(query.stream(transaction=transaction))
+            doc_ref = docs[0].reference if docs else timesheets_ref.document()
+
+        if docs:
+            return cls.from_dict(docs[0].to_dict(), docs[0].id), doc_ref, True
+        return cls(user_id=user_id, date=date, timesheet_id=doc_ref.id), doc_ref, False
+
+    @classmethod
+    def _write_day(cls, db, transaction, timesheet, doc_ref, exists):
+        """Add the writes for a day read with _read_day, with its rollup increments"""
+        timesheet.updated_at = datetime.utcnow()
+        deltas = TimesheetRollup.contribution_deltas(
+            timesheet.user_id, timesheet._stored_date, timesheet._stored_minutes,
+            timesheet.date, timesheet.total_minutes()
+        )
+        if exists:
+            # Only the punched fields (plus total/status on exit) go over the wire
+            changes = timesheet.changed_fields()
+            changes['updated_at'] = timesheet.updated_at
+            transaction.update(doc_ref, changes)
+        else:
+            transaction.set(doc_ref, timesheet.to_dict())
+        TimesheetRollup.apply_deltas(db, transaction, timesheet.user_id, deltas)
+
+    @classmethod
+    def punch_many(cls, user_id, date, punches, user_email, ignored_collection=None):
+        """Apply several clock actions to one day in one transaction.
+
+        punches are (action, moment, entry_id) tuples, applied in the given
+        order. The day's timesheet, its rollup increments and a TimeEntry for
+        every applied punch commit together; punches that changed nothing are
+        written to ignored_collection instead, when one is given, so they stay
+        out of the reports. Entry IDs are created, never overwritten.
+        Returns (timesheet, [applied, ...]), or (None, None) on error.
+        """
+        date = as_date(date)
+        try:
+            db = get_db()
+            entries_ref = db.collection(TimeEntry.COLLECTION)
+            keyed = cls.keyed_ids_enabled()
+
+            def apply(transaction):
+                timesheet, doc_ref, exists = cls._read_day(db, transaction, user_id, date, keyed)
+                applied = [timesheet.apply_punch(action, moment) for action, moment, _ in punches]
+                if any(applied):
+                    cls._write_day(db, transaction, timesheet, doc_ref, exists)
+
+                for (action, moment, entry_id), done in zip(punches, applied):
+                    entry = TimeEntry(user_email=user_email, entry_type=action,
+                                      timestamp=datetime.combine(date, moment.time()), user_id=user_id)
+                    if done:
+                        transaction.create(entries_ref.document(entry_id), entry.to_dict())
+                    elif ignored_collection:
+                        transaction.create(db.collection(ignored_collection).document(entry_id), entry.to_dict())
+                timesheet._mark_saved()
+                return timesheet, applied
+
+            return db.run_transaction(apply)
+        except Exception as e:
+            print(f"Error registering punches: {e}")
+            return None, None
+
     def register_entry(self):
         """Register entry time"""
-        if not self.entry_time:
-            self.entry_time = datetime.now().time()
-            return self.save()
-        return False
+        return self.apply_punch('entry', datetime.now()) and self.save()
 
     def register_lunch_start(self):
         """Register lunch start time"""
-        if not self.lunch_start:
-            self.lunch_start = datetime.now().time()
-            return self.save()
-        return False
+        return self.apply_punch('lunch_start', datetime.now()) and self.save()
 
     def register_lunch_end(self):
         """Register lunch end time"""
-        if not self.lunch_end and self.lunch_start:
-            self.lunch_end = datetime.now().time()
-            return self.save()
-        return False
+        return self.apply_punch('lunch_end', datetime.now()) and self.save()
 
     def register_exit(self):
         """Register exit time and calculate total hours"""
-        if not self.exit_time:
-            self.exit_time = datetime.now().time()
-            self.calculate_total_hours()
-            self.status = 'FINALIZADO'
-            return self.save()
-        return False
+        return self.apply_punch('exit', datetime.now()) and self.save()
 
     def get_status_display(self):
         """Get user-friendly status display"""
@@ -250,4 +736,297 @@ class Timesheet:
         return status_map.get(self.status, self.status)
 
     def __repr__(self):
-        return f'<Timesheet {self.user_id} - {self.date}>'
\ No newline at end of file
+        return f'<Timesheet {self.user_id} - {self.date}>'
+
+class TimeEntry:
+    """A single clock punch, stored as an immutable, append-only event.
+
+    Entries are never updated: a correction is a new entry. Timestamps are
+    local wall-clock times, like the HH:MM values on Timesheet. Punches synced
+    from the browser also keep the device clock's time in device_time, and
+    needs_review marks the ones recorded at that time instead of the server's.
+    Instances use __slots__ so a month of punches for every user stays cheap
+    to hold.
+    """
+    __slots__ = ('entry_id', 'user_id', 'user_email', 'entry_type', 'timestamp', 'notes',
+                 'device_time', 'needs_review')
+
+    ENTRY_TYPES = ('entry', 'lunch_start', 'lunch_end', 'exit')
+    COLLECTION = 'time_entries'
+
+    def __init__(self, user_email=None, entry_type=None, timestamp=None, user_id=None,
+                 notes='', entry_id=None, device_time=None, needs_review=False):
+        if entry_type not in self.ENTRY_TYPES:
+            raise ValueError(f"Invalid entry type: {entry_type}")
+        if timestamp is None:
+            timestamp = datetime.now()
+        elif timestamp.tzinfo is not None:
+            # Firestore hands back UTC-tagged values; keep the stored wall-clock time
+            timestamp = timestamp.replace(tzinfo=None)
+        if device_time is not None and device_time.tzinfo is not None:
+            device_time = device_time.replace(tzinfo=None)
+        setattr_ = object.__setattr__
+        setattr_(self, 'entry_id', entry_id)
+        setattr_(self, 'user_id', user_id)
+        setattr_(self, 'user_email', user_email)
+        setattr_(self, 'entry_type', entry_type)
+        setattr_(self, 'timestamp', timestamp)
+        setattr_(self, 'notes', notes or '')
+        setattr_(self, 'device_time', device_time)
+        setattr_(self, 'needs_review', bool(needs_review))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('TimeEntry is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('TimeEntry is immutable')
+
+    def to_dict(self):
+        """Convert entry to dictionary for Firestore"""
+        data = {
+            'user_id': self.user_id,
+            'user_email': self.user_email,
+            'entry_type': self.entry_type,
+            'timestamp': self.timestamp,
+            'notes': self.notes
+        }
+        # Only synced punches carry these
+        if self.device_time is not None:
+            data['device_time'] = self.device_time
+        if self.needs_review:
+            data['needs_review'] = True
+        return data
+
+    @classmethod
+    def from_dict(cls, data, entry_id=None):
+        """Create entry object from Firestore document"""
+        return cls(
+            user_email=data.get('user_email'),
+            entry_type=data.get('entry_type'),
+            timestamp=data.get('timestamp'),
+            user_id=data.get('user_id'),
+            notes=data.get('notes'),
+            entry_id=entry_id,
+            device_time=data.get('device_time'),
+            needs_review=data.get('needs_review', False)
+        )
+
+    def save(self):
+        """Append the entry to Firestore"""
+        try:
+            db = get_db()
+            entries_ref = db.collection(self.COLLECTION)
+            if not self.entry_id:
+                # The ID is storage metadata, not part of the recorded event
+                object.__setattr__(self, 'entry_id', entries_ref.document().id)
+            # create() never overwrites: an entry ID can only be written once
+            entries_ref.document(self.entry_id).create(self.to_dict(), timeout=get_deadline())
+            return True
+        except Exception as e:
+            print(f"Error saving time entry: {e}")
+            return False
+
+    @classmethod
+    def save_many(cls, entries):
+        """Append many entries using bulk writes; returns the number written"""
+        try:
+            entries_ref = get_db().collection(cls.COLLECTION)
+            operations = []
+            for entry in entries:
+                if not entry.entry_id:
+                    object.__setattr__(entry, 'entry_id', entries_ref.document().id)
+                operations.append(('create', cls.COLLECTION, entry.entry_id, entry.to_dict()))
+            return sum(1 for result in firebase_service.bulk_write(operations) if result['success'])
+        except Exception as e:
+            print(f"Error saving time entries: {e}")
+            return 0
+
+    @staticmethod
+    def _range_bounds(start_date, end_date):
+        """Half-open [start, end + 1 day) timestamp bounds for a date range"""
+        start = datetime.combine(start_date, time_type.min)
+        end = datetime.combine(end_date + timedelta(days=1), time_type.min)
+        return start, end
+
+    @classmethod
+    def _iter_query(cls, query, start_date, end_date, page_size=None):
+        start, end = cls._range_bounds(start_date, end_date)
+        query = (query
+                .where('timestamp', '>=', start)
+                .where('timestamp', '<', end)
+                .order_by('timestamp'))
+        for doc in iter_query(query, page_size):
+            yield cls.from_dict(doc.to_dict(), doc.id)
+
+    # The iter_* methods raise storage errors, also in the middle of a stream,
+    # so an export cut short by a failed page is aborted instead of looking
+    # complete. The get_* methods catch them and return an empty list.
+
+    @classmethod
+    def iter_all_entries(cls, start_date, end_date, page_size=None):
+        """Stream every entry within the date range in timestamp order"""
+        db = get_db()
+        yield from cls._iter_query(db.collection(cls.COLLECTION), start_date, end_date, page_size)
+
+    @classmethod
+    def iter_user_entries(cls, user_email, start_date, end_date, page_size=None):
+        """Stream a user's entries within the date range in timestamp order"""
+        db = get_db()
+        query = db.collection(cls.COLLECTION).where('user_email', '==', user_email)
+        yield from cls._iter_query(query, start_date, end_date, page_size)
+
+    @classmethod
+    def iter_entries_for_users(cls, user_emails, start_date, end_date, page_size=None):
+        """Stream the entries of several users with one query per IN_QUERY_LIMIT emails.
+
+        Entries are in timestamp order within each chunk of users, not overall.
+        """
+        db = get_db()
+        for chunk in chunked(dict.fromkeys(user_emails), IN_QUERY_LIMIT):
+            query = db.collection(cls.COLLECTION).where('user_email', 'in', chunk)
+            yield from cls._iter_query(query, start_date, end_date, page_size)
+
+    @classmethod
+    def get_all_entries(cls, start_date, end_date):
+        """Get every entry within the date range (admin use)"""
+        try:
+            return list(cls.iter_all_entries(start_date, end_date))
+        except Exception as e:
+            print(f"Error getting all time entries: {e}")
+            return []
+
+    @classmethod
+    def get_user_entries(cls, user_email, start_date, end_date):
+        """Get a user's entries within the date range"""
+        try:
+            return list(cls.iter_user_entries(user_email, start_date, end_date))
+        except Exception as e:
+            print(f"Error getting time entries for user: {e}")
+            return []
+
+    @classmethod
+    def get_entries_for_users(cls, user_emails, start_date, end_date):
+        """Get the entries of several users within the date range"""
+        try:
+            return list(cls.iter_entries_for_users(user_emails, start_date, end_date))
+        except Exception as e:
+            print(f"Error getting time entries for users: {e}")
+            return []
+
+    def get_type_display(self):
+        """Get user-friendly entry type display"""
+        type_map = {
+            'entry': 'Entrada',
+            'lunch_start': 'Início do Almoço',
+            'lunch_end': 'Fim do Almoço',
+            'exit': 'Saída'
+        }
+        return type_map.get(self.entry_type, self.entry_type)
+
+    def __repr__(self):
+        return f'<TimeEntry {self.user_email} {self.entry_type} {self.timestamp}>'
+
+class DailyReport:
+    """One user's day, reduced from its punches in a single pass.
+
+    Work is counted between each entry/lunch_end punch and the following
+    lunch_start/exit punch, so split shifts and repeated lunches add up
+    correctly. A work period that is still open is not counted.
+    """
+    __slots__ = ('user_email', 'date', 'entries', 'entry_time', 'lunch_start', 'lunch_end',
+                 'exit_time', 'worked_seconds', 'lunch_seconds', '_open_since', '_lunch_since',
+                 '_last_timestamp')
+
+    def __init__(self, user_email, date, entries=None):
+        self.user_email = user_email
+        self.date = date
+        self.entries = []
+        self.entry_time = None
+        self.lunch_start = None
+        self.lunch_end = None
+        self.exit_time = None
+        self.worked_seconds = 0
+        self.lunch_seconds = 0
+        self._open_since = None
+        self._lunch_since = None
+        self._last_timestamp = None
+        if entries:
+            if any(a.timestamp > b.timestamp for a, b in zip(entries, entries[1:])):
+                entries = sorted(entries, key=lambda entry: entry.timestamp)
+            for entry in entries:
+                self.add(entry)
+
+    def add(self, entry):
+        """Fold the next punch of the day (in timestamp order) into the report"""
+        timestamp = entry.timestamp
+        entry_type = entry.entry_type
+        self.entries.append(entry)
+        self._last_timestamp = timestamp
+
+        if entry_type == 'entry' or entry_type == 'lunch_end':
+            if entry_type == 'entry':
+                if self.entry_time is None:
+                    self.entry_time = timestamp
+            else:
+                self.lunch_end = timestamp
+                if self._lunch_since is not None:
+                    self.lunch_seconds += (timestamp - self._lunch_since).total_seconds()
+                    self._lunch_since = None
+            if self._open_since is None:
+                self._open_since = timestamp
+        else:
+            if self._open_since is not None:
+                self.worked_seconds += (timestamp - self._open_since).total_seconds()
+                self._open_since = None
+            if entry_type == 'lunch_start':
+                if self.lunch_start is None:
+                    self.lunch_start = timestamp
+                self._lunch_since = timestamp
+            else:
+                self.exit_time = timestamp
+
+    @classmethod
+    def group_entries(cls, entries):
+        """Build {user_email: {date: DailyReport}} from entries in one pass.
+
+        Entries are expected in timestamp order (as the entry queries return
+        them); reports fed out of order are rebuilt sorted at the end.
+        """
+        reports = {}
+        unordered = set()
+        for entry in entries:
+            user_reports = reports.get(entry.user_email)
+            if user_reports is None:
+                user_reports = reports[entry.user_email] = {}
+            entry_date = entry.timestamp.date()
+            report = user_reports.get(entry_date)
+            if report is None:
+                report = user_reports[entry_date] = cls(entry.user_email, entry_date)
+            elif entry.timestamp < report._last_timestamp:
+                unordered.add(report)
+            report.add(entry)
+
+        for report in unordered:
+            reports[report.user_email][report.date] = cls(report.user_email, report.date, report.entries)
+        return reports
+
+    @property
+    def total_hours(self):
+        """Hours worked, excluding lunch"""
+        return self.worked_seconds / 3600
+
+    @property
+    def lunch_hours(self):
+        """Hours spent on lunch"""
+        return self.lunch_seconds / 3600
+
+    def is_complete(self):
+        """Check if the day has an entry and an exit and no open work period"""
+        return self.entry_time is not None and self.exit_time is not None and self._open_since is None
+
+    def calculate_overtime(self, expected_hours=8):
+        """Calculate overtime hours"""
+        return max(self.total_hours - expected_hours, 0)
+
+    def __repr__(self):
+        return f'<DailyReport {self.user_email} - {self.date}: {self.total_hours:.2f}h>'
@@ -1,62 +1,113 @@
-from firebase_admin import firestore
-from flask_bcrypt import Bcrypt
+from flask import g, has_app_context
 from datetime import datetime
-import firebase_admin
-from firebase_admin import credentials
-import os
-import json
+from app.storage import get_db, get_deadline, iter_query, IN_QUERY_LIMIT
+from app.utils.helpers import chunked
+from app.services.database import firebase_service
+from app.services.cache import TTLCache
+from app.services.password_hashing import PasswordHashingBusy, hash_password, verify_password, needs_rehash
+from app.services.upload_queue import PENDING_PHOTO_PREFIX
+from config.settings import Config
 
-bcrypt = Bcrypt()
+# Optional process-level cache of user documents, keyed by ('email', ...) and
+# ('id', ...). Disabled unless USER_CACHE_TTL > 0; entries are invalidated on
+# save/delete in this process and expire after the TTL in other workers.
+_user_cache = TTLCache(maxsize=Config.USER_CACHE_SIZE, ttl=Config.USER_CACHE_TTL)
 
-# Initialize Firebase if not already initialized
-def initialize_firebase():
-    if not firebase_admin._apps:
-        try:
-            # Try to use environment variables
-            firebase_config = {
-                "type": "service_account",
-                "project_id": os.environ.get('FIREBASE_PROJECT_ID'),
-                "private_key_id": os.environ.get('FIREBASE_PRIVATE_KEY_ID'),
-                "private_key": os.environ.get('FIREBASE_PRIVATE_KEY', '').replace('\\n', '\n'),
-                "client_email": os.environ.get('FIREBASE_CLIENT_EMAIL'),
-                "client_id": os.environ.get('FIREBASE_CLIENT_ID'),
-                "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-                "token_uri": "https://oauth2.googleapis.com/token",
-                "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
-                "client_x509_cert_url": os.environ.get('FIREBASE_CLIENT_CERT_URL')
-            }
-            
-            # Only initialize if we have the required config
-            if firebase_config["project_id"] and firebase_config["private_key"]:
-                cred = credentials.Certificate(firebase_config)
-                firebase_admin.initialize_app(cred)
-        except Exception as e:
-            print(f"Firebase initialization failed: {e}")
-            # For development, we'll use a mock setup
-            pass
+def _identity_map():
+    """Per-request map of loaded users stored on flask.g (None outside a context)"""
+    if not has_app_context():
+        return None
+    if '_user_identity_map' not in g:
+        g._user_identity_map = {}
+    return g._user_identity_map
 
 class User:
+    __slots__ = ('email', 'name', 'user_type', 'password_hash', 'profile_picture',
+                 'profile_pictures', 'is_active', 'created_at', 'updated_at', 'user_id',
+                 '_persisted', '_partial')
+
+    # Persisted fields compared by changed_fields(); updated_at is set on every write
+    FIELDS = ('email', 'name', 'user_type', 'password_hash', 'profile_picture',
+              'profile_pictures', 'is_active', 'created_at')
+
+    # Projections for list views: never load password_hash just to show a name
+    SUMMARY_FIELDS = ('email', 'name', 'user_type', 'is_active')
+    LIST_FIELDS = SUMMARY_FIELDS + ('profile_picture', 'profile_pictures', 'created_at')
+
     def __init__(self, email=None, name=None, user_type='TRABALHADOR', password_hash=None, 
-                 profile_picture=None, is_active=True, created_at=None, user_id=None):
+                 profile_picture=None, is_active=True, created_at=None, user_id=None,
+                 profile_pictures=None):
         self.email = email
         self.name = name
         self.user_type = user_type  # ADMINISTRADOR, TRABALHADOR, ESTAGIÁRIO
         self.password_hash = password_hash
         self.profile_picture = profile_picture
+        self.profile_pictures = profile_pictures or {}  # size name -> URL (small, medium, large)
         self.is_active = is_active
         self.created_at = created_at or datetime.utcnow()
         self.updated_at = datetime.utcnow()
         self.user_id = user_id
+        # Field values as last read from or written to storage (None: not stored yet)
+        self._persisted = None
+        # Loaded with a field projection: other fields hold defaults, not stored values
+        self._partial = False
 
     def set_password(self, password):
-        """Hash the password and store it"""
-        self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        """Hash the password and store it (raises PasswordHashingBusy)"""
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        """Check if the provided password matches the hashed password"""
+        """Check if the provided password matches the hashed password (raises PasswordHashingBusy)"""
         if not self.password_hash:
             return False
-        return bcrypt.check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+
+    def rehash_password(self, password):
+        """Re-hash a just-verified password stored with an outdated bcrypt cost; returns True if saved"""
+        if not self.password_hash or not needs_rehash(self.password_hash):
+            return False
+        try:
+            self.set_password(password)
+        except PasswordHashingBusy:
+            return False  # try again on a later login
+        return self.save()
+
+    def get_expected_hours(self):
+        """Daily work hours expected for the user's type"""
+        expected = {
+            'ADMINISTRADOR': Config.ADMIN_WORK_HOURS,
+            'TRABALHADOR': Config.WORKER_WORK_HOURS,
+            'ESTAGIÁRIO': Config.INTERN_WORK_HOURS
+        }
+        return expected.get(self.user_type, Config.WORKER_WORK_HOURS)
+
+    def has_pending_photo(self):
+        """Check if the profile photo is still being uploaded in the background"""
+        return bool(self.profile_picture) and self.profile_picture.startswith(PENDING_PHOTO_PREFIX)
+
+    def get_photo_url(self, size=None):
+        """Profile photo URL for a size (small, medium, large), or None while uploading"""
+        if self.has_pending_photo():
+            return None
+        if size and size in self.profile_pictures:
+            return self.profile_pictures[size]
+        return self.profile_picture
+
+    def _snapshot(self):
+        # profile_pictures is copied so in-place edits still show up as changes
+        return tuple(dict(value) if isinstance(value, dict) else value
+                     for value in (getattr(self, field) for field in self.FIELDS))
+
+    def changed_fields(self):
+        """Document fields that differ from the stored document (all of them if not stored)"""
+        data = self.to_dict()
+        if self._persisted is None:
+            return data
+        return {
+            field: data[field]
+            for field, stored in zip(self.FIELDS, self._persisted)
+            if data[field] != stored
+        }
 
     def to_dict(self):
         """Convert user object to dictionary for Firestore"""
@@ -66,6 +117,7 @@ class User:
             'user_type': self.user_type,
             'password_hash': self.password_hash,
             'profile_picture': self.profile_picture,
+            'profile_pictures': self.profile_pictures,
             'is_active': self.is_active,
             'created_at': self.created_at,
             'updated_at': self.updated_at
@@ -74,52 +126,176 @@ class User:
     @classmethod
     def from_dict(cls, data, user_id=None):
         """Create user object from Firestore document"""
-        return cls(
-            email=data.get('email'),
-            name=data.get('name'),
-            user_type=data.get('user_type', 'TRABALHADOR'),
-            password_hash=data.get('password_hash'),
-            profile_picture=data.get('profile_picture'),
-            is_active=data.get('is_active', True),
-            created_at=data.get('created_at'),
-            user_id=user_id
-        )
+        user = cls.__new__(cls)
+        user.email = data.get('email')
+        user.name = data.get('name')
+        user.user_type = data.get('user_type', 'TRABALHADOR')
+        user.password_hash = data.get('password_hash')
+        user.profile_picture = data.get('profile_picture')
+        user.profile_pictures = data.get('profile_pictures') or {}
+        user.is_active = data.get('is_active', True)
+        user.created_at = data.get('created_at') or datetime.utcnow()
+        user.updated_at = data.get('updated_at') or user.created_at
+        user.user_id = user_id
+        user._persisted = user._snapshot()
+        user._partial = False
+        return user
+
+    @classmethod
+    def _from_snapshot(cls, doc, fields=None):
+        """Build a user from a query result, loaded in full or with a projection"""
+        user = cls.from_dict(doc.to_dict(), doc.id)
+        if fields is not None:
+            user._partial = True
+        else:
+            user._remember(process_cache=False)
+        return user
+
+    @staticmethod
+    def _projection(fields):
+        # Paging and the identity map key on email, so it is always loaded
+        return list(dict.fromkeys(('email',) + tuple(fields)))
+
+    @classmethod
+    def _cached(cls, key):
+        """Look a user up in the request identity map, then the process cache"""
+        identity_map = _identity_map()
+        if identity_map is not None and key in identity_map:
+            return identity_map[key]
+        
+        snapshot = _user_cache.get(key)
+        if snapshot is None:
+            return None
+        
+        # Build a fresh object so mutations never leak into the shared cache
+        user = cls.from_dict(snapshot[1], snapshot[0])
+        user._remember(process_cache=False)
+        return user
+
+    def _remember(self, process_cache=True):
+        """Register this user in the identity map and (optionally) the process cache"""
+        if self._partial:
+            return  # only complete users may be served from the caches
+        keys = [('email', self.email), ('id', self.user_id)]
+        
+        identity_map = _identity_map()
+        if identity_map is not None:
+            for key in keys:
+                identity_map[key] = self
+        
+        if process_cache and self.user_id:
+            snapshot = (self.user_id, self.to_dict())
+            for key in keys:
+                _user_cache.set(key, snapshot)
+
+    @classmethod
+    def invalidate_cache(cls, email=None, user_id=None):
+        """Drop a user from the identity map and process cache"""
+        keys = [('email', email), ('id', user_id)]
+        
+        identity_map = _identity_map()
+        if identity_map is not None:
+            for key in keys:
+                identity_map.pop(key, None)
+            identity_map.pop('all', None)
+        
+        for key in keys:
+            _user_cache.delete(key)
 
     def save(self):
-        """Save user to Firestore"""
+        """Save user to Firestore; a stored user only sends the fields that changed"""
         try:
-            initialize_firebase()
-            db = firestore.client()
+            db = get_db()
             users_ref = db.collection('users')
             
+            changes = self.changed_fields()
+            if not changes:
+                return True
+            
             self.updated_at = datetime.utcnow()
+            changes['updated_at'] = self.updated_at
             
-            if self.user_id:
+            if self.user_id and self._persisted is not None:
                 # Update existing user
-                users_ref.document(self.user_id).set(self.to_dict())
+                users_ref.document(self.user_id).update(changes, timeout=get_deadline())
+            elif self.user_id:
+                users_ref.document(self.user_id).set(changes, timeout=get_deadline())
             else:
                 # Create new user
-                doc_ref = users_ref.add(self.to_dict())
+                doc_ref = users_ref.add(changes, timeout=get_deadline())
                 self.user_id = doc_ref[1].id
             
+            self._persisted = self._snapshot()
+            self.invalidate_cache(self.email, self.user_id)
+            self._remember(process_cache=False)
             return True
         except Exception as e:
+            self.invalidate_cache(self.email, self.user_id)
             print(f"Error saving user: {e}")
             return False
 
     @classmethod
-    def get_by_email(cls, email):
+    def save_many(cls, users):
+        """Save many users with bulk writes; returns one result per user.
+
+        New users are created with generated IDs; stored users only send their
+        changed fields, as in save().
+        """
+        users = list(users)
+        results = [None] * len(users)
+        try:
+            users_ref = get_db().collection('users')
+            now = datetime.utcnow()
+            operations = []
+            positions = []
+            for position, user in enumerate(users):
+                changes = user.changed_fields()
+                if not changes:
+                    results[position] = {'id': user.user_id, 'success': True, 'error': None}
+                    continue
+                
+                changes['updated_at'] = now
+                if user.user_id and user._persisted is not None:
+                    operations.append(('update', 'users', user.user_id, changes))
+                else:
+                    user.user_id = user.user_id or users_ref.document().id
+                    operations.append(('set', 'users', user.user_id, changes))
+                positions.append(position)
+            
+            for position, result in zip(positions, firebase_service.bulk_write(operations)):
+                results[position] = result
+                user = users[position]
+                user.invalidate_cache(user.email, user.user_id)
+                if result['success']:
+                    user.updated_at = now
+                    user._persisted = user._snapshot()
+        except Exception as e:
+            print(f"Error saving users: {e}")
+        
+        return [
+            result or {'id': user.user_id, 'success': False, 'error': 'not written'}
+            for user, result in zip(users, results)
+        ]
+
+    @classmethod
+    def get_by_email(cls, email, use_cache=True):
         """Get user by email from Firestore"""
+        if use_cache:
+            user = cls._cached(('email', email))
+            if user is not None:
+                return user
+        
         try:
-            initialize_firebase()
-            db = firestore.client()
+            db = get_db()
             users_ref = db.collection('users')
             
             query = users_ref.where('email', '==', email).limit(1)
-            docs = query.stream()
+            docs = query.stream(timeout=get_deadline())
             
             for doc in docs:
-                return cls.from_dict(doc.to_dict(), doc.id)
+                user = cls.from_dict(doc.to_dict(), doc.id)
+                user._remember()
+                return user
             
             return None
         except Exception as e:
@@ -127,15 +303,21 @@ class User:
             return None
 
     @classmethod
-    def get_by_id(cls, user_id):
+    def get_by_id(cls, user_id, use_cache=True):
         """Get user by ID from Firestore"""
+        if use_cache:
+            user = cls._cached(('id', user_id))
+            if user is not None:
+                return user
+        
         try:
-            initialize_firebase()
-            db = firestore.client()
+            db = get_db()
             
-            doc = db.collection('users').document(user_id).get()
+            doc = db.collection('users').document(user_id).get(timeout=get_deadline())
             if doc.exists:
-                return cls.from_dict(doc.to_dict(), doc.id)
+                user = cls.from_dict(doc.to_dict(), doc.id)
+                user._remember()
+                return user
             
             return None
         except Exception as e:
@@ -143,22 +325,89 @@ class User:
             return None
 
     @classmethod
-    def get_all_users(cls):
-        """Get all users from Firestore"""
+    def get_many_by_email(cls, emails, use_cache=True):
+        """Get many users by email with chunked 'in' queries; returns {email: User}"""
+        users = {}
+        missing = []
+        for email in dict.fromkeys(emails):
+            user = cls._cached(('email', email)) if use_cache else None
+            if user is not None:
+                users[email] = user
+            else:
+                missing.append(email)
+        
+        try:
+            users_ref = get_db().collection('users')
+            for chunk in chunked(missing, IN_QUERY_LIMIT):
+                for doc in users_ref.where('email', 'in', chunk).stream(timeout=get_deadline()):
+                    user = cls.from_dict(doc.to_dict(), doc.id)
+                    user._remember()
+                    users[user.email] = user
+        except Exception as e:
+            print(f"Error getting users by email: {e}")
+        return users
+
+    @classmethod
+    def iter_all_users(cls, page_size=None, fields=None):
+        """Stream all users ordered by email, one Firestore page at a time.
+
+        With ``fields`` only those fields are loaded (see SUMMARY_FIELDS). Such
+        partial users are never cached, and save() on them only writes the
+        fields changed after loading. A failed page raises, so a caller never
+        mistakes a partial stream for the full list.
+        """
+        db = get_db()
+        query = db.collection('users').order_by('email')
+        if fields is not None:
+            query = query.select(cls._projection(fields))
+        
+        for doc in iter_query(query, page_size):
+            yield cls._from_snapshot(doc, fields)
+
+    @classmethod
+    def get_users_page(cls, page_size, cursor=None, fields=None):
+        """Get one page of users ordered by email.
+
+        ``cursor`` is the email of the last user on the previous page. Returns
+        ``(users, next_cursor)``; next_cursor is None on the last page.
+        ``fields`` limits the loaded fields as in iter_all_users().
+        """
         try:
-            initialize_firebase()
-            db = firestore.client()
+            db = get_db()
+            query = db.collection('users').order_by('email')
+            if fields is not None:
+                query = query.select(cls._projection(fields))
+            if cursor:
+                query = query.start_after({'email': cursor})
             
-            users = []
-            docs = db.collection('users').stream()
+            # Fetch one extra document to know whether another page exists
+            docs = list(query.limit(page_size + 1).stream(timeout=get_deadline()))
             
-            for doc in docs:
-                users.append(cls.from_dict(doc.to_dict(), doc.id))
+            users = [cls._from_snapshot(doc, fields) for doc in docs[:page_size]]
             
-            return users
+            next_cursor = users[-1].email if len(docs) > page_size else None
+            return users, next_cursor
+        except Exception as e:
+            print(f"Error getting users page: {e}")
+            return [], None
+
+    @classmethod
+    def get_all_users(cls, fields=None):
+        """Get all users from Firestore, optionally only the given fields"""
+        key = tuple(fields) if fields is not None else None
+        identity_map = _identity_map()
+        if identity_map is not None and key in identity_map.get('all', {}):
+            return list(identity_map['all'][key])
+        
+        try:
+            users = list(cls.iter_all_users(fields=fields))
         except Exception as e:
             print(f"Error getting all users: {e}")
             return []
+        
+        if identity_map is not None:
+            identity_map.setdefault('all', {})[key] = users
+        return list(users)
 
     def delete(self):
         """Delete user from Firestore"""
@@ -166,9 +415,9 @@ class User:
             if not self.user_id:
                 return False
                 
-            initialize_firebase()
-            db = firestore.client()
-            db.collection('users').document(self.user_id).delete()
+            db = get_db()
+            db.collection('users').document(self.user_id).delete(timeout=get_deadline())
+            self.invalidate_cache(self.email, self.user_id)
             return True
         except Exception as e:
             print(f"Error deleting user: {e}")
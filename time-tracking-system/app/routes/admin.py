@@ -1,11 +1,16 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, make_response
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, Response, stream_with_context
 from app.models.user import User
-from app.models.timesheet import TimeEntry, DailyReport
+from app.models.timesheet import TimeEntry
 from app.services.notifications import NotificationService
-from app.utils.file_utils import upload_report_file
+from app.services.user_import import UserImporter
+from app.services.admission import admission_controller
+from app.services.metrics import metrics
+from app.utils.file_utils import open_report_upload, finish_report_upload
+from config.settings import Config
 from datetime import datetime, timedelta
+import codecs
 import csv
-from io import StringIO, BytesIO
+from io import StringIO
 
 bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -21,8 +26,8 @@ def admin_required(f):
 @bp.route('/dashboard')
 @admin_required
 def dashboard():
-    # Get all users
-    users = User.get_all_users()
+    # Get all users (only the fields the dashboard shows)
+    users = User.get_all_users(fields=User.SUMMARY_FIELDS)
     
     # Get today's entries
     today = datetime.now().date()
@@ -47,8 +52,30 @@ def dashboard():
 @bp.route('/users')
 @admin_required
 def users():
-    all_users = User.get_all_users()
-    return render_template('admin/users.html', users=all_users)
+    cursor = request.args.get('cursor')
+    page_users, next_cursor = User.get_users_page(Config.ADMIN_PAGE_SIZE, cursor, fields=User.LIST_FIELDS)
+    return render_template('admin/users.html', 
+                         users=page_users,
+                         cursor=cursor,
+                         next_cursor=next_cursor)
+
+@bp.route('/users/import', methods=['POST'])
+@admin_required
+def import_users():
+    """Create users from an uploaded CSV (email, name, user_type, password)"""
+    file = request.files.get('file')
+    if not file or file.filename == '':
+        return jsonify({'success': False, 'message': 'Envie um arquivo CSV.'}), 400
+    
+    rejects = []
+    importer = UserImporter(rejects=lambda row: rejects.append(
+        {'line': row['line'], 'email': row['email'], 'reason': row['reason']}))
+    try:
+        stats = importer.run(codecs.iterdecode(file.stream, 'utf-8-sig', errors='replace'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    return jsonify({'success': True, 'summary': stats, 'rejects': rejects})
 
 @bp.route('/reports')
 @admin_required
@@ -57,6 +84,7 @@ def reports():
     start_date_str = request.args.get('start_date')
     end_date_str = request.args.get('end_date')
     user_email = request.args.get('user_email')
+    cursor = request.args.get('cursor')
     
     if start_date_str and end_date_str:
         start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
@@ -68,39 +96,85 @@ def reports():
         end_date = today
     
     # Get entries
+    next_cursor = None
     if user_email:
         entries = TimeEntry.get_user_entries(user_email, start_date, end_date)
     else:
-        entries = TimeEntry.get_all_entries(start_date, end_date)
+        # Report one page of users at a time so the view stays bounded
+        page_users, next_cursor = User.get_users_page(Config.ADMIN_PAGE_SIZE, cursor, fields=('email',))
+        page_emails = [page_user.email for page_user in page_users]
+        entries = TimeEntry.get_entries_for_users(page_emails, start_date, end_date)
     
     # Get all users for filter
-    users = User.get_all_users()
+    users = User.get_all_users(fields=User.SUMMARY_FIELDS)
     
-    # Group entries by user and date
-    user_reports = {}
-    for entry in entries:
-        if entry.user_email not in user_reports:
-            user_reports[entry.user_email] = {}
-        
-        entry_date = entry.timestamp.date()
-        if entry_date not in user_reports[entry.user_email]:
-            user_reports[entry.user_email][entry_date] = []
-        
-        user_reports[entry.user_email][entry_date].append(entry)
-    
-    # Calculate daily reports for each user
-    processed_reports = {}
-    for user_email, date_entries in user_reports.items():
-        processed_reports[user_email] = {}
-        for date, daily_entries in date_entries.items():
-            processed_reports[user_email][date] = DailyReport(user_email, date, daily_entries)
+    # Reduce punches to daily rows and aggregate them with array operations
+    from app.services.report_engine import DailyTable
+    table = DailyTable.from_entries(entries)
+    expected_hours = {u.email: u.get_expected_hours() for u in users}
+    processed_reports = table.by_user(expected_hours)
+    user_totals = table.user_totals(expected_hours)
     
     return render_template('admin/reports.html',
                          user_reports=processed_reports,
+                         user_totals=user_totals,
                          users=users,
                          selected_user=user_email,
                          start_date=start_date,
-                         end_date=end_date)
+                         end_date=end_date,
+                         cursor=cursor,
+                         next_cursor=next_cursor)
+
+def _stream_csv(entries, archive_filename=None):
+    """Yield CSV bytes for entries in ~EXPORT_FLUSH_BYTES pieces.
+
+    When archive_filename is given the same bytes are fed to a Dropbox upload
+    session, so the archive copy is built without buffering the whole file.
+    """
+    archive = open_report_upload(archive_filename) if archive_filename else None
+    
+    output = StringIO()
+    writer = csv.writer(output)
+    
+    def flush():
+        nonlocal archive
+        chunk = output.getvalue().encode('utf-8')
+        output.seek(0)
+        output.truncate(0)
+        if archive is not None:
+            try:
+                archive.write(chunk)
+            except Exception as e:
+                # Never fail the download because the archive copy failed
+                print(f"Error archiving CSV export to Dropbox: {e}")
+                archive = None
+        return chunk
+    
+    writer.writerow(['Data', 'Usuario', 'Tipo', 'Horario', 'Observacoes'])
+    
+    try:
+        for entry in entries:
+            writer.writerow([
+                entry.timestamp.strftime('%Y-%m-%d'),
+                entry.user_email,
+                entry.entry_type,
+                entry.timestamp.strftime('%H:%M:%S'),
+                entry.notes
+            ])
+            if output.tell() >= Config.EXPORT_FLUSH_BYTES:
+                yield flush()
+    except Exception as e:
+        # Abort the response so the client sees a failed download, not a short
+        # file; the unfinished upload session is never committed to Dropbox
+        print(f"Error streaming CSV export, aborting: {e}")
+        raise
+    
+    yield flush()
+    
+    if archive is not None:
+        download_url = finish_report_upload(archive)
+        if download_url:
+            print(f"CSV export archived to Dropbox: {download_url}")
 
 @bp.route('/export_csv')
 @admin_required
@@ -117,41 +191,19 @@ def export_csv():
         start_date = today.replace(day=1)
         end_date = today
     
-    # Get entries
+    # Stream entries page by page instead of loading the whole range
     if user_email:
-        entries = TimeEntry.get_user_entries(user_email, start_date, end_date)
+        entries = TimeEntry.iter_user_entries(user_email, start_date, end_date)
     else:
-        entries = TimeEntry.get_all_entries(start_date, end_date)
+        entries = TimeEntry.iter_all_entries(start_date, end_date)
     
-    # Create CSV content
-    output = StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['Data', 'Usuario', 'Tipo', 'Horario', 'Observacoes'])
-    
-    for entry in entries:
-        writer.writerow([
-            entry.timestamp.strftime('%Y-%m-%d'),
-            entry.user_email,
-            entry.entry_type,
-            entry.timestamp.strftime('%H:%M:%S'),
-            entry.notes
-        ])
-    
-    csv_content = output.getvalue()
-    
-    # Upload to Dropbox
     filename = f'relatorio_{start_date}_a_{end_date}.csv'
-    download_url = upload_report_file(csv_content.encode('utf-8'), filename)
+    archive_filename = filename if Config.EXPORT_ARCHIVE_TO_DROPBOX else None
     
-    if download_url:
-        # Redirect to Dropbox download
-        return redirect(download_url)
-    else:
-        # Fallback to direct download
-        response = make_response(csv_content)
-        response.headers['Content-Type'] = 'text/csv'
-        response.headers['Content-Disposition'] = f'attachment; filename={filename}'
-        return response
+    # Rows are written to the response as Firestore pages arrive
+    response = Response(stream_with_context(_stream_csv(entries, archive_filename)), mimetype='text/csv')
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
 
 @bp.route('/notifications', methods=['GET', 'POST'])
 @admin_required
@@ -166,25 +218,36 @@ def notifications():
         
         if notification_type == 'global':
             notification_service.send_global_notification(title, message)
+            flash('Notificação enviada com sucesso!', 'success')
         elif notification_type == 'group':
-            notification_service.send_group_notification(title, message, target)
+            sent = notification_service.send_group_notification(title, message, target)
+            flash(f'Notificação enviada para {sent} dispositivo(s).', 'success')
         elif notification_type == 'individual':
-            notification_service.send_individual_notification(title, message, target)
-        
-        flash('Notificação enviada com sucesso!', 'success')
+            # target is a comma-separated list of emails
+            emails = [email.strip() for email in target.split(',') if email.strip()]
+            sent, unknown = notification_service.send_individual_notification(title, message, emails)
+            flash(f'Notificação enviada para {sent} dispositivo(s).', 'success')
+            if unknown:
+                flash(f'Usuários não encontrados: {", ".join(unknown)}', 'error')
+        return redirect(url_for('admin.notifications'))
     
-    # Get recent notifications
-    recent_notifications = notification_service.get_recent_notifications()
-    users = User.get_all_users()
+    users = User.get_all_users(fields=User.SUMMARY_FIELDS)
     
-    return render_template('admin/notifications.html', 
-                         notifications=recent_notifications,
-                         users=users)
+    return render_template('admin/notifications.html', users=users)
+
+@bp.route('/metrics')
+@admin_required
+def metrics_snapshot():
+    """Metrics and admission state of the worker process serving this request"""
+    snapshot = metrics.snapshot()
+    snapshot['admission'] = admission_controller.state()
+    return jsonify(snapshot)
 
 @bp.route('/user/<user_email>/toggle_status')
 @admin_required
 def toggle_user_status(user_email):
-    user = User.get_by_email(user_email)
+    # Read the current status from Firestore, never from a cached copy
+    user = User.get_by_email(user_email, use_cache=False)
     if user:
         user.is_active = not user.is_active
         user.save()
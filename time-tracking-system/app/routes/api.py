@@ -0,0 +1,37 @@
+from flask import Blueprint, request, jsonify, g, Response, stream_with_context
+from app.services.punch_ingest import PunchIngestor, CSV_TYPES, open_records, terminal_for_token
+import json
+
+bp = Blueprint('api', __name__, url_prefix='/api')
+
+def token_required(f):
+    """Decorator to require a terminal API token (Authorization: Bearer <token>)"""
+    def decorated_function(*args, **kwargs):
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        terminal = terminal_for_token(token.strip()) if scheme.lower() == 'bearer' else None
+        if not terminal:
+            return jsonify({'success': False, 'message': 'Token inválido.'}), 401
+        g.terminal = terminal
+        return f(*args, **kwargs)
+    decorated_function.__name__ = f.__name__
+    return decorated_function
+
+@bp.route('/punches', methods=['POST'])
+@token_required
+def ingest_punches():
+    """Ingest a terminal's punch log (NDJSON or CSV); streams one NDJSON result per record"""
+    try:
+        records = open_records(request.stream, request.mimetype)
+    except ValueError as e:
+        status = 400 if request.mimetype in CSV_TYPES else 415
+        return jsonify({'success': False, 'message': str(e)}), status
+    
+    ingestor = PunchIngestor(g.terminal)
+    
+    def generate():
+        for result in ingestor.ingest(records):
+            yield json.dumps(result, ensure_ascii=False) + '\n'
+        # Last line: totals per status
+        yield json.dumps({'terminal': g.terminal, 'summary': ingestor.counts}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
@@ -1,10 +1,23 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session
 from app.models.user import User
-from app.utils.file_utils import upload_user_photo, allowed_file, validate_file_size
+from app.services.password_hashing import PasswordHashingBusy
+from app.utils.file_utils import queue_user_photo, allowed_file, validate_file_size
 import os
 
 bp = Blueprint('auth', __name__, url_prefix='/auth')
 
+BUSY_MESSAGE = 'Muitos acessos neste momento. Tente novamente em alguns segundos.'
+BUSY_RETRY_AFTER = '5'  # seconds
+
+def _save_with_photo(user, placeholder):
+    """Save the user with the pending photo placeholder (queue_user_photo callback)"""
+    previous = user.profile_picture
+    user.profile_picture = placeholder
+    if user.save():
+        return True
+    user.profile_picture = previous
+    return False
+
 @bp.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
@@ -12,7 +25,16 @@ def login():
         password = request.form['password']
         
         user = User.get_by_email(email)
-        if user and user.check_password(password) and user.is_active:
+        try:
+            # bcrypt runs in the hashing pool; a full queue turns the login away
+            valid = user is not None and user.check_password(password)
+        except PasswordHashingBusy:
+            flash(BUSY_MESSAGE, 'error')
+            return render_template('login.html'), 503, {'Retry-After': BUSY_RETRY_AFTER}
+        
+        if valid and user.is_active:
+            # Upgrade a hash made with an outdated bcrypt cost while the password is at hand
+            user.rehash_password(password)
             session['user_id'] = user.user_id
             session['user_email'] = user.email
             session['user_type'] = user.user_type
@@ -42,7 +64,7 @@ def register():
             return render_template('register.html')
         
         # Handle photo upload
-        photo_url = None
+        photo = None
         if 'photo' in request.files:
             file = request.files['photo']
             if file and file.filename != '':
@@ -55,17 +77,23 @@ def register():
                     flash('Arquivo muito grande! Máximo 16MB.', 'error')
                     return render_template('register.html')
                 
-                # Upload to Dropbox
-                photo_url = upload_user_photo(file, email)
-                if not photo_url:
-                    flash('Erro ao fazer upload da foto. Tente novamente.', 'error')
-                    return render_template('register.html')
+                photo = file
         
         # Create new user
-        user = User(email=email, name=name, user_type=user_type, profile_picture=photo_url)
-        user.set_password(password)
+        user = User(email=email, name=name, user_type=user_type)
+        try:
+            user.set_password(password)
+        except PasswordHashingBusy:
+            flash(BUSY_MESSAGE, 'error')
+            return render_template('register.html'), 503, {'Retry-After': BUSY_RETRY_AFTER}
         
-        if user.save():
+        if photo:
+            # Upload to Dropbox in the background; the user is saved with a placeholder first
+            saved = queue_user_photo(photo, email, save=lambda placeholder: _save_with_photo(user, placeholder))
+        else:
+            saved = user.save()
+        
+        if saved:
             flash('Cadastro realizado com sucesso!', 'success')
             return redirect(url_for('auth.login'))
         else:
@@ -92,6 +120,7 @@ def profile():
         user.name = request.form['name']
         
         # Handle photo upload
+        photo = None
         if 'photo' in request.files:
             file = request.files['photo']
             if file and file.filename != '':
@@ -104,15 +133,16 @@ def profile():
                     flash('Arquivo muito grande! Máximo 16MB.', 'error')
                     return render_template('profile.html', user=user)
                 
-                # Upload new photo to Dropbox
-                new_photo_url = upload_user_photo(file, user.email)
-                if new_photo_url:
-                    user.profile_picture = new_photo_url
-                else:
-                    flash('Erro ao fazer upload da foto. Tente novamente.', 'error')
-                    return render_template('profile.html', user=user)
+                photo = file
+        
+        if photo:
+            # Upload new photo to Dropbox in the background, once the placeholder is saved
+            saved = queue_user_photo(photo, user.email, user.get_photo_url(),
+                                     save=lambda placeholder: _save_with_photo(user, placeholder))
+        else:
+            saved = user.save()
         
-        if user.save():
+        if saved:
             session['user_name'] = user.name  # Update session
             flash('Perfil atualizado com sucesso!', 'success')
         else:
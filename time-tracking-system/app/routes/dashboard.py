@@ -1,6 +1,10 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify
 from app.models.user import User
 from app.models.timesheet import Timesheet
+from app.models.rollup import TimesheetRollup
+from app.services.punch_sync import PUNCH_MESSAGES, punch_key, sync_punches
+from app.services.admission import admission_required
+from config.settings import Config
 from datetime import datetime, date, timedelta
 import json
 
@@ -18,6 +22,7 @@ def login_required(f):
 
 @bp.route('/')
 @login_required
+@admission_required('page')
 def index():
     """Main dashboard page"""
     user = User.get_by_email(session['user_email'])
@@ -32,72 +37,37 @@ def index():
     if not timesheet:
         timesheet = Timesheet(user_id=user.user_id, date=today)
     
-    # Get this week's timesheets for overview
-    start_of_week = today - timedelta(days=today.weekday())
-    end_of_week = start_of_week + timedelta(days=6)
-    week_timesheets = Timesheet.get_by_user_date_range(user.user_id, start_of_week, end_of_week)
-    
-    # Calculate weekly totals
-    weekly_hours = sum(ts.total_hours or 0 for ts in week_timesheets)
+    # Weekly total comes from the pre-aggregated rollup (one document read)
+    weekly_hours = TimesheetRollup.get_week(user.user_id, today).total_hours
     
     return render_template('dashboard.html', 
                          user=user, 
                          timesheet=timesheet, 
-                         week_timesheets=week_timesheets,
                          weekly_hours=weekly_hours,
                          today=today)
 
 @bp.route('/clock/<action>', methods=['POST'])
 @login_required
+@admission_required('punch', json_response=True)
 def clock_action(action):
     """Handle clock in/out actions"""
     user = User.get_by_email(session['user_email'])
     if not user:
         return jsonify({'success': False, 'message': 'Usuário não encontrado'})
     
-    today = datetime.now().date()
-    timesheet = Timesheet.get_by_user_and_date(user.user_id, today)
-    
-    # Create timesheet if it doesn't exist
-    if not timesheet:
-        timesheet = Timesheet(user_id=user.user_id, date=today)
-    
     success = False
-    message = ''
-    
-    try:
-        if action == 'entry':
-            if timesheet.register_entry():
-                success = True
-                message = 'Entrada registrada com sucesso!'
-            else:
-                message = 'Entrada já foi registrada hoje.'
-                
-        elif action == 'lunch_start':
-            if timesheet.register_lunch_start():
-                success = True
-                message = 'Início do almoço registrado!'
-            else:
-                message = 'Início do almoço já foi registrado.'
-                
-        elif action == 'lunch_end':
-            if timesheet.register_lunch_end():
-                success = True
-                message = 'Fim do almoço registrado!'
-            else:
-                message = 'Fim do almoço já foi registrado ou início não foi marcado.'
-                
-        elif action == 'exit':
-            if timesheet.register_exit():
-                success = True
-                message = 'Saída registrada com sucesso!'
-            else:
-                message = 'Saída já foi registrada hoje.'
+    
+    if action not in PUNCH_MESSAGES:
+        message = 'Ação inválida.'
+    else:
+        now = datetime.now()
+        # One transaction updates the timesheet, its rollups and the punch log
+        timesheet, success = Timesheet.punch(user.user_id, now.date(), action, now, user_email=user.email)
+        
+        if timesheet is None:
+            message = 'Erro ao registrar ponto. Tente novamente.'
         else:
-            message = 'Ação inválida.'
-            
-    except Exception as e:
-        message = f'Erro ao registrar ponto: {str(e)}'
+            message = PUNCH_MESSAGES[action][0 if success else 1]
     
     if success:
         flash(message, 'success')
@@ -110,8 +80,42 @@ def clock_action(action):
         'redirect': url_for('dashboard.index')
     })
 
+@bp.route('/clock/key')
+@login_required
+def clock_key():
+    """Signing key for punches queued offline by this user's browser"""
+    user = User.get_by_email(session['user_email'])
+    if not user:
+        return jsonify({'success': False, 'message': 'Usuário não encontrado'}), 404
+    
+    return jsonify({
+        'success': True,
+        'user': user.email,
+        'key': punch_key(user.user_id),
+        'max_batch': Config.PUNCH_SYNC_MAX_BATCH
+    })
+
+@bp.route('/clock/sync', methods=['POST'])
+@login_required
+@admission_required('punch', json_response=True)
+def clock_sync():
+    """Apply a batch of punches queued offline; returns one result per punch"""
+    user = User.get_by_email(session['user_email'])
+    if not user:
+        return jsonify({'success': False, 'message': 'Usuário não encontrado'}), 404
+    
+    payload = request.get_json(silent=True) or {}
+    punches = payload.get('punches')
+    if not isinstance(punches, list):
+        return jsonify({'success': False, 'message': 'Requisição inválida.'}), 400
+    if len(punches) > Config.PUNCH_SYNC_MAX_BATCH:
+        return jsonify({'success': False, 'message': f'Envie no máximo {Config.PUNCH_SYNC_MAX_BATCH} registros por vez.'}), 413
+    
+    return jsonify({'success': True, 'results': sync_punches(user, punches)})
+
 @bp.route('/history')
 @login_required
+@admission_required('page')
 def history():
     """View timesheet history"""
     user = User.get_by_email(session['user_email'])
@@ -136,9 +140,11 @@ def history():
     
     timesheets = Timesheet.get_by_user_date_range(user.user_id, start_date, end_date)
     
-    # Calculate totals
+    # Calculate totals from the rows already loaded; a day counts as worked
+    # when it has time on it, as in the rollups
     total_hours = sum(ts.total_hours or 0 for ts in timesheets)
-    expected_hours = len(timesheets) * 8  # Assuming 8 hours per day
+    days_worked = sum(1 for ts in timesheets if ts.total_hours)
+    expected_hours = days_worked * 8  # Assuming 8 hours per day
     overtime_hours = max(0, total_hours - expected_hours)
     
     return render_template('history.html',
@@ -152,6 +158,7 @@ def history():
 
 @bp.route('/reports')
 @login_required
+@admission_required('page')
 def reports():
     """Generate and view reports"""
     user = User.get_by_email(session['user_email'])
@@ -168,11 +175,13 @@ def reports():
     
     timesheets = Timesheet.get_by_user_date_range(user.user_id, start_of_month, end_of_month)
     
-    # Prepare data for charts
+    # Prepare data for charts (hours and overtime computed over the whole month at once)
+    from app.services.report_engine import DailyTable
+    table = DailyTable.from_timesheets(ts for ts in timesheets if ts.total_hours)
     chart_data = {
-        'dates': [ts.date.strftime('%Y-%m-%d') for ts in timesheets if ts.total_hours],
-        'hours': [ts.total_hours for ts in timesheets if ts.total_hours],
-        'overtime': [ts.calculate_overtime() for ts in timesheets if ts.total_hours]
+        'dates': [day.strftime('%Y-%m-%d') for day in table.dates()],
+        'hours': table.hours().tolist(),
+        'overtime': (table.overtime_minutes() / 60).tolist()
     }
     
     return render_template('reports.html',
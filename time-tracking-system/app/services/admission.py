@@ -0,0 +1,158 @@
+from flask import jsonify
+from app.services.metrics import metrics
+from config.settings import Config
+import itertools
+import threading
+import time
+
+# Admission control for the clock-in surge.
+#
+# Every request to a guarded route takes a slot before it runs. Each route
+# class has its own concurrency limit inside a per-worker total; when no slot
+# is free the request waits in a short queue, punches ahead of page renders,
+# and gives up after ADMISSION_MAX_WAIT_MS. A request that cannot be admitted
+# gets a 503 with Retry-After right away instead of holding a worker thread
+# while Firestore is slow. Every decision is counted in the metrics registry.
+
+# Route class -> (priority, lower runs first; config attribute with its limit)
+ROUTE_CLASSES = {
+    'punch': (0, 'ADMISSION_PUNCH_LIMIT'),
+    'page': (1, 'ADMISSION_PAGE_LIMIT'),
+}
+
+class _Waiter:
+    __slots__ = ('route_class', 'priority', 'order', 'evicted')
+
+    def __init__(self, route_class, priority, order):
+        self.route_class = route_class
+        self.priority = priority
+        self.order = order
+        self.evicted = False
+
+class AdmissionController:
+    """Per-class concurrency limits within a total, with a bounded priority queue.
+
+    limits maps each route class to its concurrency limit; max_active caps
+    all classes together. At most queue_size requests wait, for at most
+    max_wait seconds. When the queue is full, a request evicts the newest
+    waiter of a lower priority, if there is one.
+    """
+
+    def __init__(self, limits, max_active, queue_size, max_wait):
+        self.limits = dict(limits)
+        self.max_active = max_active
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._active = dict.fromkeys(self.limits, 0)
+        self._waiting = []
+        self._order = itertools.count()
+
+    def _has_room(self, route_class):
+        return (sum(self._active.values()) < self.max_active
+                and self._active[route_class] < self.limits[route_class])
+
+    def _next_waiter(self):
+        """Best-ranked waiter that could start now"""
+        for waiter in sorted(self._waiting, key=lambda w: (w.priority, w.order)):
+            if self._has_room(waiter.route_class):
+                return waiter
+        return None
+
+    def acquire(self, route_class):
+        """Take a slot; returns None when admitted, or the rejection reason"""
+        priority = ROUTE_CLASSES[route_class][0]
+        started = time.monotonic()
+        with self._cond:
+            if not self._waiting and self._has_room(route_class):
+                self._active[route_class] += 1
+                metrics.increment('admission.admitted', route_class=route_class, queued='no')
+                return None
+
+            if len(self._waiting) >= self.queue_size:
+                lower = [w for w in self._waiting if w.priority > priority]
+                if not lower:
+                    metrics.increment('admission.rejected', route_class=route_class, reason='queue_full')
+                    return 'queue_full'
+                victim = max(lower, key=lambda w: (w.priority, w.order))
+                victim.evicted = True
+                self._waiting.remove(victim)
+                self._cond.notify_all()
+
+            waiter = _Waiter(route_class, priority, next(self._order))
+            self._waiting.append(waiter)
+            deadline = started + self.max_wait
+            while True:
+                if waiter.evicted:
+                    reason = 'evicted'
+                    break
+                if self._next_waiter() is waiter:
+                    self._waiting.remove(waiter)
+                    self._active[route_class] += 1
+                    metrics.increment('admission.admitted', route_class=route_class, queued='yes')
+                    metrics.observe('admission.wait_seconds', time.monotonic() - started, route_class=route_class)
+                    # Someone else may fit in what is left
+                    self._cond.notify_all()
+                    return None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiting.remove(waiter)
+                    reason = 'timeout'
+                    break
+                self._cond.wait(remaining)
+
+        metrics.increment('admission.rejected', route_class=route_class, reason=reason)
+        return reason
+
+    def release(self, route_class):
+        """Give back a slot taken by acquire()"""
+        with self._cond:
+            self._active[route_class] -= 1
+            self._cond.notify_all()
+
+    def state(self):
+        """Active and waiting requests per route class"""
+        with self._cond:
+            return {
+                route_class: {
+                    'active': self._active[route_class],
+                    'waiting': sum(1 for w in self._waiting if w.route_class == route_class),
+                    'limit': self.limits[route_class],
+                }
+                for route_class in self.limits
+            }
+
+admission_controller = AdmissionController(
+    limits={route_class: getattr(Config, setting) for route_class, (_, setting) in ROUTE_CLASSES.items()},
+    max_active=Config.ADMISSION_MAX_ACTIVE,
+    queue_size=Config.ADMISSION_QUEUE_SIZE,
+    max_wait=Config.ADMISSION_MAX_WAIT_MS / 1000
+)
+
+def _overloaded(json_response):
+    message = 'Sistema sobrecarregado. Tente novamente em alguns segundos.'
+    headers = {'Retry-After': str(Config.ADMISSION_RETRY_AFTER)}
+    if json_response:
+        return jsonify({'success': False, 'message': message}), 503, headers
+    return message, 503, headers
+
+def admission_required(route_class, json_response=False):
+    """Decorator to run a route only once the admission controller lets it in"""
+    if route_class not in ROUTE_CLASSES:
+        raise ValueError(f"Unknown route class: {route_class}")
+
+    def decorator(f):
+        def decorated_function(*args, **kwargs):
+            if not Config.ADMISSION_ENABLED:
+                return f(*args, **kwargs)
+
+            reason = admission_controller.acquire(route_class)
+            if reason:
+                return _overloaded(json_response)
+            try:
+                return f(*args, **kwargs)
+            finally:
+                admission_controller.release(route_class)
+        decorated_function.__name__ = f.__name__
+        return decorated_function
+    return decorator
@@ -0,0 +1,147 @@
+from concurrent.futures import ThreadPoolExecutor
+from google.api_core.exceptions import ClientError
+from app.storage import get_deadline
+from config.settings import Config
+from itertools import islice
+import threading
+import time
+
+# Batched bulk writes.
+#
+# Operations are grouped into WriteBatch commits of up to 500 writes (the
+# Firestore limit), committed by a few threads in parallel and paced by a
+# ramp-up limiter, so a migration over 100k documents needs a few hundred
+# commits instead of 100k round trips. Every operation gets its own result.
+
+MAX_BATCH_SIZE = 500
+
+# Operation kinds: set() / set(merge=True) / create() / update() / delete()
+WRITE_KINDS = ('set', 'merge', 'create', 'update', 'delete')
+
+class RampUpLimiter:
+    """Throughput limit following Firestore's 500/50/5 ramp-up rule.
+
+    Starts at ``initial`` operations per second and grows by 50% every five
+    minutes, up to ``maximum``. An initial rate of 0 disables the limit.
+    """
+
+    def __init__(self, initial, maximum, step_seconds=300):
+        self.initial = initial
+        self.maximum = maximum
+        self.step_seconds = step_seconds
+        self._started = None
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def rate(self, now):
+        steps = int((now - self._started) // self.step_seconds)
+        rate = self.initial * 1.5 ** steps
+        return min(rate, self.maximum) if self.maximum else rate
+
+    def acquire(self, count):
+        """Block until ``count`` more operations fit in the current rate"""
+        if not self.initial:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if self._started is None:
+                self._started = self._next = now
+            start = max(now, self._next)
+            self._next = start + count / self.rate(start)
+        if start > now:
+            time.sleep(start - now)
+
+_shared_limiter = None
+_shared_lock = threading.Lock()
+
+def shared_limiter():
+    """Process-wide ramp-up limiter, so concurrent bulk writes share one budget.
+
+    The ramp-up is counted from the first bulk write of the process.
+    """
+    global _shared_limiter
+    if _shared_limiter is None:
+        with _shared_lock:
+            if _shared_limiter is None:
+                _shared_limiter = RampUpLimiter(Config.BULK_WRITE_INITIAL_RATE, Config.BULK_WRITE_MAX_RATE)
+    return _shared_limiter
+
+class BulkWriter:
+    """Apply many (kind, collection_name, doc_id, data) operations in batches.
+
+    doc_id may be None for 'set' and 'create' to get a generated ID. Each
+    batch commits atomically. If Firestore rejects a batch (a create that
+    already exists, an update of a missing document...), its operations are
+    retried one by one so that only the offending ones fail. Server errors and
+    timeouts fail the whole batch without a retry, because the writes may have
+    been applied.
+    """
+
+    def __init__(self, db, batch_size=None, workers=None, limiter=None):
+        self.db = db
+        self.batch_size = min(batch_size or MAX_BATCH_SIZE, MAX_BATCH_SIZE)
+        self.workers = workers or Config.BULK_WRITE_WORKERS
+        self.limiter = limiter or shared_limiter()
+
+    def _prepare(self, operations):
+        """Resolve document references, generating IDs where none was given"""
+        prepared = []
+        for kind, collection_name, doc_id, data in operations:
+            if kind not in WRITE_KINDS:
+                raise ValueError(f"Invalid write kind: {kind}")
+            prepared.append((kind, self.db.collection(collection_name).document(doc_id), data))
+        return prepared
+
+    def _commit(self, prepared):
+        batch = self.db.batch()
+        for kind, reference, data in prepared:
+            if kind == 'set':
+                batch.set(reference, data)
+            elif kind == 'merge':
+                batch.set(reference, data, merge=True)
+            elif kind == 'create':
+                batch.create(reference, data)
+            elif kind == 'update':
+                batch.update(reference, data)
+            else:
+                batch.delete(reference)
+        batch.commit(timeout=get_deadline())
+
+    def _write_chunk(self, prepared):
+        self.limiter.acquire(len(prepared))
+        try:
+            self._commit(prepared)
+            return [{'id': reference.id, 'success': True, 'error': None} for _, reference, _ in prepared]
+        except ClientError as e:
+            if len(prepared) == 1:
+                return [{'id': prepared[0][1].id, 'success': False, 'error': str(e)}]
+        except Exception as e:
+            return [{'id': reference.id, 'success': False, 'error': str(e)} for _, reference, _ in prepared]
+
+        # The batch was rejected as a whole: find the operations that caused it
+        results = []
+        for operation in prepared:
+            try:
+                self._commit([operation])
+                results.append({'id': operation[1].id, 'success': True, 'error': None})
+            except Exception as e:
+                results.append({'id': operation[1].id, 'success': False, 'error': str(e)})
+        return results
+
+    def write(self, operations):
+        """Apply operations (any iterable, consumed lazily); returns results in input order"""
+        operations = iter(operations)
+        results = []
+        in_flight = []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while True:
+                chunk = list(islice(operations, self.batch_size))
+                if not chunk:
+                    break
+                in_flight.append(executor.submit(self._write_chunk, self._prepare(chunk)))
+                # Bound the operations held in memory to a few batches per worker
+                while len(in_flight) >= self.workers * 2:
+                    results.extend(in_flight.pop(0).result())
+            for future in in_flight:
+                results.extend(future.result())
+        return results
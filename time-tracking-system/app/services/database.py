@@ -1,46 +1,18 @@
-from firebase_admin import credentials, firestore, initialize_app
-import firebase_admin
-import os
-import json
+from app.services.firestore_client import initialize_firebase
+from app.storage import get_db, get_deadline, IN_QUERY_LIMIT
+from app.utils.helpers import chunked
 
 class FirebaseService:
     """Firebase Database Service for the Time Tracking System"""
     
-    def __init__(self):
-        self.db = None
-        self.initialize_firebase()
-
     def initialize_firebase(self):
         """Initialize Firebase Admin SDK"""
-        if not firebase_admin._apps:
-            try:
-                # Try to use environment variables for Firebase config
-                firebase_config = {
-                    "type": "service_account",
-                    "project_id": os.environ.get('FIREBASE_PROJECT_ID'),
-                    "private_key_id": os.environ.get('FIREBASE_PRIVATE_KEY_ID'),
-                    "private_key": os.environ.get('FIREBASE_PRIVATE_KEY', '').replace('\\n', '\n'),
-                    "client_email": os.environ.get('FIREBASE_CLIENT_EMAIL'),
-                    "client_id": os.environ.get('FIREBASE_CLIENT_ID'),
-                    "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-                    "token_uri": "https://oauth2.googleapis.com/token",
-                    "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
-                    "client_x509_cert_url": os.environ.get('FIREBASE_CLIENT_CERT_URL')
-                }
-                
-                # Only initialize if we have the required config
-                if firebase_config["project_id"] and firebase_config["private_key"]:
-                    cred = credentials.Certificate(firebase_config)
-                    initialize_app(cred)
-                    self.db = firestore.client()
-                    print("Firebase initialized successfully")
-                else:
-                    print("Firebase config incomplete, using mock mode")
-                    self.db = None
-                    
-            except Exception as e:
-                print(f"Firebase initialization failed: {e}")
-                self.db = None
+        initialize_firebase()
+
+    @property
+    def db(self):
+        """Configured storage backend (Firestore or SQLite; None in Firestore mock mode)"""
+        return get_db()
 
     def get_collection(self, collection_name):
         """Get a Firestore collection reference"""
@@ -52,18 +24,38 @@ class FirebaseService:
         """Add a document to a collection"""
         try:
             if self.db:
-                doc_ref = self.db.collection(collection_name).add(data)
+                doc_ref = self.db.collection(collection_name).add(data, timeout=get_deadline())
                 return doc_ref[1].id
             return None
         except Exception as e:
             print(f"Error adding document: {e}")
             return None
 
+    def bulk_write(self, operations):
+        """Apply many writes in batches of up to 500 operations.
+
+        operations is an iterable of (kind, collection_name, doc_id, data)
+        tuples, kind being 'set', 'merge', 'create', 'update' or 'delete'.
+        Returns one {'id', 'success', 'error'} result per operation, in order.
+        """
+        try:
+            if self.db:
+                from app.services.bulk_writer import BulkWriter
+                return BulkWriter(self.db).write(operations)
+            return []
+        except Exception as e:
+            print(f"Error in bulk write: {e}")
+            return []
+
+    def bulk_add_documents(self, collection_name, documents):
+        """Add many documents with generated IDs; returns per-document results"""
+        return self.bulk_write(('create', collection_name, None, data) for data in documents)
+
     def get_document(self, collection_name, doc_id):
         """Get a document by ID"""
         try:
             if self.db:
-                doc = self.db.collection(collection_name).document(doc_id).get()
+                doc = self.db.collection(collection_name).document(doc_id).get(timeout=get_deadline())
                 if doc.exists:
                     return doc.to_dict()
             return None
@@ -72,10 +64,10 @@ class FirebaseService:
             return None
 
     def update_document(self, collection_name, doc_id, data):
-        """Update a document"""
+        """Update the given fields of a document, leaving the other fields as they are"""
         try:
             if self.db:
-                self.db.collection(collection_name).document(doc_id).set(data)
+                self.db.collection(collection_name).document(doc_id).set(data, merge=True, timeout=get_deadline())
                 return True
             return False
         except Exception as e:
@@ -86,22 +78,24 @@ class FirebaseService:
         """Delete a document"""
         try:
             if self.db:
-                self.db.collection(collection_name).document(doc_id).delete()
+                self.db.collection(collection_name).document(doc_id).delete(timeout=get_deadline())
                 return True
             return False
         except Exception as e:
             print(f"Error deleting document: {e}")
             return False
 
-    def query_collection(self, collection_name, field, operator, value, limit=None):
-        """Query a collection with filters"""
+    def query_collection(self, collection_name, field, operator, value, limit=None, fields=None):
+        """Query a collection with filters; ``fields`` limits the returned fields"""
         try:
             if self.db:
                 query = self.db.collection(collection_name).where(field, operator, value)
+                if fields is not None:
+                    query = query.select(list(fields))
                 if limit:
                     query = query.limit(limit)
                 
-                docs = query.stream()
+                docs = query.stream(timeout=get_deadline())
                 results = []
                 for doc in docs:
                     data = doc.to_dict()
@@ -113,11 +107,32 @@ class FirebaseService:
             print(f"Error querying collection: {e}")
             return []
 
-    def get_all_documents(self, collection_name):
-        """Get all documents from a collection"""
+    def query_in(self, collection_name, field, values, fields=None):
+        """Get the documents whose field is one of values, IN_QUERY_LIMIT values per query"""
+        try:
+            results = []
+            if self.db:
+                for chunk in chunked(dict.fromkeys(values), IN_QUERY_LIMIT):
+                    query = self.db.collection(collection_name).where(field, 'in', chunk)
+                    if fields is not None:
+                        query = query.select(list(fields))
+                    for doc in query.stream(timeout=get_deadline()):
+                        data = doc.to_dict()
+                        data['id'] = doc.id
+                        results.append(data)
+            return results
+        except Exception as e:
+            print(f"Error querying collection: {e}")
+            return []
+
+    def get_all_documents(self, collection_name, fields=None):
+        """Get all documents from a collection; ``fields`` limits the returned fields"""
         try:
             if self.db:
-                docs = self.db.collection(collection_name).stream()
+                query = self.db.collection(collection_name)
+                if fields is not None:
+                    query = query.select(list(fields))
+                docs = query.stream(timeout=get_deadline())
                 results = []
                 for doc in docs:
                     data = doc.to_dict()
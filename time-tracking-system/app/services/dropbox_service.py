@@ -1,33 +1,209 @@
-import dropbox
-from dropbox.exceptions import AuthError, ApiError
-import os
+from app.services.metrics import metrics
+from config.settings import Config
 from datetime import datetime
+import threading
+import time
+import os
 import uuid
 
+class DropboxUploadStream:
+    """Write-only stream that uploads to Dropbox through an upload session.
+
+    Data passed to write() is buffered and sent in chunk_size pieces as soon as
+    a full chunk is available, so a file of any size can be uploaded while it
+    is being produced without ever holding it in memory. upload() sends data
+    that is already in memory with a single call instead. Each request is
+    retried on its own, but the waits between retries of one upload are capped
+    at retry_seconds in total, since uploads run on request threads too.
+    Throughput is reported when the upload is committed.
+    """
+    
+    def __init__(self, dbx, dropbox_path, chunk_size=None, max_retries=None, retry_seconds=None):
+        self.dbx = dbx
+        self.dropbox_path = dropbox_path
+        self.chunk_size = chunk_size or Config.DROPBOX_UPLOAD_CHUNK_SIZE
+        self.max_retries = Config.DROPBOX_UPLOAD_RETRIES if max_retries is None else max_retries
+        self.retry_seconds = Config.DROPBOX_UPLOAD_RETRY_SECONDS if retry_seconds is None else retry_seconds
+        self.retry_wait = 0.0
+        self.session_id = None
+        self.offset = 0
+        self.chunks = 0
+        self.retries = 0
+        self.stats = None
+        self._started_at = None
+        self._buffer = bytearray()
+    
+    def write(self, data):
+        """Queue data for upload, sending every full chunk"""
+        if self._started_at is None:
+            self._started_at = time.monotonic()
+        self._buffer += data
+        while len(self._buffer) >= self.chunk_size:
+            chunk = bytes(self._buffer[:self.chunk_size])
+            del self._buffer[:self.chunk_size]
+            self._send(chunk)
+    
+    def _with_retries(self, call, chunk):
+        """Run one request, retrying transient failures with backoff within the retry budget"""
+        from dropbox.exceptions import ApiError, InternalServerError, RateLimitError
+        import requests
+
+        attempt = 0
+        while True:
+            try:
+                return call()
+            except ApiError as e:
+                # A retried append can find the previous attempt already landed
+                error = e.error
+                if (attempt and hasattr(error, 'is_incorrect_offset') and error.is_incorrect_offset()
+                        and error.get_incorrect_offset().correct_offset == self.offset + len(chunk)):
+                    return None
+                raise
+            except (InternalServerError, RateLimitError, requests.exceptions.RequestException) as e:
+                backoff = getattr(e, 'backoff', None) or 2 ** (attempt + 1)
+                if attempt >= self.max_retries or self.retry_wait + backoff > self.retry_seconds:
+                    # Fail fast rather than hold the calling thread any longer
+                    metrics.increment('dropbox.upload.retries_exhausted')
+                    raise
+                attempt += 1
+                self.retries += 1
+                self.retry_wait += backoff
+                metrics.increment('dropbox.upload.chunk_retries')
+                print(f"Dropbox chunk upload failed ({e}), retry {attempt}/{self.max_retries} in {backoff}s")
+                time.sleep(backoff)
+    
+    def _send(self, chunk):
+        from dropbox.files import UploadSessionCursor
+
+        if self.session_id is None:
+            result = self._with_retries(lambda: self.dbx.files_upload_session_start(chunk), chunk)
+            self.session_id = result.session_id
+        else:
+            cursor = UploadSessionCursor(session_id=self.session_id, offset=self.offset)
+            self._with_retries(lambda: self.dbx.files_upload_session_append_v2(chunk, cursor), chunk)
+        self.offset += len(chunk)
+        self.chunks += 1
+    
+    def _upload_single(self, data):
+        from dropbox.files import WriteMode
+
+        self._with_retries(lambda: self.dbx.files_upload(
+            data,
+            self.dropbox_path,
+            mode=WriteMode('overwrite'),
+            autorename=True
+        ), data)
+        self.offset += len(data)
+        self.chunks += 1
+    
+    def upload(self, data):
+        """Upload data already in memory with one files_upload call (max 150 MB) and return its Dropbox path"""
+        self._started_at = time.monotonic()
+        self._upload_single(bytes(data))
+        self._record_stats()
+        return self.dropbox_path
+    
+    def close(self):
+        """Send the remaining data, commit the file and return its Dropbox path"""
+        from dropbox.files import CommitInfo, UploadSessionCursor, WriteMode
+
+        if self._started_at is None:
+            self._started_at = time.monotonic()
+        remaining = bytes(self._buffer)
+        self._buffer.clear()
+        
+        if self.session_id is None:
+            # Small file: a single upload call is enough
+            self._upload_single(remaining)
+        else:
+            cursor = UploadSessionCursor(session_id=self.session_id, offset=self.offset)
+            commit = CommitInfo(
+                path=self.dropbox_path,
+                mode=WriteMode('overwrite'),
+                autorename=True
+            )
+            self._with_retries(lambda: self.dbx.files_upload_session_finish(remaining, cursor, commit), remaining)
+            self.offset += len(remaining)
+            self.chunks += 1
+        
+        self._record_stats()
+        return self.dropbox_path
+    
+    def _record_stats(self):
+        elapsed = max(time.monotonic() - self._started_at, 1e-6)
+        throughput = self.offset / elapsed / (1024 * 1024)
+        self.stats = {
+            'bytes': self.offset,
+            'chunks': self.chunks,
+            'retries': self.retries,
+            'seconds': elapsed,
+            'mb_per_second': throughput
+        }
+        mode = 'session' if self.session_id else 'single'
+        metrics.increment('dropbox.upload.bytes', self.offset, mode=mode)
+        metrics.observe('dropbox.upload.seconds', elapsed, mode=mode)
+        metrics.observe('dropbox.upload.mb_per_second', throughput, mode=mode)
+        print(f"Dropbox upload of {self.dropbox_path}: {self.offset / (1024 * 1024):.1f} MB "
+              f"in {elapsed:.1f}s ({throughput:.2f} MB/s, {self.chunks} chunks, {self.retries} retries)")
+
 class DropboxService:
+    """Dropbox file storage.
+
+    The SDK is imported and the client created on first use, not at import
+    time, so booting a worker costs no Dropbox round trip. warm_up() verifies
+    the connection ahead of the first request when that is preferred.
+    """
+    
     def __init__(self):
         self.access_token = os.environ.get('DROPBOX_ACCESS_TOKEN')
-        self.dbx = None
-        self.initialize_dropbox()
+        self._dbx = None
+        self._initialized = False
+        self._lock = threading.Lock()
     
-    def initialize_dropbox(self):
-        """Initialize Dropbox client"""
-        if self.access_token:
-            try:
-                self.dbx = dropbox.Dropbox(self.access_token)
+    @property
+    def dbx(self):
+        """Dropbox client, created on first access (None in mock mode)"""
+        if not self._initialized:
+            with self._lock:
+                if not self._initialized:
+                    self.initialize_dropbox(verify=False)
+        return self._dbx
+    
+    @dbx.setter
+    def dbx(self, value):
+        self._dbx = value
+        self._initialized = True
+    
+    def initialize_dropbox(self, verify=True):
+        """Initialize Dropbox client, optionally testing the connection"""
+        if not self.access_token:
+            print("Warning: Dropbox access token not found - using mock mode")
+            self.dbx = None
+            return
+        
+        import dropbox
+        from dropbox.exceptions import AuthError
+        
+        try:
+            dbx = dropbox.Dropbox(self.access_token)
+            if verify:
                 # Test connection
-                self.dbx.users_get_current_account()
+                dbx.users_get_current_account()
                 print("Dropbox connection successful")
-            except AuthError as e:
-                print(f"Dropbox authentication error: {e}")
-                self.dbx = None
-            except Exception as e:
-                print(f"Dropbox initialization error: {e}")
-                self.dbx = None
-        else:
-            print("Warning: Dropbox access token not found - using mock mode")
+            self.dbx = dbx
+        except AuthError as e:
+            print(f"Dropbox authentication error: {e}")
+            self.dbx = None
+        except Exception as e:
+            print(f"Dropbox initialization error: {e}")
             self.dbx = None
     
+    def warm_up(self):
+        """Create the client and check the connection now; True when connected"""
+        with self._lock:
+            self.initialize_dropbox(verify=True)
+        return self._dbx is not None
+    
     def upload_file(self, file_content, filename, folder_path="/uploads"):
         """Upload file to Dropbox and return public URL"""
         if not self.dbx:
@@ -36,108 +212,76 @@ class DropboxService:
         
         try:
             # Create unique filename
-            file_extension = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
             unique_filename = f"{uuid.uuid4()}_{filename}"
             dropbox_path = f"{folder_path}/{unique_filename}"
             
-            # Upload file
-            self.dbx.files_upload(
-                file_content,
-                dropbox_path,
-                mode=dropbox.files.WriteMode('overwrite'),
-                autorename=True
-            )
+            # Upload file; large payloads go through a chunked upload session
+            # instead of one files_upload call (capped at 150 MB)
+            if len(file_content) > Config.DROPBOX_UPLOAD_SESSION_THRESHOLD:
+                stream = DropboxUploadStream(self.dbx, dropbox_path)
+                content = memoryview(file_content)
+                for start in range(0, len(content), stream.chunk_size):
+                    stream.write(content[start:start + stream.chunk_size])
+                stream.close()
+            else:
+                DropboxUploadStream(self.dbx, dropbox_path).upload(file_content)
             
             # Create shared link
-            try:
-                shared_link = self.dbx.sharing_create_shared_link_with_settings(dropbox_path)
-                # Convert to direct download link
-                return shared_link.url.replace('dl=0', 'dl=1')
-            except Exception as e:
-                print(f"Error creating shared link: {e}")
-                return None
+            return self.create_shared_link(dropbox_path)
                 
         except Exception as e:
             print(f"Error uploading file to Dropbox: {e}")
             return None
     
-    def upload_user_photo(self, file_content, user_email, filename):
-        """Upload user profile photo"""
-        folder_path = f"/profile_photos/{user_email}"
-        return self.upload_file(file_content, filename, folder_path)
-    
-    def upload_report(self, file_content, filename):
-        """Upload report file"""
-        folder_path = f"/reports/{datetime.now().strftime('%Y/%m')}"
-        return self.upload_file(file_content, filename, folder_path)
-    
-    def delete_file(self, file_path):
-        """Delete file from Dropbox"""
-        if not self.dbx:
-            return True  # Mock mode
-        
+    def create_shared_link(self, dropbox_path):
+        """Create (or reuse) a shared link and return it as a direct download URL"""
+        from dropbox.exceptions import ApiError
+
         try:
-            self.dbx.files_delete_v2(file_path)
-            return True
+            shared_link = self.dbx.sharing_create_shared_link_with_settings(dropbox_path)
+            # Convert to direct download link
+            return shared_link.url.replace('dl=0', 'dl=1')
+        except ApiError as e:
+            # If shared link already exists, get existing one
+            if 'shared_link_already_exists' in str(e):
+                try:
+                    links = self.dbx.sharing_list_shared_links(path=dropbox_path)
+                    if links.links:
+                        return links.links[0].url.replace('dl=0', 'dl=1')
+                except Exception as list_error:
+                    print(f"Error listing shared links: {list_error}")
+            print(f"Error creating shared link: {e}")
+            return None
         except Exception as e:
-            print(f"Error deleting file from Dropbox: {e}")
-            return False
+            print(f"Error creating shared link: {e}")
+            return None
     
-    def list_files(self, folder_path="/"):
-        """List files in Dropbox folder"""
+    def open_upload_stream(self, filename, folder_path="/uploads"):
+        """Start a streamed upload; returns a DropboxUploadStream or None in mock mode"""
         if not self.dbx:
-            return []  # Mock mode
+            return None
         
-        try:
-            result = self.dbx.files_list_folder(folder_path)
-            files = []
-            for entry in result.entries:
-                if isinstance(entry, dropbox.files.FileMetadata):
-                    files.append({
-                        'name': entry.name,
-                        'path': entry.path_lower,
-                        'size': entry.size,
-                        'modified': entry.server_modified
-                    })
-            return files
-        except Exception as e:
-            print(f"Error listing files from Dropbox: {e}")
-            return []
+        unique_filename = f"{uuid.uuid4()}_{filename}"
+        dropbox_path = f"{folder_path}/{unique_filename}"
+        return DropboxUploadStream(self.dbx, dropbox_path)
     
-    def is_connected(self):
-        """Check if Dropbox is connected"""
-        return self.dbx is not None
-
-# Create global instance
-dropbox_service = DropboxService()
-            
-            # Create shared link
-            try:
-                shared_link = self.dbx.sharing_create_shared_link_with_settings(
-                    dropbox_path,
-                    settings=dropbox.sharing.SharedLinkSettings(
-                        requested_visibility=dropbox.sharing.RequestedVisibility.public
-                    )
-                )
-                # Convert to direct download link
-                download_url = shared_link.url.replace('?dl=0', '?dl=1')
-                return download_url
-            except ApiError as e:
-                # If shared link already exists, get existing one
-                if 'shared_link_already_exists' in str(e):
-                    links = self.dbx.sharing_list_shared_links(path=dropbox_path)
-                    if links.links:
-                        download_url = links.links[0].url.replace('?dl=0', '?dl=1')
-                        return download_url
-                raise e
-                
+    def finish_upload_stream(self, stream):
+        """Commit a streamed upload and return its public URL (None on failure)"""
+        try:
+            dropbox_path = stream.close()
         except Exception as e:
-            print(f"Error uploading file to Dropbox: {e}")
+            print(f"Error finishing Dropbox upload session: {e}")
             return None
+        return self.create_shared_link(dropbox_path)
+    
+    def open_report_stream(self, filename):
+        """Start a streamed upload of a report file"""
+        folder_path = f"/reports/{datetime.now().strftime('%Y/%m')}"
+        return self.open_upload_stream(filename, folder_path)
     
     def upload_user_photo(self, file_content, user_email, filename):
         """Upload user profile photo"""
-        folder_path = f"/user_photos/{user_email}"
+        folder_path = f"/profile_photos/{user_email}"
         return self.upload_file(file_content, filename, folder_path)
     
     def upload_report(self, file_content, filename):
@@ -148,7 +292,7 @@ dropbox_service = DropboxService()
     def delete_file(self, file_path):
         """Delete file from Dropbox"""
         if not self.dbx:
-            return False
+            return True  # Mock mode
         
         try:
             self.dbx.files_delete_v2(file_path)
@@ -157,16 +301,18 @@ dropbox_service = DropboxService()
             print(f"Error deleting file from Dropbox: {e}")
             return False
     
-    def list_files(self, folder_path="/uploads"):
-        """List files in a folder"""
+    def list_files(self, folder_path="/"):
+        """List files in Dropbox folder"""
         if not self.dbx:
-            return []
+            return []  # Mock mode
+        
+        from dropbox.files import FileMetadata
         
         try:
             result = self.dbx.files_list_folder(folder_path)
             files = []
             for entry in result.entries:
-                if isinstance(entry, dropbox.files.FileMetadata):
+                if isinstance(entry, FileMetadata):
                     files.append({
                         'name': entry.name,
                         'path': entry.path_lower,
@@ -177,12 +323,12 @@ dropbox_service = DropboxService()
         except Exception as e:
             print(f"Error listing files from Dropbox: {e}")
             return []
-    
+
     def get_file_info(self, file_path):
         """Get file metadata"""
         if not self.dbx:
             return None
-        
+
         try:
             metadata = self.dbx.files_get_metadata(file_path)
             return {
@@ -195,5 +341,9 @@ dropbox_service = DropboxService()
             print(f"Error getting file info from Dropbox: {e}")
             return None
 
-# Global Dropbox service instance
-dropbox_service = DropboxService()
\ No newline at end of file
+    def is_connected(self):
+        """Check if Dropbox is connected"""
+        return self.dbx is not None
+
+# Create global instance
+dropbox_service = DropboxService()
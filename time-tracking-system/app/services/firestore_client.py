@@ -0,0 +1,205 @@
+from config.settings import Config
+import logging
+import threading
+import os
+
+# Process-wide Firestore client registry.
+#
+# Every model and service gets its client from get_db() instead of calling
+# initialize_firebase() + firestore.client() per operation. The client (and its
+# gRPC channel) is created lazily on first use, kept alive with keepalive pings
+# and rebuilt in a forked child, since gRPC channels must not cross a fork.
+# firebase_admin and google.cloud.firestore are imported on first use as well,
+# so importing the app (and booting a gunicorn worker) stays cheap.
+
+_lock = threading.RLock()
+_client = None
+_client_pid = None
+_thread_local = threading.local()
+_mock_mode_reported = False
+
+logger = logging.getLogger(__name__)
+
+def _firebase_config():
+    """Build the service account config from environment variables"""
+    return {
+        "type": "service_account",
+        "project_id": os.environ.get('FIREBASE_PROJECT_ID'),
+        "private_key_id": os.environ.get('FIREBASE_PRIVATE_KEY_ID'),
+        "private_key": os.environ.get('FIREBASE_PRIVATE_KEY', '').replace('\\n', '\n'),
+        "client_email": os.environ.get('FIREBASE_CLIENT_EMAIL'),
+        "client_id": os.environ.get('FIREBASE_CLIENT_ID'),
+        "auth_uri": "https://accounts.google.com/o/oauth2/auth",
+        "token_uri": "https://oauth2.googleapis.com/token",
+        "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
+        "client_x509_cert_url": os.environ.get('FIREBASE_CLIENT_CERT_URL')
+    }
+
+def initialize_firebase():
+    """Initialize the Firebase Admin app once per process.
+
+    Returns True when a Firebase app is available, False in mock mode.
+    """
+    import firebase_admin
+    from firebase_admin import credentials
+
+    if firebase_admin._apps:
+        return True
+
+    with _lock:
+        if firebase_admin._apps:
+            return True
+        try:
+            firebase_config = _firebase_config()
+
+            # Only initialize if we have the required config
+            if firebase_config["project_id"] and firebase_config["private_key"]:
+                cred = credentials.Certificate(firebase_config)
+                firebase_admin.initialize_app(cred)
+                return True
+        except Exception as e:
+            print(f"Firebase initialization failed: {e}")
+    return False
+
+def _channel_options():
+    """gRPC channel options used to keep the Firestore channel warm"""
+    keepalive_ms = Config.FIRESTORE_KEEPALIVE_MS
+    options = [
+        ('grpc.max_send_message_length', -1),
+        ('grpc.max_receive_message_length', -1),
+    ]
+    if keepalive_ms:
+        options += [
+            ('grpc.keepalive_time_ms', keepalive_ms),
+            ('grpc.keepalive_timeout_ms', min(keepalive_ms, 20000)),
+            ('grpc.keepalive_permit_without_calls', 1),
+            ('grpc.http2.max_pings_without_data', 0),
+        ]
+    return options
+
+def _apply_channel_options(client):
+    """Give a new Firestore client a gRPC channel built with _channel_options().
+
+    google-cloud-firestore has no public way to pass channel options (neither
+    Client nor ClientOptions accept them), so this fills in the same lazily
+    built attributes its own _firestore_api_helper() sets. Those attributes are
+    private, which is why google-cloud-firestore is pinned in requirements.txt;
+    if they are missing the client keeps the library's default channel, which
+    still sends keepalive pings every 30s but lacks the timeout settings.
+    """
+    required = ('_firestore_api_internal', '_target', '_credentials', '_client_options')
+    if any(not hasattr(client, name) for name in required) or client._firestore_api_internal is not None:
+        logger.warning("Firestore client has no channel hook to replace, using the default gRPC channel options")
+        return False
+
+    try:
+        from google.cloud.firestore_v1.services.firestore import client as firestore_client_module
+        from google.cloud.firestore_v1.services.firestore.transports import grpc as firestore_grpc
+
+        transport_class = firestore_grpc.FirestoreGrpcTransport
+        channel = transport_class.create_channel(
+            client._target,
+            credentials=client._credentials,
+            options=_channel_options()
+        )
+        transport = transport_class(host=client._target, channel=channel)
+        client._transport = transport
+        client._firestore_api_internal = firestore_client_module.FirestoreClient(
+            transport=transport,
+            client_options=client._client_options
+        )
+        return True
+    except Exception as e:
+        logger.warning("Could not apply Firestore channel options, using the defaults: %s", e)
+        return False
+
+def _create_client():
+    """Create a Firestore client bound to the Firebase app credentials, as a StorageBackend"""
+    global _mock_mode_reported
+    if not initialize_firebase():
+        if not _mock_mode_reported:
+            print("Firebase config incomplete, using mock mode")
+            _mock_mode_reported = True
+        return None
+
+    import firebase_admin
+    from google.cloud import firestore
+
+    app = firebase_admin.get_app()
+    client = firestore.Client(
+        project=app.project_id,
+        credentials=app.credential.get_credential()
+    )
+
+    _apply_channel_options(client)
+
+    from app.storage.firestore_backend import FirestoreBackend
+    return FirestoreBackend(client)
+
+def _reset_after_fork():
+    """Drop clients inherited from the parent process"""
+    global _client, _client_pid, _lock, _thread_local
+    _lock = threading.RLock()
+    _client = None
+    _client_pid = None
+    _thread_local = threading.local()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+def get_db():
+    """Return the Firestore client for this process (None in mock mode).
+
+    With FIRESTORE_SHARE_CHANNEL enabled (the default) all threads share one
+    client and gRPC channel; otherwise each thread gets its own client.
+    """
+    global _client, _client_pid
+
+    if not Config.FIRESTORE_SHARE_CHANNEL:
+        if getattr(_thread_local, 'pid', None) != os.getpid():
+            _thread_local.client = _create_client()
+            _thread_local.pid = os.getpid()
+        return _thread_local.client
+
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+
+    with _lock:
+        if _client is None or _client_pid != pid:
+            _client = _create_client()
+            _client_pid = pid if _client is not None else None
+    return _client
+
+def get_deadline():
+    """Default deadline (seconds) applied to Firestore calls, or None"""
+    return Config.FIRESTORE_DEADLINE
+
+def iter_query(query, page_size=None):
+    """Stream the documents of an ordered query one page at a time.
+
+    Each page is a separate request resumed with start_after() on the last
+    snapshot, so only one page is held in memory and every page gets its own
+    deadline instead of one deadline for the whole scan.
+    """
+    page_size = page_size or Config.FIRESTORE_PAGE_SIZE
+    cursor = None
+    while True:
+        page = query.limit(page_size)
+        if cursor is not None:
+            page = page.start_after(cursor)
+
+        docs = list(page.stream(timeout=get_deadline()))
+        yield from docs
+
+        if len(docs) < page_size:
+            return
+        cursor = docs[-1]
+
+def reset_client():
+    """Discard the cached client(s) so the next get_db() builds a new one"""
+    global _client, _client_pid
+    with _lock:
+        _client = None
+        _client_pid = None
+    _thread_local.__dict__.clear()
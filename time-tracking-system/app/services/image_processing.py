@@ -0,0 +1,96 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from config.settings import Config
+from io import BytesIO
+import multiprocessing
+import threading
+import os
+
+_executor = None
+_executor_pid = None
+_lock = threading.Lock()
+
+class InvalidImage(Exception):
+    """Raised when a photo cannot be decoded as an image"""
+
+def normalize_image(file_content, sizes, image_format='WEBP', quality=80):
+    """Decode an image and re-encode it at each of the given sizes.
+
+    Orientation from EXIF is applied to the pixels and all metadata (EXIF, GPS,
+    ICC comments...) is dropped. Each size is a bounding box in pixels; the
+    aspect ratio is preserved and images are never upscaled.
+
+    Returns {size_name: encoded_bytes}. Runs in a worker process.
+    """
+    from PIL import Image, ImageOps
+
+    try:
+        with Image.open(BytesIO(file_content)) as original:
+            original.seek(0)  # First frame of animated images
+            image = ImageOps.exif_transpose(original)
+            has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+            image = image.convert('RGBA' if has_alpha else 'RGB')
+    except Exception as e:
+        # Not an image, truncated or a decompression bomb: retrying will not help
+        raise InvalidImage(str(e) or type(e).__name__)
+
+    results = {}
+    # Largest first, so each smaller size is resampled from the previous one
+    for name, max_px in sorted(sizes.items(), key=lambda item: item[1], reverse=True):
+        image.thumbnail((max_px, max_px), Image.LANCZOS)
+        output = BytesIO()
+        image.save(output, format=image_format, quality=quality, method=4)
+        results[name] = output.getvalue()
+    return results
+
+def _get_executor():
+    """Process pool for image work, created lazily and rebuilt after a fork"""
+    global _executor, _executor_pid
+    pid = os.getpid()
+    if _executor is not None and _executor_pid == pid:
+        return _executor
+
+    with _lock:
+        if _executor is None or _executor_pid != pid:
+            # spawn: never fork a multi-threaded web worker
+            _executor = ProcessPoolExecutor(
+                max_workers=Config.IMAGE_PROCESS_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            _executor_pid = pid
+    return _executor
+
+def _reset_executor():
+    """Drop a broken pool; the next call starts a new one"""
+    global _executor
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+            _executor = None
+
+def process_photo(file_content):
+    """Normalize a profile photo into PHOTO_SIZES in the process pool.
+
+    Returns {size_name: bytes}, or None when processing failed for a reason
+    worth retrying (timeout, broken pool, Pillow missing). Raises InvalidImage
+    when the file cannot be decoded. The original file is never a fallback:
+    it may carry EXIF/GPS metadata or not be an image at all.
+    """
+    try:
+        future = _get_executor().submit(
+            normalize_image,
+            file_content,
+            Config.PHOTO_SIZES,
+            Config.PHOTO_FORMAT,
+            Config.PHOTO_QUALITY
+        )
+        return future.result(timeout=Config.IMAGE_PROCESS_TIMEOUT)
+    except InvalidImage:
+        raise
+    except BrokenProcessPool as e:
+        print(f"Error processing image: {e}")
+        _reset_executor()
+        return None
+    except Exception as e:
+        print(f"Error processing image: {e}")
+        return None
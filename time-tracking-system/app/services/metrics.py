@@ -0,0 +1,56 @@
+import threading
+
+class Metrics:
+    """In-process counters and summaries (count/sum/min/max) keyed by name and labels.
+
+    Values are per worker process; snapshot() returns a plain dict that can be
+    logged or served as JSON.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._summaries = {}
+
+    @staticmethod
+    def _key(name, labels):
+        if not labels:
+            return name
+        label_str = ','.join(f'{k}={v}' for k, v in sorted(labels.items()))
+        return f'{name}{{{label_str}}}'
+
+    def increment(self, name, value=1, **labels):
+        """Add value to a counter"""
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """Record one observation of a value (latency, size, throughput...)"""
+        key = self._key(name, labels)
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                self._summaries[key] = {'count': 1, 'sum': value, 'min': value, 'max': value}
+            else:
+                summary['count'] += 1
+                summary['sum'] += value
+                summary['min'] = min(summary['min'], value)
+                summary['max'] = max(summary['max'], value)
+
+    def snapshot(self):
+        """Return a copy of all counters and summaries"""
+        with self._lock:
+            return {
+                'counters': dict(self._counters),
+                'summaries': {key: dict(value) for key, value in self._summaries.items()}
+            }
+
+    def reset(self):
+        """Clear every metric"""
+        with self._lock:
+            self._counters.clear()
+            self._summaries.clear()
+
+# Global metrics registry
+metrics = Metrics()
@@ -1,9 +1,24 @@
-from flask import current_app
-from firebase_admin import messaging
+from app.services.firestore_client import initialize_firebase
+from app.services.database import firebase_service
+from app.models.user import User
+from app.utils.helpers import chunked
+
+# User document field holding the user's FCM registration tokens
+TOKEN_FIELD = 'fcm_tokens'
+
+# Most messages firebase_admin sends in one batch call
+SEND_BATCH_SIZE = 500
+
+def _messaging():
+    """Import firebase_admin.messaging on first use, with the Firebase app initialized"""
+    from firebase_admin import messaging
+    initialize_firebase()
+    return messaging
 
 class NotificationService:
     @staticmethod
     def send_notification_to_user(user_id, title, body):
+        messaging = _messaging()
         # Logic to send a notification to a specific user
         message = messaging.Message(
             notification=messaging.Notification(
@@ -17,6 +32,7 @@ class NotificationService:
 
     @staticmethod
     def send_notification_to_group(group_id, title, body):
+        messaging = _messaging()
         # Logic to send a notification to a group of users
         # This would typically involve fetching user tokens from the database
         user_tokens = NotificationService.get_user_tokens_by_group(group_id)
@@ -34,6 +50,7 @@ class NotificationService:
 
     @staticmethod
     def send_global_notification(title, body):
+        messaging = _messaging()
         # Logic to send a global notification to all users
         # This would typically involve fetching all user tokens from the database
         user_tokens = NotificationService.get_all_user_tokens()
@@ -49,12 +66,63 @@ class NotificationService:
         response = messaging.send_all(messages)
         return response
 
+    @staticmethod
+    def _send_to_tokens(tokens, title, body):
+        """Send one notification to every token, SEND_BATCH_SIZE messages per call; returns the number sent"""
+        messaging = _messaging()
+        sent = 0
+        for chunk in chunked(list(dict.fromkeys(tokens)), SEND_BATCH_SIZE):
+            messages = [
+                messaging.Message(
+                    notification=messaging.Notification(
+                        title=title,
+                        body=body,
+                    ),
+                    token=token,
+                ) for token in chunk
+            ]
+            sent += messaging.send_all(messages).success_count
+        return sent
+
+    @staticmethod
+    def send_individual_notification(title, body, user_emails):
+        """Notify the given users; returns (notifications sent, emails not registered).
+
+        The users are resolved with one 'in' query per IN_QUERY_LIMIT emails,
+        and their tokens read the same way.
+        """
+        users = User.get_many_by_email(user_emails)
+        unknown = [email for email in dict.fromkeys(user_emails) if email not in users]
+        tokens = NotificationService.get_user_tokens(list(users))
+        return NotificationService._send_to_tokens(tokens, title, body), unknown
+
+    @staticmethod
+    def send_group_notification(title, body, group_id):
+        """Notify every user of a type; returns the number of notifications sent"""
+        tokens = NotificationService.get_user_tokens_by_group(group_id)
+        return NotificationService._send_to_tokens(tokens, title, body)
+
+    @staticmethod
+    def _collect_tokens(documents):
+        tokens = []
+        for data in documents:
+            tokens.extend(data.get(TOKEN_FIELD) or [])
+        return tokens
+
+    @staticmethod
+    def get_user_tokens(user_emails):
+        """FCM tokens of the given users, in batched 'in' queries"""
+        documents = firebase_service.query_in('users', 'email', user_emails, fields=[TOKEN_FIELD])
+        return NotificationService._collect_tokens(documents)
+
     @staticmethod
     def get_user_tokens_by_group(group_id):
-        # Placeholder for fetching user tokens by group from the database
-        return []
+        """FCM tokens of every user of a type (ADMINISTRADOR, TRABALHADOR, ESTAGIÁRIO)"""
+        documents = firebase_service.query_collection('users', 'user_type', '==', group_id, fields=[TOKEN_FIELD])
+        return NotificationService._collect_tokens(documents)
 
     @staticmethod
     def get_all_user_tokens():
-        # Placeholder for fetching all user tokens from the database
-        return []
\ No newline at end of file
+        """FCM tokens of every user"""
+        documents = firebase_service.get_all_documents('users', fields=[TOKEN_FIELD])
+        return NotificationService._collect_tokens(documents)
\ No newline at end of file
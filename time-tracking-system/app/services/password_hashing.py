@@ -0,0 +1,201 @@
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from app.services.metrics import metrics
+from config.settings import Config
+import multiprocessing
+import threading
+import time
+import bcrypt
+
+# Password hashing off the request thread.
+#
+# bcrypt is CPU-bound (~250 ms per hash at the default cost), so hashing many
+# passwords in one process runs them one after another. The pool spreads them
+# over PASSWORD_HASH_WORKERS processes. Workers are spawned rather than forked:
+# the parent may hold gRPC threads that a fork would copy in a broken state.
+#
+# Logins go through the pool with a bounded queue: once every worker is
+# busy and PASSWORD_HASH_QUEUE_DEPTH checks are waiting, new ones fail fast
+# with PasswordHashingBusy instead of piling up behind the others. Bulk jobs
+# feed the pool at most PASSWORD_HASH_BULK_WORKERS hashes at a time, so a big
+# import runs behind the logins instead of filling the pool's queue.
+
+MAX_ROUNDS = 16
+
+class PasswordHashingBusy(Exception):
+    """Raised when the hashing queue is full or a hash took too long"""
+
+_pool = None
+_slots = None
+_bulk_slots = None
+_pool_lock = threading.Lock()
+_rounds = None
+_rounds_lock = threading.Lock()
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+def _check(password_hash, password):
+    try:
+        return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+    except ValueError:
+        return False  # not a bcrypt hash
+
+def calibrate_rounds(target_ms=None, min_rounds=None):
+    """Highest bcrypt cost whose hash takes at most target_ms on this machine.
+
+    One hash at min_rounds is timed; every extra round doubles the work.
+    """
+    target_ms = target_ms or Config.BCRYPT_TARGET_MS
+    min_rounds = min_rounds or Config.BCRYPT_MIN_ROUNDS
+    started = time.perf_counter()
+    _hash('calibration', min_rounds)
+    elapsed_ms = max((time.perf_counter() - started) * 1000, 0.001)
+
+    rounds = min_rounds
+    while rounds < MAX_ROUNDS and elapsed_ms * 2 <= target_ms:
+        elapsed_ms *= 2
+        rounds += 1
+    return rounds
+
+def current_rounds():
+    """bcrypt cost for new hashes: BCRYPT_ROUNDS, or calibrated once per process"""
+    global _rounds
+    if Config.BCRYPT_ROUNDS:
+        return Config.BCRYPT_ROUNDS
+    if _rounds is None:
+        with _rounds_lock:
+            if _rounds is None:
+                _rounds = calibrate_rounds()
+                print(f"bcrypt cost calibrated to {_rounds} rounds")
+    return _rounds
+
+def hash_rounds(password_hash):
+    """Cost a bcrypt hash was made with ($2b$12$... -> 12), or None"""
+    try:
+        return int(password_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+def needs_rehash(password_hash):
+    """Whether a stored hash should be replaced on the next successful login.
+
+    With BCRYPT_ROUNDS set, any other cost is replaced. A calibrated cost only
+    ever raises the stored one, so workers on slower machines do not undo
+    each other's upgrades.
+    """
+    rounds = hash_rounds(password_hash)
+    if rounds is None:
+        return False
+    if Config.BCRYPT_ROUNDS:
+        return rounds != Config.BCRYPT_ROUNDS
+    return rounds < current_rounds()
+
+def get_pool():
+    """Process pool for hashing, created on first use"""
+    global _pool, _slots, _bulk_slots
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _slots = threading.BoundedSemaphore(Config.PASSWORD_HASH_WORKERS + Config.PASSWORD_HASH_QUEUE_DEPTH)
+                _bulk_slots = threading.BoundedSemaphore(
+                    max(1, min(Config.PASSWORD_HASH_BULK_WORKERS, Config.PASSWORD_HASH_WORKERS)))
+                _pool = ProcessPoolExecutor(max_workers=Config.PASSWORD_HASH_WORKERS,
+                                            mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+def _run(operation, function, *args):
+    """Run one hash or check in the pool, within the queue limit and timeout"""
+    started = time.monotonic()
+    if not Config.PASSWORD_HASH_WORKERS:
+        result = function(*args)
+        metrics.observe('password_hash.seconds', time.monotonic() - started, operation=operation)
+        return result
+
+    pool = get_pool()
+    slots = _slots
+    if not slots.acquire(blocking=False):
+        metrics.increment('password_hash.rejected', operation=operation)
+        raise PasswordHashingBusy('Password hashing queue is full')
+
+    try:
+        future = pool.submit(function, *args)
+        # The slot is held until the worker is done, even after a timeout
+        future.add_done_callback(lambda _: slots.release())
+    except BrokenProcessPool:
+        slots.release()
+        shutdown()  # a worker died; the next call starts a new pool
+        raise PasswordHashingBusy('Password hashing pool is restarting')
+    try:
+        result = future.result(timeout=Config.PASSWORD_HASH_TIMEOUT)
+    except FutureTimeoutError:
+        metrics.increment('password_hash.timeouts', operation=operation)
+        raise PasswordHashingBusy('Password hashing timed out')
+    except BrokenProcessPool:
+        shutdown()
+        raise PasswordHashingBusy('Password hashing pool is restarting')
+    metrics.observe('password_hash.seconds', time.monotonic() - started, operation=operation)
+    return result
+
+def hash_password(password):
+    """Hash one password at the current cost; raises PasswordHashingBusy"""
+    return _run('hash', _hash, password, current_rounds())
+
+def verify_password(password_hash, password):
+    """Check a password against a bcrypt hash; raises PasswordHashingBusy"""
+    if not password_hash:
+        return False
+    return _run('verify', _check, password_hash, password)
+
+def hash_passwords(passwords, rounds=None):
+    """Hash many passwords in parallel; returns the hashes in input order.
+
+    Each hash waits for one of the PASSWORD_HASH_BULK_WORKERS bulk slots
+    before it is submitted, so the rest of the pool stays free for logins.
+    Bulk jobs are not subject to the login queue limit or timeout.
+    """
+    passwords = list(passwords)
+    if not passwords:
+        return []
+    rounds = rounds or current_rounds()
+    if not Config.PASSWORD_HASH_WORKERS:
+        return [_hash(password, rounds) for password in passwords]
+
+    pool = get_pool()
+    bulk_slots = _bulk_slots
+    futures = []
+    started = time.monotonic()
+    try:
+        for password in passwords:
+            bulk_slots.acquire()
+            try:
+                future = pool.submit(_hash, password, rounds)
+            except BaseException:
+                bulk_slots.release()
+                raise
+            future.add_done_callback(lambda _: bulk_slots.release())
+            futures.append(future)
+        hashes = [future.result() for future in futures]
+    except BrokenProcessPool:
+        shutdown()  # a worker died; the next call starts a new pool
+        raise
+    metrics.increment('password_hash.bulk_hashes', len(hashes))
+    metrics.observe('password_hash.bulk_seconds', time.monotonic() - started)
+    return hashes
+
+def warm_up():
+    """Calibrate the cost and start the worker processes before the first login"""
+    current_rounds()
+    if Config.PASSWORD_HASH_WORKERS:
+        # One no-op task per worker makes the pool spawn all of them now
+        pool = get_pool()
+        for future in [pool.submit(hash_rounds, '') for _ in range(Config.PASSWORD_HASH_WORKERS)]:
+            future.result()
+
+def shutdown():
+    """Stop the worker processes (they are started again on next use)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
@@ -0,0 +1,261 @@
+from app.models.user import User
+from app.models.timesheet import Timesheet, TimeEntry
+from app.services.punch_sync import PUNCH_MESSAGES
+from app.storage import get_db, get_deadline, IN_QUERY_LIMIT, GET_ALL_CHUNK_SIZE
+from app.utils.helpers import chunked
+from concurrent.futures import ThreadPoolExecutor
+from config.settings import Config
+from datetime import datetime, timedelta
+from itertools import islice
+from functools import lru_cache
+import codecs
+import csv
+import hmac
+import json
+import re
+
+# Bulk punch ingestion for time-clock terminals.
+#
+# A terminal posts its punch log as NDJSON or CSV. Records are parsed and
+# validated one at a time as the body streams in, then handled in chunks of
+# INGEST_CHUNK_SIZE: the users and the punches already received are read in a
+# few batched round trips, and the punches of each touched day are applied in
+# time order in one transaction per day (INGEST_WORKERS days at a time), with
+# the rollups and TimeEntry records. Terminal ID and sequence number (NSR)
+# form the TimeEntry ID, so re-sending a log never counts a punch twice.
+# Punches that changed nothing are kept in IGNORED_COLLECTION under the same
+# ID, out of the reports and CSV exports.
+
+RECORD_FIELDS = ('seq', 'email', 'action', 'timestamp')
+
+STATUSES = ('applied', 'ignored', 'duplicate', 'rejected', 'error')
+
+# Terminal punches received but not applied (the action was already registered)
+IGNORED_COLLECTION = 'ignored_punches'
+
+NDJSON_TYPES = ('application/x-ndjson', 'application/jsonl', 'application/json-seq')
+CSV_TYPES = ('text/csv', 'application/csv')
+
+_TERMINAL_RE = re.compile(r'^[A-Za-z0-9-]{1,64}$')
+
+@lru_cache(maxsize=4)
+def parse_terminal_tokens(value):
+    """Parse 'terminal_id:token,...' into {token: terminal_id}"""
+    tokens = {}
+    for pair in (value or '').split(','):
+        terminal, _, token = pair.strip().partition(':')
+        if not terminal and not token:
+            continue
+        if not _TERMINAL_RE.match(terminal) or not token:
+            print(f"Error in TERMINAL_API_TOKENS: invalid entry for terminal '{terminal}'")
+            continue
+        tokens[token] = terminal
+    return tokens
+
+def terminal_for_token(token):
+    """Terminal ID authenticated by an API token, or None"""
+    if not token:
+        return None
+    terminal = None
+    for known, known_terminal in parse_terminal_tokens(Config.TERMINAL_API_TOKENS).items():
+        # Compare against every token so timing does not reveal a partial match
+        if hmac.compare_digest(token.encode('utf-8'), known.encode('utf-8')):
+            terminal = known_terminal
+    return terminal
+
+def entry_id_for(terminal, seq):
+    """TimeEntry ID of a terminal punch"""
+    return f'terminal_{terminal}_{seq}'
+
+def _iter_ndjson(lines):
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield number, None, 'JSON inválido.'
+            continue
+        if isinstance(record, dict):
+            yield number, record, None
+        else:
+            yield number, None, 'Registro inválido.'
+
+def _iter_csv(reader):
+    for row in reader:
+        if not any(row.values()):
+            continue
+        if None in row:
+            yield reader.line_num, None, 'Colunas a mais na linha.'
+        else:
+            yield reader.line_num, row, None
+
+def open_records(stream, mimetype):
+    """Return an iterator of (line, record, error) over a request body stream.
+
+    Raises ValueError for an unsupported content type or a CSV header that
+    lacks one of RECORD_FIELDS. The body itself is only read as the iterator
+    is consumed.
+    """
+    lines = codecs.iterdecode(stream, 'utf-8-sig', errors='replace')
+    if mimetype in NDJSON_TYPES:
+        return _iter_ndjson(lines)
+    if mimetype in CSV_TYPES:
+        reader = csv.DictReader(lines)
+        missing = [field for field in RECORD_FIELDS if field not in (reader.fieldnames or ())]
+        if missing:
+            raise ValueError(f"Cabeçalho CSV sem as colunas: {', '.join(missing)}.")
+        return _iter_csv(reader)
+    raise ValueError('Envie os registros em NDJSON (application/x-ndjson) ou CSV (text/csv).')
+
+def _validate(record, terminal, latest):
+    """Return (seq, email, action, moment), or raise ValueError with the reason"""
+    seq = record.get('seq')
+    if isinstance(seq, str) and seq.strip().isdigit():
+        seq = int(seq)
+    if not isinstance(seq, int) or isinstance(seq, bool) or seq < 1:
+        raise ValueError('Número de sequência inválido.')
+    if record.get('terminal') not in (None, '', terminal):
+        raise ValueError('Terminal diferente do autenticado.')
+
+    email = record.get('email')
+    if not isinstance(email, str) or '@' not in email:
+        raise ValueError('E-mail inválido.')
+    action = record.get('action')
+    if action not in PUNCH_MESSAGES:
+        raise ValueError('Ação inválida.')
+
+    try:
+        moment = datetime.fromisoformat(record.get('timestamp'))
+    except (TypeError, ValueError):
+        raise ValueError('Horário inválido.')
+    if moment.tzinfo is not None:
+        # Stored as server-local wall-clock time, like punches made online
+        moment = moment.astimezone().replace(tzinfo=None)
+    if moment > latest:
+        raise ValueError('Horário do terminal está adiantado.')
+
+    return seq, email.strip(), action, moment
+
+class PunchIngestor:
+    """Ingest one terminal's punch log; ingest() yields one result per record.
+
+    Results are {'line', 'seq', 'status', 'message'} dicts, status being
+    'applied', 'ignored' (the action was already registered that day),
+    'duplicate' (this punch was received before), 'rejected' (invalid, never
+    retry) or 'error' (retry later). counts holds the totals per status.
+
+    Each day is read and written in a transaction, like online punches, so a
+    punch made on the web for the same user and day is never overwritten.
+    """
+
+    def __init__(self, terminal, chunk_size=None, workers=None):
+        self.terminal = terminal
+        self.chunk_size = chunk_size or Config.INGEST_CHUNK_SIZE
+        self.workers = workers or Config.INGEST_WORKERS
+        self.counts = dict.fromkeys(STATUSES, 0)
+        self._seen = set()
+        self._users = {}
+
+    def ingest(self, records):
+        """Process (line, record, error) tuples lazily, chunk by chunk"""
+        records = iter(records)
+        while True:
+            chunk = list(islice(records, self.chunk_size))
+            if not chunk:
+                break
+            for result in self._process(chunk):
+                self.counts[result['status']] += 1
+                yield result
+
+    def _load_users(self, emails):
+        """Load the users not seen yet in this log (user_id and is_active only)"""
+        missing = [email for email in dict.fromkeys(emails) if email not in self._users]
+        users_ref = get_db().collection('users')
+        for chunk in chunked(missing, IN_QUERY_LIMIT):
+            query = users_ref.where('email', 'in', chunk).select(User._projection(('is_active',)))
+            for doc in query.stream(timeout=get_deadline()):
+                user = User._from_snapshot(doc, ('is_active',))
+                self._users[user.email] = user
+        for email in missing:
+            self._users.setdefault(email, None)
+
+    def _existing_entries(self, entry_ids):
+        """IDs already received, applied (TimeEntry) or ignored"""
+        db = get_db()
+        entry_ids = list(entry_ids)
+        existing = set()
+        for collection in (TimeEntry.COLLECTION, IGNORED_COLLECTION):
+            collection_ref = db.collection(collection)
+            for chunk in chunked([entry_id for entry_id in entry_ids if entry_id not in existing], GET_ALL_CHUNK_SIZE):
+                refs = [collection_ref.document(entry_id) for entry_id in chunk]
+                existing.update(doc.id for doc in db.get_all(refs, timeout=get_deadline()) if doc.exists)
+        return existing
+
+    def _apply_day(self, punches):
+        """Apply one user's punches for one day, sorted by time; returns [applied, ...] or None on error"""
+        user, date = punches[0][2], punches[0][4].date()
+        _, applied = Timesheet.punch_many(
+            user.user_id, date,
+            [(action, moment, entry_id_for(self.terminal, seq)) for _, seq, _, action, moment in punches],
+            user.email, ignored_collection=IGNORED_COLLECTION
+        )
+        return applied
+
+    def _process(self, chunk):
+        results = [None] * len(chunk)
+        pending = []
+        latest = datetime.now() + timedelta(seconds=Config.PUNCH_MAX_CLOCK_SKEW)
+
+        def result(position, seq, status, message):
+            results[position] = {'line': chunk[position][0], 'seq': seq, 'status': status, 'message': message}
+
+        for position, (line, record, error) in enumerate(chunk):
+            try:
+                if error:
+                    raise ValueError(error)
+                seq, email, action, moment = _validate(record, self.terminal, latest)
+            except ValueError as e:
+                result(position, record.get('seq') if record else None, 'rejected', str(e))
+                continue
+            if seq in self._seen:
+                result(position, seq, 'duplicate', 'Registro repetido nesta remessa.')
+                continue
+            self._seen.add(seq)
+            pending.append((position, seq, email, action, moment))
+
+        try:
+            self._load_users(email for _, _, email, _, _ in pending)
+            existing = self._existing_entries(entry_id_for(self.terminal, seq) for _, seq, _, _, _ in pending)
+
+            punches = []
+            for position, seq, email, action, moment in pending:
+                user = self._users.get(email)
+                if user is None:
+                    result(position, seq, 'rejected', 'Usuário não encontrado.')
+                elif not user.is_active:
+                    result(position, seq, 'rejected', 'Usuário inativo.')
+                elif entry_id_for(self.terminal, seq) in existing:
+                    result(position, seq, 'duplicate', 'Registro já recebido.')
+                else:
+                    punches.append((position, seq, user, action, moment))
+
+            days = {}
+            for punch in sorted(punches, key=lambda punch: punch[4]):
+                days.setdefault((punch[2].user_id, punch[4].date()), []).append(punch)
+
+            # Apply in time order so each day sees its punches as they happened
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                outcomes = executor.map(self._apply_day, days.values())
+                for day, applied in zip(days.values(), outcomes):
+                    for (position, seq, _, action, _), done in zip(day, applied or ()):
+                        message = PUNCH_MESSAGES[action][0 if done else 1]
+                        result(position, seq, 'applied' if done else 'ignored', message)
+        except Exception as e:
+            print(f"Error ingesting punches: {e}")
+
+        for position, seq, _, _, _ in pending:
+            if results[position] is None:
+                result(position, seq, 'error', 'Erro ao registrar ponto. Tente novamente.')
+        return results
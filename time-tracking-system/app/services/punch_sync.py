@@ -0,0 +1,143 @@
+from app.models.timesheet import Timesheet, TimeEntry
+from app.storage import get_db, get_deadline
+from config.settings import Config
+from datetime import datetime
+import hashlib
+import hmac
+import time
+import re
+
+# Offline punch sync.
+#
+# The browser keeps punches in an IndexedDB queue, stamps each one with the
+# device clock when the button is pressed and signs it with a per-user HMAC
+# key, then posts the queue in batches whenever it is online. A punch is
+# applied at most once: its punch_id becomes the ID of the TimeEntry written
+# with it, and the batch checks those IDs up front with one get_all().
+#
+# The signing key lives in the browser, so the device clock is the user's
+# word, not proof. A punch that arrives within PUNCH_MAX_CLOCK_SKEW of its
+# stamp is recorded at the server's receipt time. Only a punch the browser
+# flags as queued offline keeps its older device time, and then its
+# TimeEntry is marked for review and its day set to AJUSTE_PENDENTE. The
+# device time is stored on the TimeEntry either way.
+
+# Clock action -> (message when registered, message when already registered)
+PUNCH_MESSAGES = {
+    'entry': ('Entrada registrada com sucesso!', 'Entrada já foi registrada hoje.'),
+    'lunch_start': ('Início do almoço registrado!', 'Início do almoço já foi registrado.'),
+    'lunch_end': ('Fim do almoço registrado!', 'Fim do almoço já foi registrado ou início não foi marcado.'),
+    'exit': ('Saída registrada com sucesso!', 'Saída já foi registrada hoje.')
+}
+
+_PUNCH_ID_RE = re.compile(r'^[A-Za-z0-9-]{8,64}$')
+
+def punch_key(user_id):
+    """Per-user signing key (hex), derived from SECRET_KEY"""
+    return hmac.new(Config.SECRET_KEY.encode('utf-8'), f'punch-key:{user_id}'.encode('utf-8'),
+                    hashlib.sha256).hexdigest()
+
+def punch_signature(key, punch_id, action, stamped_at):
+    """HMAC-SHA256 (hex) of a punch, as computed by static/js/main.js"""
+    message = f'{punch_id}|{action}|{stamped_at}'.encode('utf-8')
+    return hmac.new(bytes.fromhex(key), message, hashlib.sha256).hexdigest()
+
+def _result(punch_id, status, message):
+    return {'punch_id': punch_id, 'status': status, 'message': message}
+
+def _validate(punch, key, now_ms):
+    """Return (moment, device_time, needs_review), or raise ValueError with the reason"""
+    punch_id = punch.get('punch_id')
+    action = punch.get('action')
+    stamped_at = punch.get('stamped_at')
+    signature = punch.get('signature')
+
+    if not isinstance(punch_id, str) or not _PUNCH_ID_RE.match(punch_id):
+        raise ValueError('Identificador inválido.')
+    if action not in PUNCH_MESSAGES:
+        raise ValueError('Ação inválida.')
+    if not isinstance(stamped_at, int) or isinstance(stamped_at, bool):
+        raise ValueError('Horário inválido.')
+    if not isinstance(signature, str) or not hmac.compare_digest(
+            signature, punch_signature(key, punch_id, action, stamped_at)):
+        raise ValueError('Assinatura inválida.')
+
+    skew_ms = Config.PUNCH_MAX_CLOCK_SKEW * 1000
+    if stamped_at > now_ms + skew_ms:
+        raise ValueError('Horário do dispositivo está adiantado.')
+
+    # Stored as server-local wall-clock time, like punches made online
+    device_time = datetime.fromtimestamp(stamped_at / 1000)
+    if stamped_at >= now_ms - skew_ms:
+        return datetime.fromtimestamp(now_ms / 1000), device_time, False
+
+    if punch.get('offline') is not True:
+        raise ValueError('Horário do dispositivo não confere com o do servidor.')
+    if stamped_at < now_ms - Config.PUNCH_MAX_AGE_HOURS * 3600 * 1000:
+        raise ValueError('Registro antigo demais para sincronizar.')
+    return device_time, device_time, True
+
+def sync_punches(user, punches):
+    """Apply a batch of queued punches for a user; returns one result per punch, in input order.
+
+    Status is 'applied', 'ignored' (the action was already registered),
+    'duplicate' (this punch was applied before), 'rejected' (invalid, never
+    retry) or 'error' (retry later). Results of punches recorded at their
+    device time carry needs_review=True. Malformed items are rejected with
+    punch_id None; a punch_id repeated in the batch is a 'duplicate'.
+    """
+    key = punch_key(user.user_id)
+    now_ms = int(time.time() * 1000)
+    results = [None] * len(punches)
+    valid = []
+    seen = set()
+
+    for position, punch in enumerate(punches):
+        punch_id = punch.get('punch_id') if isinstance(punch, dict) else None
+        if not isinstance(punch_id, str):
+            punch_id = None
+        try:
+            if not isinstance(punch, dict):
+                raise ValueError('Registro inválido.')
+            validated = _validate(punch, key, now_ms)
+        except ValueError as e:
+            results[position] = _result(punch_id, 'rejected', str(e))
+            continue
+        if punch_id in seen:
+            results[position] = _result(punch_id, 'duplicate', 'Registro repetido nesta remessa.')
+            continue
+        seen.add(punch_id)
+        valid.append((position, punch_id, punch['action'], validated))
+
+    try:
+        # One round trip finds every punch that was already applied
+        db = get_db()
+        entries_ref = db.collection(TimeEntry.COLLECTION)
+        refs = [entries_ref.document(f'{user.user_id}_{punch_id}') for _, punch_id, _, _ in valid]
+        existing = {doc.id for doc in db.get_all(refs, timeout=get_deadline()) if doc.exists} if refs else set()
+    except Exception as e:
+        print(f"Error checking synced punches: {e}")
+        for position, punch_id, _, _ in valid:
+            results[position] = _result(punch_id, 'error', 'Erro ao registrar ponto. Tente novamente.')
+        valid = []
+
+    # Apply in time order so each day sees its punches as they happened
+    for position, punch_id, action, (moment, device_time, needs_review) in sorted(valid, key=lambda item: item[3][0]):
+        entry_id = f'{user.user_id}_{punch_id}'
+        if entry_id in existing:
+            results[position] = _result(punch_id, 'duplicate', 'Registro já sincronizado.')
+            continue
+
+        timesheet, applied = Timesheet.punch(user.user_id, moment.date(), action, moment,
+                                             user_email=user.email, entry_id=entry_id,
+                                             device_time=device_time, needs_review=needs_review)
+        if timesheet is None:
+            results[position] = _result(punch_id, 'error', 'Erro ao registrar ponto. Tente novamente.')
+        elif applied:
+            results[position] = _result(punch_id, 'applied', PUNCH_MESSAGES[action][0])
+        else:
+            results[position] = _result(punch_id, 'ignored', PUNCH_MESSAGES[action][1])
+        if applied and needs_review:
+            results[position]['needs_review'] = True
+
+    return results
@@ -0,0 +1,255 @@
+import numpy as np
+from datetime import time as time_type
+from config.settings import Config
+
+# Columnar report engine.
+#
+# A date range is loaded into one row per (user, day) held as NumPy columns:
+# user index, epoch day and minute-of-day of entry, lunch start/end and exit
+# (-1 when missing). Hours, overtime and per-user totals are then computed with
+# whole-array operations instead of a Python loop per punch or per timesheet.
+
+MISSING = -1
+
+# date(1970, 1, 1).toordinal(): day columns hold days since the Unix epoch
+EPOCH_ORDINAL = 719163
+
+# Punch type codes used while reducing TimeEntry rows
+ENTRY, LUNCH_START, LUNCH_END, EXIT = range(4)
+PUNCH_CODES = {'entry': ENTRY, 'lunch_start': LUNCH_START, 'lunch_end': LUNCH_END, 'exit': EXIT}
+
+def _or_missing(minute):
+    return MISSING if minute is None else minute
+
+def _first_per_group(group_ids, values, mask, size, last=False):
+    """Value of the first (or last) masked row of each contiguous group"""
+    out = np.full(size, MISSING, dtype=np.int16)
+    groups = group_ids[mask]
+    if not len(groups):
+        return out
+    selected = values[mask]
+    if last:
+        edge = np.r_[groups[1:] != groups[:-1], True]
+    else:
+        edge = np.r_[True, groups[1:] != groups[:-1]]
+    out[groups[edge]] = selected[edge]
+    return out
+
+class DaySummary:
+    """One user's day as read back from a DailyTable"""
+    __slots__ = ('user_key', 'date', 'entry_time', 'lunch_start', 'lunch_end', 'exit_time',
+                 'total_hours', 'lunch_hours', 'overtime_hours', 'complete')
+
+    def __init__(self, user_key, date, entry_time, lunch_start, lunch_end, exit_time,
+                 total_hours, lunch_hours, overtime_hours, complete):
+        self.user_key = user_key
+        self.date = date
+        self.entry_time = entry_time
+        self.lunch_start = lunch_start
+        self.lunch_end = lunch_end
+        self.exit_time = exit_time
+        self.total_hours = total_hours
+        self.lunch_hours = lunch_hours
+        self.overtime_hours = overtime_hours
+        self.complete = complete
+
+    def is_complete(self):
+        return self.complete
+
+    def __repr__(self):
+        return f'<DaySummary {self.user_key} - {self.date}: {self.total_hours:.2f}h>'
+
+class DailyTable:
+    """Columnar (user, day) rows for a date range.
+
+    user_keys maps user_idx back to the user identifier (email or user_id).
+    Time columns are minute-of-day int16 values, worked/lunch are minutes.
+    """
+
+    def __init__(self, user_keys, user_idx, day, entry, lunch_start, lunch_end, exit_,
+                 worked, lunch, complete):
+        self.user_keys = user_keys
+        self.user_idx = user_idx
+        self.day = day
+        self.entry = entry
+        self.lunch_start = lunch_start
+        self.lunch_end = lunch_end
+        self.exit = exit_
+        self.worked = worked
+        self.lunch = lunch
+        self.complete = complete
+
+    def __len__(self):
+        return len(self.day)
+
+    @classmethod
+    def from_timesheets(cls, timesheets, key='user_id'):
+        """Load Timesheet objects; worked time is the stored total, as in calculate_overtime()"""
+        user_index = {}
+        add_user = user_index.setdefault
+        # One Python pass builds a row per timesheet; the rest is column arithmetic
+        rows = np.array([
+            (add_user(getattr(ts, key), len(user_index)), ts.date.toordinal(),
+             _or_missing(ts.entry_minute), _or_missing(ts.lunch_start_minute),
+             _or_missing(ts.lunch_end_minute), _or_missing(ts.exit_minute),
+             ts.total_minutes() if ts.total_hours else MISSING)
+            for ts in timesheets
+        ], dtype=np.int32).reshape(-1, 7)
+        user_keys = list(user_index)
+
+        user_idx = rows[:, 0].copy()
+        day = rows[:, 1] - EPOCH_ORDINAL
+        entry, lunch_start, lunch_end, exit_ = (rows[:, i].astype(np.int16) for i in range(2, 6))
+        stored = rows[:, 6]
+
+        has_lunch = (lunch_start != MISSING) & (lunch_end != MISSING)
+        lunch = np.where(has_lunch, lunch_end.astype(np.int32) - lunch_start, 0)
+        complete = (entry != MISSING) & (exit_ != MISSING)
+        computed = np.where(complete, exit_.astype(np.int32) - entry - lunch, 0)
+        worked = np.where(stored != MISSING, stored, computed)
+
+        return cls(user_keys, user_idx, day, entry, lunch_start, lunch_end, exit_,
+                   worked, lunch, complete)
+
+    @classmethod
+    def from_entries(cls, entries):
+        """Reduce TimeEntry punches to daily rows with the same rules as DailyReport.
+
+        Work runs from the first entry/lunch_end of a run to the next
+        lunch_start/exit; lunch runs from a lunch_start to the next lunch_end.
+        Punches are counted at minute resolution.
+        """
+        entries = list(entries)
+        count = len(entries)
+        if not count:
+            empty32 = np.zeros(0, dtype=np.int32)
+            empty16 = np.zeros(0, dtype=np.int16)
+            return cls([], empty32, empty32, empty16, empty16, empty16, empty16,
+                       empty32, empty32, np.zeros(0, dtype=bool))
+
+        # One Python pass packs user, day, minute and punch type into an int64:
+        # user << 33 | ordinal << 13 | minute << 2 | type
+        user_index = {}
+        add_user = user_index.setdefault
+        packed = np.array([
+            (add_user(e.user_email, len(user_index)) << 20 | e.timestamp.toordinal()) << 13
+            | (e.timestamp.hour * 60 + e.timestamp.minute) << 2 | PUNCH_CODES[e.entry_type]
+            for e in entries
+        ], dtype=np.int64)
+
+        # Sort by user, day, time; stable, so same-minute punches keep their order
+        packed = packed[np.argsort(packed >> 2, kind='stable')]
+        codes = (packed & 3).astype(np.int8)
+        minutes = ((packed >> 2) & 0x7FF).astype(np.int16)
+        days = (((packed >> 13) & 0xFFFFF) - EPOCH_ORDINAL).astype(np.int32)
+        users = (packed >> 33).astype(np.int32)
+
+        index = np.arange(count)
+        new_group = np.r_[True, (users[1:] != users[:-1]) | (days[1:] != days[:-1])]
+        group_ids = np.cumsum(new_group) - 1
+        group_count = int(group_ids[-1]) + 1
+        group_start = np.maximum.accumulate(np.where(new_group, index, 0))
+
+        # Work intervals: a closer right after a run of openers closes the run
+        opener = (codes == ENTRY) | (codes == LUNCH_END)
+        prev_opener = np.r_[False, opener[:-1]] & ~new_group
+        run_start = np.maximum.accumulate(np.where(opener & ~prev_opener, index, 0))
+        closes = ~opener & prev_opener
+        closing = index[closes]
+        worked_per_punch = minutes[closing].astype(np.int32) - minutes[run_start[closing - 1]]
+        worked = np.bincount(group_ids[closing], weights=worked_per_punch,
+                             minlength=group_count).astype(np.int32)
+
+        # Lunch intervals: a lunch_end closes the latest lunch_start not yet closed
+        is_lunch_start = codes == LUNCH_START
+        is_lunch_end = codes == LUNCH_END
+        last_lunch_start = np.maximum.accumulate(np.where(is_lunch_start, index, -1))
+        prev_lunch_end = np.r_[-1, np.maximum.accumulate(np.where(is_lunch_end, index, -1))[:-1]]
+        closes_lunch = (is_lunch_end & (last_lunch_start >= group_start)
+                        & (last_lunch_start > prev_lunch_end))
+        lunch_closing = index[closes_lunch]
+        lunch_per_punch = (minutes[lunch_closing].astype(np.int32)
+                           - minutes[last_lunch_start[lunch_closing]])
+        lunch = np.bincount(group_ids[lunch_closing], weights=lunch_per_punch,
+                            minlength=group_count).astype(np.int32)
+
+        entry = _first_per_group(group_ids, minutes, codes == ENTRY, group_count)
+        lunch_start = _first_per_group(group_ids, minutes, is_lunch_start, group_count)
+        lunch_end = _first_per_group(group_ids, minutes, is_lunch_end, group_count, last=True)
+        exit_ = _first_per_group(group_ids, minutes, codes == EXIT, group_count, last=True)
+
+        is_last = np.r_[new_group[1:], True]
+        complete = (entry != MISSING) & (exit_ != MISSING) & ~opener[is_last]
+
+        return cls(list(user_index), users[new_group], days[new_group], entry, lunch_start,
+                   lunch_end, exit_, worked, lunch, complete)
+
+    def _expected_minutes(self, expected_hours):
+        """Expected minutes per row from a number or a {user_key: hours} mapping"""
+        if isinstance(expected_hours, dict):
+            per_user = np.array(
+                [expected_hours.get(key, Config.WORKER_WORK_HOURS) for key in self.user_keys],
+                dtype=np.float64
+            )
+            return np.rint(per_user * 60).astype(np.int32)[self.user_idx]
+        return int(round(expected_hours * 60))
+
+    def hours(self):
+        """Worked hours per row"""
+        return self.worked / 60
+
+    def overtime_minutes(self, expected_hours=8):
+        """Overtime minutes per row; only days with worked time count"""
+        return np.maximum(self.worked - self._expected_minutes(expected_hours), 0)
+
+    def dates(self):
+        """Row dates as datetime.date objects"""
+        return self.day.astype('datetime64[D]').tolist()
+
+    def user_totals(self, expected_hours=8):
+        """Per-user totals: {user_key: {'days', 'total_hours', 'overtime_hours', 'lunch_hours'}}"""
+        size = len(self.user_keys)
+        worked_days = self.worked > 0
+        days = np.bincount(self.user_idx, weights=worked_days, minlength=size).tolist()
+        worked = np.bincount(self.user_idx, weights=self.worked, minlength=size).tolist()
+        overtime = np.bincount(self.user_idx, weights=self.overtime_minutes(expected_hours), minlength=size).tolist()
+        lunch = np.bincount(self.user_idx, weights=self.lunch, minlength=size).tolist()
+        return {
+            key: {
+                'days': int(days[i]),
+                'total_hours': worked[i] / 60,
+                'overtime_hours': overtime[i] / 60,
+                'lunch_hours': lunch[i] / 60
+            }
+            for i, key in enumerate(self.user_keys)
+        }
+
+    def totals(self, expected_hours=8):
+        """Totals over every row"""
+        return {
+            'days': int(np.count_nonzero(self.worked)),
+            'total_hours': float(self.worked.sum()) / 60,
+            'overtime_hours': float(self.overtime_minutes(expected_hours).sum()) / 60
+        }
+
+    def iter_days(self, expected_hours=8):
+        """Yield a DaySummary per row"""
+        def to_time(minute):
+            return time_type(minute // 60, minute % 60) if minute != MISSING else None
+
+        overtime = self.overtime_minutes(expected_hours)
+        columns = zip(self.user_idx.tolist(), self.dates(), self.entry.tolist(),
+                      self.lunch_start.tolist(), self.lunch_end.tolist(), self.exit.tolist(),
+                      self.worked.tolist(), self.lunch.tolist(), overtime.tolist(),
+                      self.complete.tolist())
+        for user, day, entry, lunch_start, lunch_end, exit_, worked, lunch, extra, complete in columns:
+            yield DaySummary(self.user_keys[user], day, to_time(entry), to_time(lunch_start),
+                             to_time(lunch_end), to_time(exit_), worked / 60, lunch / 60,
+                             extra / 60, complete)
+
+    def by_user(self, expected_hours=8):
+        """Group rows as {user_key: {date: DaySummary}}"""
+        reports = {}
+        for summary in self.iter_days(expected_hours):
+            reports.setdefault(summary.user_key, {})[summary.date] = summary
+        return reports
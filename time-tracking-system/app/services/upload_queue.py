@@ -0,0 +1,237 @@
+from concurrent.futures import ThreadPoolExecutor
+from app.services.dropbox_service import dropbox_service
+from app.services.image_processing import process_photo, InvalidImage
+from config.settings import Config
+import threading
+import json
+import uuid
+import os
+
+# profile_picture value stored while a photo is still being uploaded
+PENDING_PHOTO_PREFIX = 'pending:'
+
+class PhotoUploadQueue:
+    """Background queue that uploads profile photos to Dropbox.
+
+    Each job is written to queue_dir first (photo bytes + a small JSON manifest),
+    then handed to a thread pool. Request threads return immediately with a
+    ``pending:<job_id>`` placeholder; the worker uploads the photo and writes
+    the shared link onto the user. Jobs survive restarts: any manifest left in
+    the directory is picked up again the next time the queue is used.
+
+    Several gunicorn workers can share the directory. A job is claimed by
+    atomically renaming its manifest to ``<job_id>.<pid>.work``, so only one
+    process ever uploads it.
+    """
+
+    def __init__(self, queue_dir=None, max_workers=None, max_attempts=None):
+        self.queue_dir = queue_dir or Config.PHOTO_UPLOAD_QUEUE_DIR
+        self.max_workers = max_workers or Config.PHOTO_UPLOAD_WORKERS
+        self.max_attempts = max_attempts or Config.PHOTO_UPLOAD_MAX_ATTEMPTS
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        """Create the worker pool for this process, recovering leftover jobs"""
+        pid = os.getpid()
+        if self._executor is not None and self._executor_pid == pid:
+            return self._executor
+
+        with self._lock:
+            if self._executor is None or self._executor_pid != pid:
+                os.makedirs(self.queue_dir, exist_ok=True)
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix='photo-upload'
+                )
+                self._executor_pid = pid
+                self._recover()
+        return self._executor
+
+    def _path(self, name):
+        return os.path.join(self.queue_dir, name)
+
+    def _write_atomic(self, name, data):
+        tmp_path = self._path(f'.{name}.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._path(name))
+
+    def enqueue(self, file_content, user_email, filename, previous_url=None, save=None):
+        """Persist a photo upload job and schedule it; returns the pending placeholder.
+
+        save, when given, is called with the placeholder once the job is on
+        disk and must store it on the user. The job is only scheduled after it
+        returns true, so the worker never runs before the placeholder is saved;
+        when it returns false the job is discarded and None is returned.
+        """
+        executor = self._get_executor()
+
+        job_id = uuid.uuid4().hex
+        manifest = {
+            'job_id': job_id,
+            'user_email': user_email,
+            'filename': filename,
+            'previous_url': previous_url,
+            'attempts': 0
+        }
+
+        # Photo first, manifest last: a manifest always points at a complete file
+        self._write_atomic(f'{job_id}.bin', file_content)
+        self._write_atomic(f'{job_id}.json', json.dumps(manifest).encode('utf-8'))
+
+        placeholder = f'{PENDING_PHOTO_PREFIX}{job_id}'
+        if save is not None and not save(placeholder):
+            self._finish(self._path(f'{job_id}.json'), job_id)
+            return None
+
+        executor.submit(self._run, job_id)
+        return placeholder
+
+    def _claim(self, job_id):
+        """Take ownership of a job; returns the claimed manifest path or None"""
+        claimed = self._path(f'{job_id}.{os.getpid()}.work')
+        try:
+            os.rename(self._path(f'{job_id}.json'), claimed)
+            return claimed
+        except FileNotFoundError:
+            return None
+
+    def _release(self, claimed, manifest):
+        """Put a claimed job back in the queue"""
+        self._write_atomic(f"{manifest['job_id']}.json", json.dumps(manifest).encode('utf-8'))
+        os.remove(claimed)
+
+    def _finish(self, claimed, job_id):
+        for path in (claimed, self._path(f'{job_id}.bin')):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _run(self, job_id):
+        claimed = self._claim(job_id)
+        if not claimed:
+            return  # Another process took it
+
+        try:
+            with open(claimed, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            manifest['attempts'] += 1
+
+            if self._process(manifest):
+                self._finish(claimed, job_id)
+            elif manifest['attempts'] >= self.max_attempts:
+                print(f"Giving up on profile photo upload {job_id} for {manifest['user_email']}")
+                self._restore_previous(manifest)
+                self._finish(claimed, job_id)
+            else:
+                self._release(claimed, manifest)
+                delay = min(2 ** manifest['attempts'], 300)
+                timer = threading.Timer(delay, self._resubmit, args=(job_id,))
+                timer.daemon = True
+                timer.start()
+        except Exception as e:
+            print(f"Error processing profile photo upload {job_id}: {e}")
+
+    def _resubmit(self, job_id):
+        self._get_executor().submit(self._run, job_id)
+
+    def _process(self, manifest):
+        """Upload the photo and attach its link to the user; True when done"""
+        from app.models.user import User
+
+        placeholder = f"{PENDING_PHOTO_PREFIX}{manifest['job_id']}"
+        user = User.get_by_email(manifest['user_email'], use_cache=False)
+        if not user:
+            return False  # The user document may not be committed yet
+        if user.profile_picture != placeholder:
+            if self._superseded(user.profile_picture, manifest):
+                return True
+            return False  # The placeholder is not saved yet
+
+        with open(self._path(f"{manifest['job_id']}.bin"), 'rb') as f:
+            file_content = f.read()
+
+        # Resize/re-encode in the process pool; the original is never uploaded
+        try:
+            renditions = process_photo(file_content)
+        except InvalidImage as e:
+            print(f"Rejecting profile photo upload {manifest['job_id']} for {manifest['user_email']}: {e}")
+            self._restore_previous(manifest)
+            return True
+        if not renditions:
+            return False  # Timeout or pool error: try again later
+
+        stem = manifest['filename'].rsplit('.', 1)[0]
+        extension = Config.PHOTO_FORMAT.lower()
+        photo_urls = {}
+        for size_name, content in renditions.items():
+            url = dropbox_service.upload_user_photo(content, manifest['user_email'], f'{stem}_{size_name}.{extension}')
+            if not url:
+                return False
+            photo_urls[size_name] = url
+
+        user.profile_pictures = photo_urls
+        user.profile_picture = photo_urls.get(Config.PHOTO_DEFAULT_SIZE) or next(iter(photo_urls.values()))
+        return user.save()
+
+    @staticmethod
+    def _superseded(current, manifest):
+        """Whether the stored photo is another job's placeholder or a newer upload"""
+        if not current:
+            return False
+        if current.startswith(PENDING_PHOTO_PREFIX):
+            return True
+        return current != manifest.get('previous_url')
+
+    def _restore_previous(self, manifest):
+        """Put the previous photo back after a job fails for good"""
+        from app.models.user import User
+
+        user = User.get_by_email(manifest['user_email'], use_cache=False)
+        if user and user.profile_picture == f"{PENDING_PHOTO_PREFIX}{manifest['job_id']}":
+            user.profile_picture = manifest.get('previous_url')
+            user.save()
+
+    def _recover(self):
+        """Requeue jobs left behind by a restart or by a dead worker process"""
+        for name in os.listdir(self.queue_dir):
+            if name.endswith('.work'):
+                job_id, pid, _ = name.rsplit('.', 2)
+                if not self._pid_alive(int(pid)):
+                    try:
+                        os.rename(self._path(name), self._path(f'{job_id}.json'))
+                    except FileNotFoundError:
+                        continue
+                    self._executor.submit(self._run, job_id)
+            elif name.endswith('.json') and not name.startswith('.'):
+                self._executor.submit(self._run, name[:-len('.json')])
+
+    @staticmethod
+    def _pid_alive(pid):
+        if pid == os.getpid():
+            return False  # Left over from a previous executor in this process
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def drain(self):
+        """Process every queued job synchronously (CLI / maintenance use)"""
+        os.makedirs(self.queue_dir, exist_ok=True)
+        processed = 0
+        for name in sorted(os.listdir(self.queue_dir)):
+            if name.endswith('.json') and not name.startswith('.'):
+                self._run(name[:-len('.json')])
+                processed += 1
+        return processed
+
+# Global upload queue instance
+photo_upload_queue = PhotoUploadQueue()
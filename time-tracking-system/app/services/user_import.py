@@ -0,0 +1,137 @@
+from app.models.user import User
+from app.services.bulk_writer import MAX_BATCH_SIZE
+from app.services.password_hashing import hash_passwords
+from app.storage import get_db, get_deadline, IN_QUERY_LIMIT
+from app.utils.helpers import chunked
+from itertools import islice
+import csv
+
+# Bulk user import from CSV.
+#
+# Rows are read as the file streams in and handled in chunks of up to 500
+# (one write batch): emails already registered are found with 'in' queries,
+# passwords are hashed across the process pool and the new users are written
+# with User.save_many. Every row that is not imported goes to the rejects
+# callback with its reason, but never with its password: the rejects end up in
+# files and responses, so the password column has to be filled in again before
+# the rows are imported again.
+
+IMPORT_FIELDS = ('email', 'name', 'user_type', 'password')
+REQUIRED_FIELDS = ('email', 'name', 'password')
+REJECT_FIELDS = ('line', 'email', 'name', 'user_type', 'reason')
+
+USER_TYPES = ('ADMINISTRADOR', 'TRABALHADOR', 'ESTAGIÁRIO')
+
+def _validate(row):
+    """Return (email, name, user_type, password), or raise ValueError with the reason"""
+    email = (row.get('email') or '').strip()
+    name = (row.get('name') or '').strip()
+    user_type = (row.get('user_type') or '').strip().upper() or 'TRABALHADOR'
+    password = row.get('password') or ''
+
+    if '@' not in email:
+        raise ValueError('E-mail inválido.')
+    if not name:
+        raise ValueError('Nome obrigatório.')
+    if user_type not in USER_TYPES:
+        raise ValueError('Tipo de usuário inválido.')
+    if not password:
+        raise ValueError('Senha obrigatória.')
+    return email, name, user_type, password
+
+def _existing_emails(emails):
+    """Emails already registered, with one 'in' query per IN_QUERY_LIMIT emails.
+
+    Errors are raised: a failed check must not create duplicate accounts.
+    """
+    users_ref = get_db().collection('users')
+    existing = set()
+    for chunk in chunked(emails, IN_QUERY_LIMIT):
+        for doc in users_ref.where('email', 'in', chunk).select(['email']).stream(timeout=get_deadline()):
+            existing.add(doc.to_dict().get('email'))
+    return existing
+
+class UserImporter:
+    """Import users from CSV lines with email, name, user_type and password columns.
+
+    rejects is called with a dict of REJECT_FIELDS (no password) for every row
+    not imported and progress with the stats dict after every chunk.
+    """
+
+    def __init__(self, rejects=None, progress=None, chunk_size=MAX_BATCH_SIZE):
+        self.rejects = rejects
+        self.progress = progress
+        self.chunk_size = chunk_size
+        self.stats = {'read': 0, 'created': 0, 'rejected': 0}
+        self._seen = set()
+
+    def _reject(self, line, row, reason):
+        self.stats['rejected'] += 1
+        if self.rejects:
+            self.rejects({'line': line, 'email': row.get('email'), 'name': row.get('name'),
+                          'user_type': row.get('user_type'), 'reason': reason})
+
+    def run(self, lines):
+        """Import every row; returns the stats. Raises ValueError for a bad header"""
+        reader = csv.DictReader(lines)
+        missing = [field for field in REQUIRED_FIELDS if field not in (reader.fieldnames or ())]
+        if missing:
+            raise ValueError(f"Cabeçalho CSV sem as colunas: {', '.join(missing)}.")
+
+        rows = ((reader.line_num, row) for row in reader if any(row.values()))
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                break
+            self.stats['read'] += len(chunk)
+            self._import_chunk(chunk)
+            if self.progress:
+                self.progress(dict(self.stats))
+        return self.stats
+
+    def _import_chunk(self, chunk):
+        pending = []
+        for line, row in chunk:
+            try:
+                email, name, user_type, password = _validate(row)
+            except ValueError as e:
+                self._reject(line, row, str(e))
+                continue
+            if email in self._seen:
+                self._reject(line, row, 'E-mail repetido no arquivo.')
+                continue
+            self._seen.add(email)
+            pending.append((line, row, email, name, user_type, password))
+
+        try:
+            existing = _existing_emails(email for _, _, email, _, _, _ in pending)
+        except Exception as e:
+            print(f"Error checking existing users: {e}")
+            for line, row, _, _, _, _ in pending:
+                self._reject(line, row, 'Erro ao importar. Tente novamente.')
+            return
+
+        new = []
+        for entry in pending:
+            if entry[2] in existing:
+                self._reject(entry[0], entry[1], 'E-mail já cadastrado.')
+            else:
+                new.append(entry)
+
+        try:
+            hashes = hash_passwords(password for _, _, _, _, _, password in new)
+        except Exception as e:
+            print(f"Error hashing passwords: {e}")
+            for line, row, _, _, _, _ in new:
+                self._reject(line, row, 'Erro ao importar. Tente novamente.')
+            return
+
+        users = [
+            User(email=email, name=name, user_type=user_type, password_hash=password_hash)
+            for (_, _, email, name, user_type, _), password_hash in zip(new, hashes)
+        ]
+        for (line, row, _, _, _, _), result in zip(new, User.save_many(users)):
+            if result['success']:
+                self.stats['created'] += 1
+            else:
+                self._reject(line, row, f"Erro ao gravar: {result['error']}")
@@ -0,0 +1,35 @@
+from app.storage import get_db, get_deadline
+from app.services.dropbox_service import dropbox_service
+from app.services.metrics import metrics
+from app.services import password_hashing
+import time
+
+def warm_up():
+    """Connect to Firestore and Dropbox (and start the bcrypt pool) now instead of on the first request.
+
+    Services are lazy, so a fresh worker pays for credentials, the gRPC channel
+    and the Dropbox session on its first request. Calling this right after the
+    worker boots (see gunicorn.conf.py) moves that cost off the request path.
+    Failures are only logged; the services retry on first use.
+    """
+    started = time.monotonic()
+
+    db = get_db()
+    if db is not None:
+        try:
+            # Cheapest round trip available: authenticates and opens the channel
+            list(db.collection('users').select([]).limit(1).stream(timeout=get_deadline()))
+        except Exception as e:
+            print(f"Firestore warm-up failed: {e}")
+
+    dropbox_service.warm_up()
+
+    try:
+        password_hashing.warm_up()
+    except Exception as e:
+        print(f"Password hashing warm-up failed: {e}")
+
+    elapsed = time.monotonic() - started
+    metrics.observe('warmup.seconds', elapsed)
+    print(f"Service warm-up finished in {elapsed:.2f}s")
+    return elapsed
@@ -0,0 +1,33 @@
+from app.services.firestore_client import get_deadline, iter_query
+from app.storage.base import StorageBackend, Increment, IN_QUERY_LIMIT, GET_ALL_CHUNK_SIZE
+from config.settings import Config
+import threading
+
+# Storage backend selection.
+#
+# Models and services get their database from get_db() here. STORAGE_BACKEND
+# picks Firestore (the default) or an embedded SQLite file for single-node
+# deployments; both expose the same client API (see StorageBackend).
+
+_sqlite_lock = threading.Lock()
+_sqlite_backend = None
+
+def _get_sqlite():
+    global _sqlite_backend
+    if _sqlite_backend is None:
+        with _sqlite_lock:
+            if _sqlite_backend is None:
+                from app.storage.sqlite_backend import SQLiteBackend
+                _sqlite_backend = SQLiteBackend(Config.SQLITE_PATH, Config.SQLITE_BUSY_TIMEOUT_MS)
+    return _sqlite_backend
+
+def get_db():
+    """Return the configured StorageBackend (None in Firestore mock mode)"""
+    if Config.STORAGE_BACKEND == 'sqlite':
+        return _get_sqlite()
+
+    from app.services import firestore_client
+    return firestore_client.get_db()
+
+__all__ = ['get_db', 'get_deadline', 'iter_query', 'Increment', 'StorageBackend',
+           'IN_QUERY_LIMIT', 'GET_ALL_CHUNK_SIZE']
@@ -0,0 +1,58 @@
+from abc import ABC, abstractmethod
+
+# Values per 'in' filter (Firestore's limit) and documents per get_all() call
+IN_QUERY_LIMIT = 30
+GET_ALL_CHUNK_SIZE = 100
+
+class Increment:
+    """Backend-neutral numeric increment, as returned by StorageBackend.increment()"""
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __repr__(self):
+        return f'Increment({self.value})'
+
+class StorageBackend(ABC):
+    """Document store behind the models.
+
+    The interface is the part of the Firestore client API the models use:
+    collection(name) returns a collection that supports document(id),
+    add(data) and where/order_by/limit/start_after/select/stream queries;
+    documents support get/set(merge)/create/update/delete; batch() groups
+    writes into one atomic commit. Snapshots expose id, exists, reference
+    and to_dict(). create() raises AlreadyExists and update() raises NotFound
+    from google.api_core.exceptions, whatever the backend.
+    """
+
+    name = None
+
+    @abstractmethod
+    def collection(self, name):
+        """Reference to a collection of documents"""
+
+    @abstractmethod
+    def batch(self):
+        """New write batch, committed atomically with commit()"""
+
+    @abstractmethod
+    def get_all(self, references, field_paths=None, **kwargs):
+        """Yield snapshots for many document references in one round trip"""
+
+    @abstractmethod
+    def run_transaction(self, func, max_attempts=5):
+        """Call func(transaction) atomically and return its result.
+
+        Reads go through ref.get(transaction=transaction) or
+        query.stream(transaction=transaction); writes are queued with
+        transaction.set/create/update/delete and applied only if func returns.
+        func may be retried on contention, so it must not have side effects.
+        """
+
+    @abstractmethod
+    def increment(self, value):
+        """Sentinel that adds value to a numeric field in set(merge=True)/update()"""
+
+    def close(self):
+        """Release resources held for the current thread"""
@@ -0,0 +1,33 @@
+from app.storage.base import StorageBackend
+
+class FirestoreBackend(StorageBackend):
+    """StorageBackend over a google.cloud.firestore Client.
+
+    The models already speak the Firestore API, so this mostly hands calls to
+    the client; anything not listed here is looked up on the client itself.
+    """
+
+    name = 'firestore'
+
+    def __init__(self, client):
+        self.client = client
+
+    def collection(self, name):
+        return self.client.collection(name)
+
+    def batch(self):
+        return self.client.batch()
+
+    def get_all(self, references, field_paths=None, **kwargs):
+        return self.client.get_all(references, field_paths=field_paths, **kwargs)
+
+    def run_transaction(self, func, max_attempts=5):
+        from google.cloud.firestore import transactional
+        return transactional(func)(self.client.transaction(max_attempts=max_attempts))
+
+    def increment(self, value):
+        from google.cloud.firestore import Increment
+        return Increment(value)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
@@ -0,0 +1,484 @@
+from google.api_core.exceptions import AlreadyExists, NotFound
+from app.storage.base import StorageBackend, Increment
+from datetime import datetime, date, timezone
+import threading
+import sqlite3
+import random
+import string
+import json
+import os
+import re
+
+# Embedded document store with the same surface as the Firestore client.
+#
+# Each collection is a table of (id TEXT PRIMARY KEY, data TEXT) rows holding
+# the document as JSON. Queries filter and sort on json_extract() expressions,
+# and the fields the models query on have matching expression indexes, so
+# lookups by email or by (user_id, day_key) are index seeks. The database runs
+# in WAL mode: readers never block the single writer. Every thread (and every
+# forked process) gets its own connection.
+
+# Expression indexes per collection, one tuple of fields per index
+INDEXES = {
+    'users': [('email',)],
+    'timesheets': [('user_id', 'day_key'), ('day_key',)],
+    'time_entries': [('user_email', 'timestamp'), ('timestamp',)],
+    'timesheet_rollups': [('user_id', 'period_type', 'start_day_key')],
+}
+
+# Datetimes are stored as tagged fixed-width strings so they compare in order
+_TAG = '\u0001'
+_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+_NAME_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+_FIELD_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*$')
+_ID_CHARS = string.ascii_letters + string.digits
+_OPERATORS = {'==': '=', '!=': '!=', '<': '<', '<=': '<=', '>': '>', '>=': '>='}
+
+def _encode_value(value):
+    """JSON fallback for datetime/date values"""
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return f'{_TAG}T{value.strftime(_DATETIME_FORMAT)}'
+    if isinstance(value, date):
+        return f'{_TAG}D{value.isoformat()}'
+    raise TypeError(f'Unsupported value type: {type(value).__name__}')
+
+def _dumps(data):
+    return json.dumps(data, default=_encode_value, ensure_ascii=False, separators=(',', ':'))
+
+def _decode(value):
+    if isinstance(value, str):
+        if value[:1] == _TAG:
+            if value[1] == 'T':
+                return datetime.fromisoformat(value[2:])
+            if value[1] == 'D':
+                return date.fromisoformat(value[2:])
+        return value
+    if isinstance(value, dict):
+        return {key: _decode(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
+
+def _loads(text):
+    return {key: _decode(value) for key, value in json.loads(text).items()}
+
+def _param(value):
+    """SQL parameter for a query value, encoded the way documents are stored"""
+    if isinstance(value, (datetime, date)):
+        return _encode_value(value)
+    return value
+
+def _quote_name(name):
+    if not _NAME_RE.match(name):
+        raise ValueError(f'Invalid collection name: {name}')
+    return f'"{name}"'
+
+def _field_expr(field_path):
+    if field_path == '__name__':
+        return 'id'
+    if not _FIELD_RE.match(field_path):
+        raise ValueError(f'Invalid field path: {field_path}')
+    return f"json_extract(data, '$.{field_path}')"
+
+def _new_id():
+    return ''.join(random.choices(_ID_CHARS, k=20))
+
+def _merge(target, changes):
+    """Apply set(merge=True) changes: nested maps merge, increments add"""
+    for key, value in changes.items():
+        current = target.get(key)
+        if isinstance(value, Increment):
+            target[key] = (current if isinstance(current, (int, float)) else 0) + value.value
+        elif isinstance(value, dict) and isinstance(current, dict):
+            _merge(current, value)
+        else:
+            target[key] = _resolve(value)
+    return target
+
+def _resolve(value):
+    """Replace increments in a fresh value by their amount"""
+    if isinstance(value, Increment):
+        return value.value
+    if isinstance(value, dict):
+        return {key: _resolve(item) for key, item in value.items()}
+    return value
+
+def _get_path(data, field_path):
+    for part in field_path.split('.'):
+        data = data[part]
+    return data
+
+class SQLiteSnapshot:
+    __slots__ = ('reference', 'id', '_data')
+
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+    def get(self, field_path):
+        return _get_path(self._data or {}, field_path)
+
+class SQLiteDocumentReference:
+    def __init__(self, backend, collection, doc_id):
+        self._backend = backend
+        self._collection = collection
+        self.id = doc_id
+        self.path = f'{collection}/{doc_id}'
+
+    @property
+    def parent(self):
+        return SQLiteCollection(self._backend, self._collection)
+
+    def get(self, field_paths=None, transaction=None, **kwargs):
+        return next(iter(self._backend.get_all([self], field_paths=field_paths)))
+
+    def set(self, document_data, merge=False, **kwargs):
+        self._backend._commit([('set', self, document_data, merge)])
+
+    def create(self, document_data, **kwargs):
+        self._backend._commit([('create', self, document_data, False)])
+
+    def update(self, field_updates, **kwargs):
+        self._backend._commit([('update', self, field_updates, False)])
+
+    def delete(self, **kwargs):
+        self._backend._commit([('delete', self, None, False)])
+
+    def __eq__(self, other):
+        return isinstance(other, SQLiteDocumentReference) and self.path == other.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+class SQLiteQuery:
+    def __init__(self, backend, collection, filters=(), orders=(), limit=None, cursor=None,
+                 fields=None):
+        self._backend = backend
+        self._collection = collection
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._cursor = cursor
+        self._fields = fields
+
+    def _copy(self, **changes):
+        state = {
+            'filters': self._filters,
+            'orders': self._orders,
+            'limit': self._limit,
+            'cursor': self._cursor,
+            'fields': self._fields,
+        }
+        state.update(changes)
+        return SQLiteQuery(self._backend, self._collection, **state)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        if op_string not in _OPERATORS and op_string != 'in':
+            raise ValueError(f'Unsupported operator: {op_string}')
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction='ASCENDING'):
+        descending = str(direction).upper() == 'DESCENDING'
+        return self._copy(orders=self._orders + ((field_path, descending),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(cursor=document_fields_or_snapshot)
+
+    def select(self, field_paths):
+        return self._copy(fields=list(field_paths))
+
+    def _cursor_clause(self, orders, params):
+        """Keyset condition for start_after(), mirroring Firestore cursor semantics"""
+        cursor = self._cursor
+        if isinstance(cursor, SQLiteSnapshot):
+            values = [cursor.id if field == '__name__' else _get_path(cursor._data, field)
+                      for field, _ in orders]
+        else:
+            values = [cursor[field] for field, _ in orders if field in cursor]
+            orders = orders[:len(values)]
+
+        clauses = []
+        for position, (field, descending) in enumerate(orders):
+            parts = []
+            for previous, _ in orders[:position]:
+                parts.append(f'{_field_expr(previous)} = ?')
+            parts.append(f"{_field_expr(field)} {'<' if descending else '>'} ?")
+            clauses.append('(' + ' AND '.join(parts) + ')')
+            params.extend(_param(value) for value in values[:position + 1])
+        return '(' + ' OR '.join(clauses) + ')'
+
+    def _sql(self):
+        conditions = []
+        params = []
+        for field, op, value in self._filters:
+            expr = _field_expr(field)
+            if op == 'in':
+                values = list(value)
+                if not values:
+                    conditions.append('0')
+                    continue
+                conditions.append(f"{expr} IN ({', '.join('?' * len(values))})")
+                params.extend(_param(item) for item in values)
+            elif value is None and op in ('==', '!='):
+                conditions.append(f"{expr} IS {'NOT ' if op == '!=' else ''}NULL")
+            else:
+                conditions.append(f'{expr} {_OPERATORS[op]} ?')
+                params.append(_param(value))
+
+        # Like Firestore: sorting on a field skips documents without it, and
+        # the document ID breaks ties in the direction of the last sort
+        orders = list(self._orders)
+        for field, _ in orders:
+            if field != '__name__':
+                conditions.append(f"json_type(data, '$.{field}') IS NOT NULL")
+        if not any(field == '__name__' for field, _ in orders):
+            orders.append(('__name__', orders[-1][1] if orders else False))
+
+        if self._cursor is not None:
+            conditions.append(self._cursor_clause(orders, params))
+
+        sql = f'SELECT id, data FROM {_quote_name(self._collection)}'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY ' + ', '.join(
+            f"{_field_expr(field)}{' DESC' if descending else ''}" for field, descending in orders
+        )
+        if self._limit is not None:
+            sql += f' LIMIT {int(self._limit)}'
+        return sql, params
+
+    def stream(self, transaction=None, **kwargs):
+        sql, params = self._sql()
+        conn = self._backend._connection(self._collection)
+        for doc_id, text in conn.execute(sql, params):
+            data = _loads(text)
+            if self._fields is not None:
+                data = {field: data[field] for field in self._fields if field in data}
+            yield SQLiteSnapshot(SQLiteDocumentReference(self._backend, self._collection, doc_id), data)
+
+    def get(self, transaction=None, **kwargs):
+        return list(self.stream())
+
+class SQLiteCollection(SQLiteQuery):
+    def __init__(self, backend, name):
+        super().__init__(backend, name)
+        self.id = name
+
+    def document(self, document_id=None):
+        return SQLiteDocumentReference(self._backend, self._collection, document_id or _new_id())
+
+    def add(self, document_data, document_id=None, **kwargs):
+        reference = self.document(document_id)
+        reference.create(document_data)
+        return datetime.utcnow(), reference
+
+class SQLiteWriteBatch:
+    def __init__(self, backend):
+        self._backend = backend
+        self._writes = []
+
+    def set(self, reference, document_data, merge=False):
+        self._writes.append(('set', reference, document_data, merge))
+        return self
+
+    def create(self, reference, document_data):
+        self._writes.append(('create', reference, document_data, False))
+        return self
+
+    def update(self, reference, field_updates):
+        self._writes.append(('update', reference, field_updates, False))
+        return self
+
+    def delete(self, reference):
+        self._writes.append(('delete', reference, None, False))
+        return self
+
+    def commit(self, **kwargs):
+        writes, self._writes = self._writes, []
+        return self._backend._commit(writes)
+
+    def __len__(self):
+        return len(self._writes)
+
+class SQLiteTransaction(SQLiteWriteBatch):
+    """Writes queued by a run_transaction() callback"""
+
+    def commit(self, **kwargs):
+        raise RuntimeError('Transactions are committed by run_transaction()')
+
+class SQLiteBackend(StorageBackend):
+    """StorageBackend on an embedded SQLite database file (WAL mode)"""
+
+    name = 'sqlite'
+
+    def __init__(self, path, busy_timeout_ms=5000):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._tables = set()
+
+    def _connect(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Autocommit mode; write transactions are opened explicitly in _commit()
+        conn = sqlite3.connect(self.path, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+        return conn
+
+    def _connection(self, collection=None):
+        """This thread's connection, with the collection's table created if needed"""
+        local = self._local
+        pid = os.getpid()
+        if getattr(local, 'pid', None) != pid:
+            # New thread, or a forked child: never reuse the parent's connection
+            local.conn = self._connect()
+            local.pid = pid
+        if collection is not None and collection not in self._tables:
+            self._create_table(local.conn, collection)
+        return local.conn
+
+    def _create_table(self, conn, collection):
+        table = _quote_name(collection)
+        with self._lock:
+            conn.execute(f'CREATE TABLE IF NOT EXISTS {table} (id TEXT PRIMARY KEY, data TEXT NOT NULL)')
+            for fields in INDEXES.get(collection, []):
+                index = _quote_name(f"idx_{collection}_{'_'.join(fields)}")
+                columns = ', '.join(_field_expr(field) for field in fields)
+                conn.execute(f'CREATE INDEX IF NOT EXISTS {index} ON {table} ({columns})')
+            if not conn.in_transaction:
+                # Inside a transaction the CREATE could still be rolled back
+                self._tables.add(collection)
+
+    def collection(self, name):
+        return SQLiteCollection(self, name)
+
+    def batch(self):
+        return SQLiteWriteBatch(self)
+
+    def increment(self, value):
+        return Increment(value)
+
+    def run_transaction(self, func, max_attempts=5):
+        # BEGIN IMMEDIATE takes the write lock up front, so reads made by func on
+        # this connection cannot be invalidated and there is nothing to retry
+        conn = self._connection()
+        transaction = SQLiteTransaction(self)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            result = func(transaction)
+            for kind, reference, data, merge in transaction._writes:
+                self._connection(reference._collection)
+                self._apply(conn, kind, reference, data, merge)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return result
+
+    def get_all(self, references, field_paths=None, **kwargs):
+        references = list(references)
+        found = {}
+        by_collection = {}
+        for reference in references:
+            by_collection.setdefault(reference._collection, []).append(reference.id)
+
+        for collection, ids in by_collection.items():
+            conn = self._connection(collection)
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT id, data FROM {_quote_name(collection)} WHERE id IN ({', '.join('?' * len(chunk))})",
+                    chunk
+                )
+                for doc_id, text in rows:
+                    found[(collection, doc_id)] = text
+
+        for reference in references:
+            text = found.get((reference._collection, reference.id))
+            data = _loads(text) if text is not None else None
+            if data is not None and field_paths is not None:
+                data = {field: data[field] for field in field_paths if field in data}
+            yield SQLiteSnapshot(reference, data)
+
+    def _commit(self, writes):
+        """Apply (kind, reference, data, merge) writes in one transaction"""
+        if not writes:
+            return []
+        for collection in {reference._collection for _, reference, _, _ in writes}:
+            self._connection(collection)
+        conn = self._connection()
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for kind, reference, data, merge in writes:
+                self._apply(conn, kind, reference, data, merge)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return [None] * len(writes)
+
+    def _apply(self, conn, kind, reference, data, merge):
+        table = _quote_name(reference._collection)
+        if kind == 'delete':
+            conn.execute(f'DELETE FROM {table} WHERE id = ?', (reference.id,))
+            return
+
+        row = None
+        if kind != 'set' or merge:
+            row = conn.execute(f'SELECT data FROM {table} WHERE id = ?', (reference.id,)).fetchone()
+
+        if kind == 'create':
+            if row is not None:
+                raise AlreadyExists(f'Document already exists: {reference.path}')
+            document = _resolve(data)
+        elif kind == 'update':
+            if row is None:
+                raise NotFound(f'No document to update: {reference.path}')
+            document = _loads(row[0])
+            for field_path, value in data.items():
+                *parents, leaf = field_path.split('.')
+                target = document
+                for part in parents:
+                    target = target.setdefault(part, {})
+                # update() replaces maps instead of merging them
+                if isinstance(value, Increment):
+                    _merge(target, {leaf: value})
+                else:
+                    target[leaf] = _resolve(value)
+        elif merge:
+            document = _merge(_loads(row[0]) if row is not None else {}, data)
+        else:
+            document = _resolve(data)
+
+        conn.execute(
+            f'INSERT INTO {table} (id, data) VALUES (?, ?) '
+            f'ON CONFLICT(id) DO UPDATE SET data = excluded.data',
+            (reference.id, _dumps(document))
+        )
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            conn.close()
+        self._local.__dict__.clear()
@@ -1,5 +1,6 @@
 from werkzeug.utils import secure_filename
 from app.services.dropbox_service import dropbox_service
+from app.services.upload_queue import photo_upload_queue
 import os
 
 def allowed_file(filename):
@@ -23,11 +24,36 @@ def upload_user_photo(file, user_email):
     download_url = dropbox_service.upload_user_photo(file_content, user_email, filename)
     return download_url
 
+def queue_user_photo(file, user_email, previous_url=None, save=None):
+    """Queue a profile photo for background upload; returns the pending placeholder.
+
+    save is called with the placeholder and must store it on the user before
+    the upload starts (see PhotoUploadQueue.enqueue).
+    """
+    if not file or file.filename == '':
+        return None
+    
+    if not allowed_file(file.filename):
+        return None
+    
+    filename = secure_filename(file.filename)
+    file_content = file.read()
+    
+    return photo_upload_queue.enqueue(file_content, user_email, filename, previous_url, save)
+
 def upload_report_file(file_content, filename):
     """Upload report file to Dropbox"""
     download_url = dropbox_service.upload_report(file_content, filename)
     return download_url
 
+def open_report_upload(filename):
+    """Start a streamed report upload to Dropbox (None in mock mode)"""
+    return dropbox_service.open_report_stream(filename)
+
+def finish_report_upload(stream):
+    """Commit a streamed report upload and return its download URL"""
+    return dropbox_service.finish_upload_stream(stream)
+
 def delete_user_photo(file_url):
     """Delete user photo from Dropbox"""
     # Extract file path from URL if needed
@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import datetime, date
 import bcrypt
 
 def hash_password(password: str) -> str:
@@ -28,4 +28,24 @@ def is_overtime(hours_worked: float, user_type: str) -> float:
     else:
         return 0.0
     
-    return max(0.0, hours_worked - standard_hours)
\ No newline at end of file
+    return max(0.0, hours_worked - standard_hours)
+
+def as_date(value):
+    """Normalizes a Firestore timestamp or datetime to a date (None stays None)."""
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+def to_day_key(value) -> int:
+    """Converts a date (or datetime) to its integer YYYYMMDD day key."""
+    value = as_date(value)
+    return value.year * 10000 + value.month * 100 + value.day
+
+def from_day_key(key: int) -> date:
+    """Converts a YYYYMMDD day key back to a date."""
+    return date(key // 10000, key // 100 % 100, key % 100)
+
+def chunked(values, size):
+    """Splits a sequence into lists of at most size items."""
+    values = list(values)
+    return [values[i:i + size] for i in range(0, len(values), size)]
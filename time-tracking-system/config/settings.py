@@ -1,6 +1,8 @@
 import os
 from datetime import timedelta
 
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
     
@@ -14,10 +16,48 @@ class Config:
     FIREBASE_TOKEN_URI = "https://oauth2.googleapis.com/token"
     FIREBASE_CLIENT_CERT_URL = os.environ.get('FIREBASE_CLIENT_CERT_URL') or ''
     
+    # Firestore Client Configuration
+    FIRESTORE_SHARE_CHANNEL = os.environ.get('FIRESTORE_SHARE_CHANNEL', 'true').lower() in ('1', 'true', 'yes')  # one client/channel per process
+    FIRESTORE_KEEPALIVE_MS = int(os.environ.get('FIRESTORE_KEEPALIVE_MS', 30000))  # 0 disables keepalive pings
+    FIRESTORE_DEADLINE = float(os.environ['FIRESTORE_DEADLINE']) if os.environ.get('FIRESTORE_DEADLINE') else 10.0  # seconds per call
+    FIRESTORE_PAGE_SIZE = int(os.environ.get('FIRESTORE_PAGE_SIZE', 500))  # documents per page when streaming large queries
+    
+    # Storage Backend Configuration
+    # 'firestore' (default) or 'sqlite' for an embedded database file (WAL mode)
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'firestore').lower()
+    SQLITE_PATH = os.environ.get('SQLITE_PATH') or os.path.join(BASE_DIR, 'instance', 'skponto.sqlite3')
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))  # wait for the writer lock
+    
+    # Bulk Write Configuration
+    # Batched writes of up to 500 operations, committed in parallel and ramped
+    # up from BULK_WRITE_INITIAL_RATE ops/s by 50% every 5 minutes (0 = no limit)
+    BULK_WRITE_WORKERS = int(os.environ.get('BULK_WRITE_WORKERS', 4))
+    BULK_WRITE_INITIAL_RATE = int(os.environ.get('BULK_WRITE_INITIAL_RATE', 500))
+    BULK_WRITE_MAX_RATE = int(os.environ.get('BULK_WRITE_MAX_RATE', 10000))
+    
     # Dropbox Configuration
     DROPBOX_ACCESS_TOKEN = os.environ.get('DROPBOX_ACCESS_TOKEN')
     DROPBOX_APP_KEY = os.environ.get('DROPBOX_APP_KEY')
     DROPBOX_APP_SECRET = os.environ.get('DROPBOX_APP_SECRET')
+    DROPBOX_UPLOAD_SESSION_THRESHOLD = int(os.environ.get('DROPBOX_UPLOAD_SESSION_THRESHOLD', 16 * 1024 * 1024))  # bytes; larger files use upload sessions
+    DROPBOX_UPLOAD_CHUNK_SIZE = int(os.environ.get('DROPBOX_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))  # bytes per session chunk (max 150 MB)
+    DROPBOX_UPLOAD_RETRIES = int(os.environ.get('DROPBOX_UPLOAD_RETRIES', 3))  # retries per chunk
+    DROPBOX_UPLOAD_RETRY_SECONDS = float(os.environ.get('DROPBOX_UPLOAD_RETRY_SECONDS', 10))  # most time one upload may wait between retries
+    
+    # Timesheet Storage Configuration
+    # Store timesheets under deterministic "<user_id>_<YYYY-MM-DD>" document IDs.
+    # Run `flask timesheets rekey` before enabling it on an existing database.
+    TIMESHEET_KEYED_IDS = os.environ.get('TIMESHEET_KEYED_IDS', 'false').lower() in ('1', 'true', 'yes')
+    
+    # User Cache Configuration
+    # Process-level TTL/LRU cache of user documents; 0 disables it. Lookups are
+    # always de-duplicated per request on flask.g regardless of this setting.
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 0))  # seconds
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 1024))
+    
+    # Report Export Configuration
+    EXPORT_ARCHIVE_TO_DROPBOX = os.environ.get('EXPORT_ARCHIVE_TO_DROPBOX', 'true').lower() in ('1', 'true', 'yes')
+    EXPORT_FLUSH_BYTES = int(os.environ.get('EXPORT_FLUSH_BYTES', 64 * 1024))  # CSV bytes per streamed chunk
     
     # Session Configuration
     PERMANENT_SESSION_LIFETIME = timedelta(hours=8)
@@ -26,12 +66,76 @@ class Config:
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'pdf', 'doc', 'docx'}
     
+    # Background Photo Upload Configuration
+    PHOTO_UPLOAD_QUEUE_DIR = os.environ.get('PHOTO_UPLOAD_QUEUE_DIR') or os.path.join(BASE_DIR, 'instance', 'photo_upload_queue')
+    PHOTO_UPLOAD_WORKERS = int(os.environ.get('PHOTO_UPLOAD_WORKERS', 2))
+    PHOTO_UPLOAD_MAX_ATTEMPTS = int(os.environ.get('PHOTO_UPLOAD_MAX_ATTEMPTS', 5))
+    
+    # Profile Photo Processing Configuration
+    PHOTO_SIZES = {'small': 64, 'medium': 256, 'large': 512}  # bounding box in pixels
+    PHOTO_DEFAULT_SIZE = 'medium'  # stored in profile_picture for existing templates
+    PHOTO_FORMAT = os.environ.get('PHOTO_FORMAT', 'WEBP')
+    PHOTO_QUALITY = int(os.environ.get('PHOTO_QUALITY', 80))
+    IMAGE_PROCESS_WORKERS = int(os.environ.get('IMAGE_PROCESS_WORKERS', 2))
+    IMAGE_PROCESS_TIMEOUT = int(os.environ.get('IMAGE_PROCESS_TIMEOUT', 30))  # seconds per photo
+    
+    # Admin Listing Configuration
+    ADMIN_PAGE_SIZE = int(os.environ.get('ADMIN_PAGE_SIZE', 50))  # users per page in admin views
+    
+    # Offline Punch Sync Configuration
+    # Punches queued in the browser are posted in batches to /dashboard/clock/sync
+    PUNCH_SYNC_MAX_BATCH = int(os.environ.get('PUNCH_SYNC_MAX_BATCH', 100))  # punches per request
+    PUNCH_MAX_CLOCK_SKEW = int(os.environ.get('PUNCH_MAX_CLOCK_SKEW', 300))  # seconds; punches this close use server time
+    PUNCH_MAX_AGE_HOURS = int(os.environ.get('PUNCH_MAX_AGE_HOURS', 12))  # oldest offline punch accepted (flagged for review)
+    
+    # Password Hashing Configuration
+    # bcrypt runs in a pool of worker processes (0 = in the request process).
+    # Logins beyond the busy workers wait in a queue of PASSWORD_HASH_QUEUE_DEPTH
+    # and are turned away with a 503 once it is full.
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 2))
+    PASSWORD_HASH_QUEUE_DEPTH = int(os.environ.get('PASSWORD_HASH_QUEUE_DEPTH', 16))
+    PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 5))  # seconds a login waits for its check
+    # Bulk jobs (user import) never have more than this many hashes in the pool,
+    # so the other workers stay free for logins
+    PASSWORD_HASH_BULK_WORKERS = int(os.environ.get('PASSWORD_HASH_BULK_WORKERS', max(1, PASSWORD_HASH_WORKERS // 2)))
+    # bcrypt cost: BCRYPT_ROUNDS, or calibrated at startup to the highest cost
+    # that hashes within BCRYPT_TARGET_MS, never below BCRYPT_MIN_ROUNDS
+    BCRYPT_ROUNDS = int(os.environ['BCRYPT_ROUNDS']) if os.environ.get('BCRYPT_ROUNDS') else None
+    BCRYPT_TARGET_MS = int(os.environ.get('BCRYPT_TARGET_MS', 250))
+    BCRYPT_MIN_ROUNDS = int(os.environ.get('BCRYPT_MIN_ROUNDS', 10))
+    
+    # Terminal Ingestion Configuration
+    # Time clocks post punch logs to /api/punches with "Authorization: Bearer <token>";
+    # TERMINAL_API_TOKENS lists the terminals as terminal_id:token pairs, comma-separated
+    TERMINAL_API_TOKENS = os.environ.get('TERMINAL_API_TOKENS', '')
+    INGEST_CHUNK_SIZE = int(os.environ.get('INGEST_CHUNK_SIZE', 2000))  # records read and written together
+    INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', 8))  # days written in parallel, one transaction each
+    
+    # Admission Control Configuration
+    # Per-worker limits on concurrent dashboard requests. Punches go ahead of
+    # page renders; a request that cannot start within ADMISSION_MAX_WAIT_MS
+    # gets a 503 with Retry-After. Every admitted or queued request holds a
+    # gunicorn thread, so GUNICORN_THREADS defaults to ADMISSION_MAX_ACTIVE +
+    # ADMISSION_QUEUE_SIZE (see gunicorn.conf.py)
+    ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    ADMISSION_MAX_ACTIVE = int(os.environ.get('ADMISSION_MAX_ACTIVE', 4))  # all route classes together
+    ADMISSION_PUNCH_LIMIT = int(os.environ.get('ADMISSION_PUNCH_LIMIT', 4))
+    ADMISSION_PAGE_LIMIT = int(os.environ.get('ADMISSION_PAGE_LIMIT', 2))  # keeps room for punches
+    ADMISSION_QUEUE_SIZE = int(os.environ.get('ADMISSION_QUEUE_SIZE', 16))
+    ADMISSION_MAX_WAIT_MS = int(os.environ.get('ADMISSION_MAX_WAIT_MS', 500))
+    ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', 2))  # seconds
+    
     # Work Hours Configuration
     ADMIN_WORK_HOURS = 8
     WORKER_WORK_HOURS = 8
     INTERN_WORK_HOURS = 6
     LUNCH_BREAK = 1
     
+    # Startup Configuration
+    # Services connect on first use. With WARMUP_ON_BOOT each gunicorn worker
+    # opens its Firestore channel and Dropbox session right after it boots instead.
+    WARMUP_ON_BOOT = os.environ.get('WARMUP_ON_BOOT', 'false').lower() in ('1', 'true', 'yes')
+    
     # Production Settings
     TESTING = False
     DEBUG = False if os.environ.get('RENDER') else True
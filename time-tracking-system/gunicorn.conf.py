@@ -0,0 +1,37 @@
+# Gunicorn settings, read automatically from the working directory (see Procfile)
+import os
+
+def _admission_threads():
+    """Threads the admission controller can keep busy: the admitted requests plus the queued ones.
+
+    Read straight from the environment (same defaults as config/settings.py):
+    importing Config here would freeze it before the app loads its .env.
+    """
+    if os.environ.get('ADMISSION_ENABLED', 'true').lower() not in ('1', 'true', 'yes'):
+        return 4
+    return int(os.environ.get('ADMISSION_MAX_ACTIVE', 4)) + int(os.environ.get('ADMISSION_QUEUE_SIZE', 16))
+
+# Threads per worker (gthread): a request waiting on the bcrypt pool or on
+# Firestore no longer holds up every other request of the worker. Admitted
+# and queued requests each hold a thread, so with fewer threads than
+# ADMISSION_MAX_ACTIVE + ADMISSION_QUEUE_SIZE the extra requests would wait in
+# gunicorn's backlog instead, where they are neither prioritized nor shed.
+threads = int(os.environ.get('GUNICORN_THREADS') or _admission_threads())
+
+def post_worker_init(worker):
+    """Optionally warm up service connections once a worker has loaded the app"""
+    # Imported here: the app (and its .env) is loaded by the time this runs
+    from config.settings import Config
+    from app.services.password_hashing import current_rounds
+
+    # Measure the bcrypt cost at boot rather than on the first login
+    current_rounds()
+
+    needed = Config.ADMISSION_MAX_ACTIVE + Config.ADMISSION_QUEUE_SIZE
+    if Config.ADMISSION_ENABLED and worker.cfg.threads < needed:
+        print(f"Warning: {worker.cfg.threads} gunicorn threads for {needed} admission slots "
+              f"(ADMISSION_MAX_ACTIVE + ADMISSION_QUEUE_SIZE); the admission queue cannot fill up")
+
+    if Config.WARMUP_ON_BOOT:
+        from app.services.warmup import warm_up
+        warm_up()
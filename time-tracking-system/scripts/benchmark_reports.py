@@ -0,0 +1,127 @@
+"""Benchmark the admin/dashboard report code paths on synthetic data.
+
+Compares the per-entry Python loop (grouping into dicts + DailyReport), the
+single-pass DailyReport.group_entries() and the columnar DailyTable engine,
+then the per-timesheet calculate_overtime() loop against DailyTable.
+
+Usage: python scripts/benchmark_reports.py [--users 300] [--days 90] [--repeat 3]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.models.timesheet import Timesheet, TimeEntry, DailyReport
+from app.services.report_engine import DailyTable
+
+def make_entries(users, days, seed=42):
+    """Four punches per user and working day, in timestamp order like the queries return"""
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    entries = []
+    for day in range(days):
+        base = start + timedelta(days=day)
+        for user in range(users):
+            email = f'user{user}@example.com'
+            entry = base + timedelta(minutes=rng.randint(420, 600))
+            lunch_start = entry + timedelta(minutes=rng.randint(180, 300))
+            lunch_end = lunch_start + timedelta(minutes=rng.randint(30, 90))
+            exit_ = lunch_end + timedelta(minutes=rng.randint(180, 360))
+            for entry_type, stamp in (('entry', entry), ('lunch_start', lunch_start),
+                                      ('lunch_end', lunch_end), ('exit', exit_)):
+                entries.append(TimeEntry(email, entry_type, stamp))
+    entries.sort(key=lambda e: e.timestamp)
+    return entries
+
+def make_timesheets(entries):
+    timesheets = {}
+    for e in entries:
+        ts = timesheets.get((e.user_email, e.timestamp.date()))
+        if ts is None:
+            ts = timesheets[(e.user_email, e.timestamp.date())] = Timesheet(
+                user_id=e.user_email, date=e.timestamp.date())
+        setattr(ts, 'exit_time' if e.entry_type == 'exit' else e.entry_type if e.entry_type != 'entry'
+                else 'entry_time', e.timestamp.time().replace(second=0, microsecond=0))
+    for ts in timesheets.values():
+        ts.calculate_total_hours()
+    return list(timesheets.values())
+
+def loop_reports(entries):
+    """The admin.reports code before the report engine"""
+    user_reports = {}
+    for entry in entries:
+        if entry.user_email not in user_reports:
+            user_reports[entry.user_email] = {}
+        entry_date = entry.timestamp.date()
+        if entry_date not in user_reports[entry.user_email]:
+            user_reports[entry.user_email][entry_date] = []
+        user_reports[entry.user_email][entry_date].append(entry)
+    processed = {}
+    for user_email, date_entries in user_reports.items():
+        processed[user_email] = {}
+        for day, daily_entries in date_entries.items():
+            processed[user_email][day] = DailyReport(user_email, day, daily_entries)
+    totals = {email: sum(r.total_hours for r in days.values()) for email, days in processed.items()}
+    overtime = {email: sum(r.calculate_overtime() for r in days.values()) for email, days in processed.items()}
+    return totals, overtime
+
+def grouped_reports(entries):
+    processed = DailyReport.group_entries(entries)
+    totals = {email: sum(r.total_hours for r in days.values()) for email, days in processed.items()}
+    overtime = {email: sum(r.calculate_overtime() for r in days.values()) for email, days in processed.items()}
+    return totals, overtime
+
+def engine_reports(entries):
+    totals = DailyTable.from_entries(entries).user_totals()
+    return ({email: t['total_hours'] for email, t in totals.items()},
+            {email: t['overtime_hours'] for email, t in totals.items()})
+
+def loop_overtime(timesheets):
+    return sum(ts.calculate_overtime() for ts in timesheets if ts.total_hours)
+
+def engine_overtime(timesheets):
+    return float(DailyTable.from_timesheets(timesheets).overtime_minutes().sum()) / 60
+
+def best_of(repeat, func, *args):
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=300)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    entries = make_entries(args.users, args.days)
+    timesheets = make_timesheets(entries)
+    print(f"{args.users} users x {args.days} days: {len(entries)} punches, {len(timesheets)} timesheets")
+
+    baseline, (loop_totals, _) = best_of(args.repeat, loop_reports, entries)
+    print(f"  admin reports   {'loop + DailyReport':<28} {baseline * 1000:9.1f} ms")
+    for name, func in (('DailyReport.group_entries', grouped_reports),
+                       ('DailyTable.from_entries', engine_reports)):
+        elapsed, (totals, _) = best_of(args.repeat, func, entries)
+        # Punches carry seconds; the engine counts whole minutes
+        drift = max(abs(totals[k] - loop_totals[k]) for k in loop_totals)
+        print(f"  admin reports   {name:<28} {elapsed * 1000:9.1f} ms  x{baseline / elapsed:5.1f}  "
+              f"max drift {drift * 60:.1f} min/user")
+
+    baseline, loop_total = best_of(args.repeat, loop_overtime, timesheets)
+    elapsed, engine_total = best_of(args.repeat, engine_overtime, timesheets)
+    print(f"  overtime        {'calculate_overtime loop':<28} {baseline * 1000:9.1f} ms")
+    print(f"  overtime        {'DailyTable.from_timesheets':<28} {elapsed * 1000:9.1f} ms  "
+          f"x{baseline / elapsed:5.1f}  total {engine_total:.1f}h vs {loop_total:.1f}h")
+
+if __name__ == '__main__':
+    main()
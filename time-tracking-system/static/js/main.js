@@ -51,26 +51,226 @@ function handleRegistration(event) {
     .catch(error => console.error('Error:', error));
 }
 
-// Function to handle clock in/out
-function clockInOut(action) {
-    fetch(`/clock-${action}`, {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json',
-        },
-    })
+// Offline punch queue
+//
+// Punches are stamped and signed on the device, stored in IndexedDB and sent
+// in batches to /dashboard/clock/sync, so a punch made without network is kept
+// and synced later. The server applies each punch_id at most once.
+const PUNCH_DB_NAME = 'skponto-punches';
+const PUNCH_STORE = 'punches';
+const PUNCH_KEY_STORAGE = 'skponto.punchKey';
+const PUNCH_SYNC_INTERVAL_MS = 30000;
+
+function openPunchDb() {
+    return new Promise((resolve, reject) => {
+        const request = indexedDB.open(PUNCH_DB_NAME, 1);
+        request.onupgradeneeded = () => {
+            request.result.createObjectStore(PUNCH_STORE, { keyPath: 'punch_id' });
+        };
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+    });
+}
+
+// Run callback(store) in a transaction; resolves with the request result, if any
+function withPunchStore(mode, callback) {
+    return openPunchDb().then(db => new Promise((resolve, reject) => {
+        const transaction = db.transaction(PUNCH_STORE, mode);
+        const request = callback(transaction.objectStore(PUNCH_STORE));
+        transaction.oncomplete = () => {
+            db.close();
+            resolve(request ? request.result : undefined);
+        };
+        transaction.onerror = () => {
+            db.close();
+            reject(transaction.error);
+        };
+    }));
+}
+
+function newPunchId() {
+    if (window.crypto.randomUUID) {
+        return window.crypto.randomUUID();
+    }
+    const bytes = window.crypto.getRandomValues(new Uint8Array(16));
+    return Array.from(bytes, b => b.toString(16).padStart(2, '0')).join('');
+}
+
+function hexToBytes(hex) {
+    const bytes = new Uint8Array(hex.length / 2);
+    for (let i = 0; i < bytes.length; i++) {
+        bytes[i] = parseInt(hex.substr(i * 2, 2), 16);
+    }
+    return bytes;
+}
+
+function loadPunchKey() {
+    try {
+        return JSON.parse(localStorage.getItem(PUNCH_KEY_STORAGE));
+    } catch (error) {
+        return null;
+    }
+}
+
+// Fetch (while online) the signing key used for punches made offline later
+function refreshPunchKey() {
+    return fetch('/dashboard/clock/key', { credentials: 'same-origin' })
     .then(response => response.json())
     .then(data => {
         if (data.success) {
-            alert(`Clock ${action} successful!`);
-            window.location.reload();
-        } else {
-            alert(data.message);
+            localStorage.setItem(PUNCH_KEY_STORAGE, JSON.stringify({
+                user: data.user,
+                key: data.key,
+                maxBatch: data.max_batch
+            }));
         }
+        return loadPunchKey();
     })
-    .catch(error => console.error('Error:', error));
+    .catch(() => loadPunchKey());
+}
+
+function signPunch(keyHex, punch) {
+    const message = `${punch.punch_id}|${punch.action}|${punch.stamped_at}`;
+    return window.crypto.subtle.importKey(
+        'raw', hexToBytes(keyHex), { name: 'HMAC', hash: 'SHA-256' }, false, ['sign']
+    )
+    .then(key => window.crypto.subtle.sign('HMAC', key, new TextEncoder().encode(message)))
+    .then(signature => Array.from(new Uint8Array(signature), b => b.toString(16).padStart(2, '0')).join(''));
+}
+
+function showPunchStatus(message) {
+    const status = document.getElementById('punch-status');
+    if (status) {
+        status.textContent = message;
+    } else {
+        console.log(message);
+    }
+}
+
+let punchSyncRunning = false;
+
+// Punches that could not be sent right away keep their device time on the
+// server (flagged for review); the others are recorded at the server's time
+function markPunchesOffline(punchIds) {
+    if (!punchIds.length) {
+        return Promise.resolve();
+    }
+    return withPunchStore('readwrite', store => {
+        punchIds.forEach(punchId => {
+            const request = store.get(punchId);
+            request.onsuccess = () => {
+                if (request.result && !request.result.offline) {
+                    request.result.offline = true;
+                    store.put(request.result);
+                }
+            };
+        });
+    });
+}
+
+// Send queued punches in batches; punches that failed with 'error' stay queued
+function syncPunches() {
+    const keyInfo = loadPunchKey();
+    if (punchSyncRunning || !navigator.onLine || !keyInfo) {
+        return Promise.resolve();
+    }
+    punchSyncRunning = true;
+    let batch = [];
+
+    return withPunchStore('readonly', store => store.getAll())
+    .then(queued => {
+        batch = queued
+            .filter(punch => punch.user === keyInfo.user)
+            .slice(0, keyInfo.maxBatch || 100);
+        if (!batch.length) {
+            return false;
+        }
+
+        return fetch('/dashboard/clock/sync', {
+            method: 'POST',
+            credentials: 'same-origin',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                punches: batch.map(({ punch_id, action, stamped_at, signature, offline }) =>
+                    ({ punch_id, action, stamped_at, signature, offline: Boolean(offline) }))
+            }),
+        })
+        .then(response => response.json())
+        .then(data => {
+            if (!data.success) {
+                throw new Error(data.message);
+            }
+            // Results come back in the order the punches were sent
+            const done = [];
+            const failed = [];
+            data.results.forEach((result, index) => {
+                (result.status === 'error' ? failed : done).push(batch[index].punch_id);
+                if (result.status !== 'error') {
+                    showPunchStatus(result.message);
+                }
+            });
+            return withPunchStore('readwrite', store => {
+                done.forEach(punchId => store.delete(punchId));
+            })
+            .then(() => markPunchesOffline(failed))
+            .then(() => done.length === batch.length && queued.length > batch.length);
+        });
+    })
+    .catch(error => {
+        console.error('Punch sync failed, will retry:', error);
+        return markPunchesOffline(batch.map(punch => punch.punch_id)).then(() => false, () => false);
+    })
+    .then(hasMore => {
+        punchSyncRunning = false;
+        if (hasMore) {
+            return syncPunches();
+        }
+    });
+}
+
+// Function to handle clock in/out: queue the punch, then try to send it
+function clockInOut(action) {
+    const stampedAt = Date.now();
+    const keyed = loadPunchKey() ? Promise.resolve(loadPunchKey()) : refreshPunchKey();
+
+    return keyed
+    .then(keyInfo => {
+        if (!keyInfo) {
+            throw new Error('Sem conexão para obter a chave de registro. Tente novamente.');
+        }
+        const punch = {
+            punch_id: newPunchId(),
+            user: keyInfo.user,
+            action: action,
+            stamped_at: stampedAt,
+            offline: !navigator.onLine,
+        };
+        return signPunch(keyInfo.key, punch).then(signature => {
+            punch.signature = signature;
+            return withPunchStore('readwrite', store => store.put(punch));
+        });
+    })
+    .then(() => {
+        showPunchStatus(navigator.onLine ? 'Enviando registro...' : 'Registro salvo. Será enviado quando houver conexão.');
+        return syncPunches();
+    })
+    .catch(error => alert(error.message));
+}
+
+if ('indexedDB' in window && document.getElementById('punch-status')) {
+    refreshPunchKey().then(syncPunches);
+    window.addEventListener('online', syncPunches);
+    setInterval(syncPunches, PUNCH_SYNC_INTERVAL_MS);
 }
 
 // Event listeners for login and registration forms
-document.getElementById('login-form').addEventListener('submit', handleLogin);
-document.getElementById('registration-form').addEventListener('submit', handleRegistration);
\ No newline at end of file
+const loginForm = document.getElementById('login-form');
+if (loginForm) {
+    loginForm.addEventListener('submit', handleLogin);
+}
+const registrationForm = document.getElementById('registration-form');
+if (registrationForm) {
+    registrationForm.addEventListener('submit', handleRegistration);
+}